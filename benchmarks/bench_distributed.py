@@ -0,0 +1,70 @@
+# benchmarks/bench_distributed.py
+"""
+Queue throughput versus number of worker processes. Jobs run a simulated
+email: `--work io` sleeps (LLM-bound emails), `--work cpu` spins (OCR/NER
+bound; only scales up to the number of cores).
+
+    python benchmarks/bench_distributed.py [--jobs 200] [--work-ms 50] [--workers 1 2 4 8]
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+from functools import partial
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from job_queue import SQLiteJobQueue
+from worker import run_worker_processes
+
+
+async def simulated_email(work, work_ms, file_path, email_id):
+    if work == "io":
+        await asyncio.sleep(work_ms / 1000)
+    else:
+        end = time.perf_counter() + work_ms / 1000
+        while time.perf_counter() < end:
+            pass
+    return {"email_id": email_id}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--work-ms", type=float, default=50)
+    parser.add_argument("--work", choices=["io", "cpu"], default="io")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{args.jobs} jobs, {args.work_ms} ms {args.work} work each, {os.cpu_count()} CPUs")
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.workers:
+            path = os.path.join(tmp, f"jobs_{n}.db")
+            queue = SQLiteJobQueue(path)
+            for i in range(args.jobs):
+                queue.enqueue(f"email_{i}", path=f"/inputs/email_{i}.eml")
+            queue.close()
+
+            start = time.perf_counter()
+            run_worker_processes(
+                "sqlite:///" + path, n,
+                handler=partial(simulated_email, args.work, args.work_ms),
+                poll_interval=0.01, exit_when_idle=True
+            )
+            elapsed = time.perf_counter() - start
+
+            queue = SQLiteJobQueue(path)
+            assert queue.stats()["done"] == args.jobs, queue.stats()
+            queue.close()
+
+            throughput = args.jobs / elapsed
+            baseline = baseline or throughput
+            print(f"  workers={n:>3}: {throughput:8.1f} emails/s  "
+                  f"speedup {throughput / baseline:5.2f}x  efficiency {throughput / baseline / n * 100:5.1f}%")
+
+
+if __name__ == "__main__":
+    main()
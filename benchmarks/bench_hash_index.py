@@ -0,0 +1,146 @@
+# benchmarks/bench_hash_index.py
+"""
+Lookup latency and resident memory of the dedup hash index at scale.
+
+Builds an index of --entries random hashes spread over --windows monthly
+windows, then, in a fresh process, opens it and times lookups for new
+hashes (Bloom filter rejects), known hashes (mmap binary search) and
+check_and_add of new hashes (delta log append).
+
+    python benchmarks/bench_hash_index.py [--entries 10000000] [--lookups 100000]
+"""
+
+import sys
+import os
+import time
+import json
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from hash_index import HashIndex
+
+MONTH = 30 * 86400
+
+
+def memory_mb():
+    """Current RSS split into anonymous memory and mapped file pages, in MB"""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return {k: int(fields[k].split()[0]) / 1024 for k in ("VmRSS", "RssAnon", "RssFile")}
+    except (OSError, KeyError):
+        return {"VmRSS": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def build(path, entries, windows, shards):
+    rng = np.random.default_rng(42)
+    index = HashIndex(path, shards=shards, window_seconds=MONTH, capacity=entries, merge_threshold=0)
+    now = time.time()
+    per_window = entries // windows
+    start = time.perf_counter()
+    for w in range(windows):
+        keys = np.frombuffer(rng.bytes(16 * per_window), dtype="S16")
+        index.add_many(keys, timestamp=now - w * MONTH)
+        if w == 0:
+            np.save(os.path.join(path, "sample.npy"), keys[:100_000].view(np.uint8).reshape(-1, 16))
+    index.close()
+    return {"build_seconds": time.perf_counter() - start, "entries": per_window * windows}
+
+
+def timed(fn, keys):
+    samples = np.empty(len(keys))
+    hits = 0
+    for i, key in enumerate(keys):
+        t = time.perf_counter_ns()
+        hits += bool(fn(key))
+        samples[i] = time.perf_counter_ns() - t
+    return {
+        "mean_us": samples.mean() / 1000,
+        "p99_us": np.percentile(samples, 99) / 1000,
+        "hits": hits
+    }
+
+
+def measure(path, lookups, shards):
+    before = memory_mb()
+    start = time.perf_counter()
+    index = HashIndex(path, shards=shards, window_seconds=MONTH, merge_threshold=0)
+    open_seconds = time.perf_counter() - start
+    opened = memory_mb()
+
+    rng = np.random.default_rng(7)
+    new_keys = [rng.bytes(16) for _ in range(lookups)]
+    known = np.load(os.path.join(path, "sample.npy"))[:lookups]
+    known_keys = [row.tobytes() for row in known]
+
+    result = {
+        "open_seconds": open_seconds,
+        "miss": timed(index.contains, new_keys),
+        "hit": timed(index.contains, known_keys),
+        "check_and_add_new": timed(index.check_and_add, [rng.bytes(16) for _ in range(lookups)]),
+        "stats": index.stats(),
+        "memory_before": before,
+        "memory_opened": opened,
+        "memory_after": memory_mb()
+    }
+    index.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=10_000_000)
+    parser.add_argument("--windows", type=int, default=24)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--phase", choices=["build", "measure"])
+    parser.add_argument("--path")
+    args = parser.parse_args()
+
+    if args.phase == "build":
+        print(json.dumps(build(args.path, args.entries, args.windows, args.shards)))
+        return
+    if args.phase == "measure":
+        print(json.dumps(measure(args.path, args.lookups, args.shards)))
+        return
+
+    path = tempfile.mkdtemp(prefix="hash_index_bench_")
+    try:
+        # Separate processes so the measurement starts from a cold, clean heap
+        def phase(name):
+            out = subprocess.run(
+                [sys.executable, __file__, "--phase", name, "--path", path,
+                 "--entries", str(args.entries), "--windows", str(args.windows),
+                 "--shards", str(args.shards), "--lookups", str(args.lookups)],
+                check=True, capture_output=True, text=True
+            ).stdout.strip().splitlines()
+            return json.loads(out[-1])
+
+        built = phase("build")
+        m = phase("measure")
+        stats = m["stats"]
+        print(f"Built {built['entries']:,} entries in {built['build_seconds']:.1f}s "
+              f"({stats['windows']} windows x {args.shards} shards, "
+              f"{stats['disk_bytes'] / 2**20:.0f} MB on disk)")
+        print(f"Open: {m['open_seconds'] * 1000:.0f} ms, Bloom filter {stats['bloom_bytes'] / 2**20:.1f} MB "
+              f"({stats['bloom_probes']} probes)")
+        for name in ("miss", "hit", "check_and_add_new"):
+            r = m[name]
+            print(f"{name:>18}: mean {r['mean_us']:6.2f} us  p99 {r['p99_us']:6.2f} us  "
+                  f"({r['hits']:,}/{args.lookups:,} found)")
+        print(f"Disk searches: {stats['disk_searches']:,}, Bloom rejects: {stats['bloom_rejects']:,}")
+        for label, key in (("before open", "memory_before"), ("after open", "memory_opened"),
+                           ("after lookups", "memory_after")):
+            mem = m[key]
+            print(f"RSS {label:>13}: " + ", ".join(f"{k} {v:.1f} MB" for k, v in mem.items()))
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
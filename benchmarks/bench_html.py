@@ -0,0 +1,80 @@
+# benchmarks/bench_html.py
+"""
+HTML body to text: BeautifulSoup(html.parser).get_text(), the previous
+path, versus html_to_text with lxml and with the stdlib fallback, on
+table-heavy synthetic agent-bank notices of growing size. Time per MB
+staying flat as the size grows shows the conversion is linear.
+
+    python benchmarks/bench_html.py [--sizes-mb 1 4 16] [--runs 3]
+"""
+
+import sys
+import os
+import time
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bs4 import BeautifulSoup
+import html_text
+from html_text import html_to_text
+
+ROW = (
+    '<tr><td style="padding:2px;font-family:Arial">Term Loan B-{i}</td>'
+    '<td align="right"><span style="color:#333">USD&nbsp;{amount:,}.00</span></td>'
+    '<td>26-Mar-2025</td><td><b>Repayment</b></td></tr>\n'
+)
+HEAD = (
+    "<html><head><style>td {{ font-size: 10pt }}</style><title>Notice</title></head><body>"
+    '<div style="display:none;mso-hide:all">Preheader text</div>'
+    "<p>Dear Lender,</p><p>Please find below the repayment schedule for facility {n}.</p>"
+    '<table border="1"><tr><th>Tranche</th><th>Amount</th><th>Date</th><th>Type</th></tr>\n'
+)
+
+
+def synthetic_html(size_mb):
+    parts, size, n = [], 0, 0
+    while not parts or size < size_mb * 2**20:
+        block = HEAD.format(n=n) + "".join(ROW.format(i=i, amount=1_000_000 + i) for i in range(200)) \
+            + "</table><p>Kind regards,<br>Agency Services</p></body></html>"
+        parts.append(block)
+        size += len(block)
+        n += 1
+    return "".join(parts)
+
+
+def timed(fn, html, runs):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(html)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    converters = {"bs4 html.parser": lambda h: BeautifulSoup(h, "html.parser").get_text()}
+    if html_text.etree is not None:
+        converters["html_to_text lxml"] = html_to_text
+    converters["html_to_text stdlib"] = lambda h: html_to_text(h, use_lxml=False)
+
+    for size_mb in args.sizes_mb:
+        html = synthetic_html(size_mb)
+        mb = len(html) / 2**20
+        baseline = None
+        for name, fn in converters.items():
+            seconds = timed(fn, html, args.runs)
+            baseline = baseline or seconds
+            print(f"{mb:5.1f} MB {name:>20}: {seconds * 1000:8.1f} ms "
+                  f"({seconds / mb * 1000:6.1f} ms/MB, {baseline / seconds:4.1f}x)")
+
+    sample = synthetic_html(0)
+    print("\nSample output:\n" + "\n".join(html_to_text(sample).splitlines()[:5]))
+
+
+if __name__ == "__main__":
+    main()
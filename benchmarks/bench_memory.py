@@ -0,0 +1,172 @@
+# benchmarks/bench_memory.py
+"""
+Memory per email, traced with tracemalloc:
+
+- pipeline: peak traced memory above the idle baseline while process_email
+  runs on synthetic emails with large text attachments, with the output
+  written to disk, posted to a local webhook receiver and stored for
+  deduplication, against the fake LLM server;
+- records: blocks and bytes held by parsed emails kept as slotted records
+  versus the equivalent dicts.
+
+    python benchmarks/bench_memory.py [--emails 20] [--attachments 3] [--attachment-kb 200]
+"""
+
+import sys
+import os
+import gc
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+os.environ["ENABLE_WEBHOOK"] = "true"
+
+import openai
+import llm_classifier
+import deduplicator
+import orchestrator
+import webhook_sender
+from records import Attachment, ParsedEmail
+from fake_llm_server import start_fake_llm_server
+
+WORDS = (
+    "facility lender borrower repayment principal drawdown agent margin tranche "
+    "commitment interest notice schedule amendment consent allocation fee"
+).split()
+
+
+class WebhookReceiver(BaseHTTPRequestHandler):
+    received = 0
+
+    def do_POST(self):
+        WebhookReceiver.received += len(self.rfile.read(int(self.headers["Content-Length"])))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_webhook_receiver():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WebhookReceiver)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def sentence(rng):
+    amount = f"USD {rng.randint(1, 90_000) * 1000:,}.00"
+    return f"The {' '.join(rng.sample(WORDS, 6))} of {amount} is due on {rng.randint(1, 28)}-Apr-2025."
+
+
+def write_synthetic_eml(path, rng, attachments, attachment_kb):
+    boundary = "===============bench=="
+    parts = [
+        f"Subject: Repayment notice {rng.randint(1, 10**6)}\r\nFrom: agent@bank.com\r\nTo: ops@client.com\r\n"
+        f"Date: Wed, 26 Mar 2025 09:14:29 +0000\r\nMIME-Version: 1.0\r\n"
+        f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n\r\n'
+        f'--{boundary}\r\nContent-Type: text/plain; charset="utf-8"\r\n\r\n'
+        + " ".join(sentence(rng) for _ in range(8)) + "\r\n"
+    ]
+    for i in range(attachments):
+        lines, size = [], 0
+        while size < attachment_kb * 1024:
+            lines.append(sentence(rng))
+            size += len(lines[-1]) + 2
+        parts.append(
+            f"--{boundary}\r\nContent-Type: text/plain; charset=\"utf-8\"\r\n"
+            f'Content-Disposition: attachment; filename="schedule_{i}.txt"\r\n\r\n' + "\r\n".join(lines) + "\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(parts))
+
+
+async def bench_pipeline(paths):
+    """Peak traced bytes above the baseline for each email"""
+    await orchestrator.process_email(paths[0], "warmup")
+    peaks = []
+    for i, path in enumerate(paths[1:]):
+        gc.collect()
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        output = await orchestrator.process_email(path, f"email_{i}")
+        assert "error" not in output, output
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    return peaks
+
+
+def bench_records(count, attachments):
+    """(blocks, bytes) per parsed email held as dicts and as records"""
+    contents = [f"attachment text {i}" for i in range(attachments)]
+
+    def as_dict(i):
+        return {
+            "subject": f"Notice {i}", "from": "agent@bank.com", "to": "ops@client.com", "date": "unknown",
+            "body": "", "attachments": [{"filename": f"a{j}.txt", "content": c} for j, c in enumerate(contents)]
+        }
+
+    def as_record(i):
+        return ParsedEmail(
+            subject=f"Notice {i}", sender="agent@bank.com", to="ops@client.com",
+            attachments=[Attachment(f"a{j}.txt", c) for j, c in enumerate(contents)]
+        )
+
+    results = {}
+    for name, build in (("dict", as_dict), ("record", as_record)):
+        gc.collect()
+        before = tracemalloc.take_snapshot()
+        kept = [build(i) for i in range(count)]
+        after = tracemalloc.take_snapshot()
+        diff = after.compare_to(before, "filename")
+        results[name] = (
+            sum(stat.count_diff for stat in diff) / count,
+            sum(stat.size_diff for stat in diff) / count
+        )
+        del kept
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=20)
+    parser.add_argument("--attachments", type=int, default=3)
+    parser.add_argument("--attachment-kb", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    llm_server, base_url = start_fake_llm_server()
+    llm_classifier.client = openai.AsyncOpenAI(api_key="fake-key", base_url=base_url)
+    webhook_server, webhook_sender.WEBHOOK_URL = start_webhook_receiver()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        orchestrator.OUTPUT_DIR = tmp
+        deduplicator.DEDUP_DB = os.path.join(tmp, "dedup.db")
+        paths = []
+        for i in range(args.emails + 1):
+            paths.append(os.path.join(tmp, f"input_{i}.eml"))
+            write_synthetic_eml(paths[-1], rng, args.attachments, args.attachment_kb)
+
+        tracemalloc.start()
+        peaks = await bench_pipeline(paths)
+        records = bench_records(1000, args.attachments)
+        tracemalloc.stop()
+        deduplicator.close_connections()
+
+    kb = [p / 1024 for p in peaks]
+    print(f"pipeline: {len(kb)} emails with {args.attachments} x {args.attachment_kb} KB attachments: "
+          f"peak {sum(kb) / len(kb):,.0f} KB/email mean, {max(kb):,.0f} KB max; "
+          f"webhook received {WebhookReceiver.received / (len(kb) + 1):,.0f} B/email")
+    for name, (blocks, size) in records.items():
+        print(f"{name:>8}: {blocks:.1f} blocks, {size:,.0f} B per parsed email")
+    llm_server.shutdown()
+    webhook_server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
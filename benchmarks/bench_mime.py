@@ -0,0 +1,73 @@
+# benchmarks/bench_mime.py
+"""
+Peak RSS of parse_eml_file on a large synthetic email: full BytesParser
+parse versus the streaming parser. Each run happens in a fresh subprocess.
+
+    python benchmarks/bench_mime.py [--size-mb 200]
+"""
+
+import sys
+import os
+import base64
+import argparse
+import resource
+import subprocess
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def write_synthetic_eml(path, size_mb, filename):
+    """Email with one base64 attachment of size_mb, written without holding it in memory"""
+    boundary = "===============bench=="
+    with open(path, "wb") as f:
+        f.write(
+            b"Subject: Scanned loan pack\r\nFrom: agent@bank.com\r\nTo: ops@client.com\r\n"
+            b"Date: Wed, 26 Mar 2025 09:14:29 +0000\r\nMIME-Version: 1.0\r\n"
+            b'Content-Type: multipart/mixed; boundary="' + boundary.encode() + b'"\r\n\r\n'
+            b"--" + boundary.encode() + b"\r\nContent-Type: text/plain; charset=\"utf-8\"\r\n\r\n"
+            b"Please find the scanned loan pack attached.\r\n"
+            b"--" + boundary.encode() + b"\r\nContent-Type: application/octet-stream\r\n"
+            b"Content-Transfer-Encoding: base64\r\n"
+            b'Content-Disposition: attachment; filename="' + filename.encode() + b'"\r\n\r\n'
+        )
+        chunk = os.urandom(57 * 1024)
+        for _ in range(size_mb * 1024 * 1024 // len(chunk)):
+            encoded = base64.b64encode(chunk)
+            f.write(b"\r\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76)) + b"\r\n")
+        f.write(b"--" + boundary.encode() + b"--\r\n")
+
+
+def child(mode, path):
+    """Runs inside the subprocess: parse once and print peak RSS growth in MB"""
+    import email_loader
+    email_loader.STREAMING_PARSE_MIN_BYTES = 0 if mode == "streaming" else float("inf")
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result = email_loader.parse_eml_file(path)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print((peak - baseline) / 1024, result.attachments[0].content)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=200)
+    args = parser.parse_args()
+
+    env = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "fake-key")}
+    with tempfile.TemporaryDirectory() as tmp:
+        for filename in ("loan_pack.pdf", "loan_pack.bin"):
+            path = os.path.join(tmp, filename + ".eml")
+            write_synthetic_eml(path, args.size_mb, filename)
+            print(f"{filename}: {os.path.getsize(path) / 2**20:.0f} MB on disk")
+            for mode in ("full", "streaming"):
+                out = subprocess.run(
+                    [sys.executable, __file__, "--child", mode, path],
+                    capture_output=True, text=True, env=env, check=True
+                ).stdout.strip().splitlines()[-1].split(maxsplit=1)
+                print(f"  {mode:>10}: peak RSS +{float(out[0]):8.1f} MB  -> {out[1].strip()}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main()
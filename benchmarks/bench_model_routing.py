@@ -0,0 +1,120 @@
+# benchmarks/bench_model_routing.py
+"""
+Adaptive model routing: classify_email latency and token cost per email
+with every email sent to OPENAI_MODEL versus simple emails tried on
+OPENAI_FAST_MODEL first, against the fake LLM server. The corpus is the
+input directory plus synthetic one-line confirmations and multi-request
+amendments with attachments.
+
+    python benchmarks/bench_model_routing.py [--runs 3] [--strong-price 2.50 10.00] [--fast-price 0.15 0.60]
+
+Prices are USD per million prompt and completion tokens.
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+import openai
+import llm_classifier
+from email_loader import parse_email_file
+from records import Attachment
+from config import INPUT_DIR
+from fake_llm_server import start_fake_llm_server
+
+STRONG_MODEL = "fake-large"
+FAST_MODEL = "fake-mini"
+
+SIMPLE = [
+    ("Fee paid", "Hi team, the agency fee of USD 15,000.00 has been paid today. Thanks."),
+    ("Repayment confirmation", "Confirming the principal repayment of USD 2,000,000.00 on 27-Mar-2025."),
+    ("Drawdown notice", "Please note the drawdown of EUR 5,000,000.00 under the facility on 1-Apr-2025."),
+    ("Upsize", "The lenders have agreed to upsize the facility by USD 25,000,000.00."),
+]
+COMPLEX = [
+    ("Amendment and consent request",
+     "Dear Agent, following the amendment and restatement agreement dated 3-Mar-2025 we request "
+     "consent to extend the maturity to 31-Dec-2028, reprice the margin from 2.75% to 2.50% and "
+     "reallocate USD 40,000,000.00 between tranches, with USD 12,500,000.00 moving on 15-Apr-2025 "
+     "and USD 27,500,000.00 on 15-May-2025. Lender votes are due 10-Apr-2025.",
+     [Attachment("amendment.pdf", "Amendment No. 3 to the Credit Agreement ..."),
+      Attachment("consent.docx", "Form of lender consent ...")]),
+    ("Fee and repayment schedule",
+     "Please find the revised repayment schedule and the fee letter. The ticking fee of "
+     "USD 85,000.00 is payable on 30-Apr-2025 together with the principal repayment of "
+     "USD 10,000,000.00, and the commitment reduces to USD 390,000,000.00 on 1-May-2025.",
+     [Attachment("schedule.xlsx", "Date\tAmount\n30-Apr-2025\t10,000,000")]),
+]
+
+
+def corpus(input_dir):
+    emails = [(subject, body, []) for subject, body in SIMPLE] + list(COMPLEX)
+    if os.path.isdir(input_dir):
+        for name in sorted(os.listdir(input_dir)):
+            if name.endswith((".eml", ".txt")):
+                data = parse_email_file(os.path.join(input_dir, name))
+                emails.append((data.subject or "", data.body, data.attachments))
+    return emails
+
+
+def cost(result, prices):
+    total = 0.0
+    for attempt in result.model_routing["attempts"]:
+        usage = attempt.get("usage")
+        if usage:
+            price_in, price_out = prices[attempt["model"]]
+            total += (usage["prompt_tokens"] * price_in + usage["completion_tokens"] * price_out) / 1e6
+    return total
+
+
+async def run(emails, fast_model, prices, runs):
+    llm_classifier.OPENAI_FAST_MODEL = fast_model
+    latencies, costs, models, types = [], [], [], []
+    for _ in range(runs):
+        for subject, body, attachments in emails:
+            start = time.perf_counter()
+            result = await llm_classifier.classify_email(subject, body, attachments)
+            latencies.append(time.perf_counter() - start)
+            costs.append(cost(result, prices))
+            models.append(result.model_routing["model"])
+            types.append(result.request_type)
+    return {
+        "latency": sum(latencies) / len(latencies),
+        "cost": sum(costs) / len(costs),
+        "fast_share": models.count(fast_model) / len(models) if fast_model else 0.0,
+        "types": types
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--input-dir", default=INPUT_DIR)
+    parser.add_argument("--strong-price", type=float, nargs=2, default=[2.50, 10.00])
+    parser.add_argument("--fast-price", type=float, nargs=2, default=[0.15, 0.60])
+    args = parser.parse_args()
+
+    server, base_url = start_fake_llm_server()
+    llm_classifier.client = openai.AsyncOpenAI(api_key="fake-key", base_url=base_url)
+    llm_classifier.OPENAI_MODEL = STRONG_MODEL
+    prices = {STRONG_MODEL: args.strong_price, FAST_MODEL: args.fast_price}
+    emails = corpus(args.input_dir)
+
+    baseline = await run(emails, None, prices, args.runs)
+    routed = await run(emails, FAST_MODEL, prices, args.runs)
+    for name, r in (("strong only", baseline), ("adaptive", routed)):
+        print(f"{name:>12}: {r['latency'] * 1000:6.1f} ms/email, ${r['cost'] * 1000:.4f} per 1k emails, "
+              f"{r['fast_share'] * 100:.0f}% answered by the fast model")
+    agree = sum(a == b for a, b in zip(baseline["types"], routed["types"])) / len(baseline["types"])
+    print(f"{len(emails)} emails x {args.runs} runs: latency {(1 - routed['latency'] / baseline['latency']) * 100:.1f}% "
+          f"lower, cost {(1 - routed['cost'] / baseline['cost']) * 100:.1f}% lower, "
+          f"request type agreement {agree * 100:.0f}%")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
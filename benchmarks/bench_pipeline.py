@@ -0,0 +1,103 @@
+# benchmarks/bench_pipeline.py
+"""
+Per-email latency: the old sequential pipeline (classify -> extract ->
+dedup) versus process_email's DAG (extraction overlapped with the LLM
+call, dedup first with exact duplicates served from the stored output),
+against the fake LLM server. Every sample email is processed once, then
+re-sent under a new id as a duplicate.
+
+    python benchmarks/bench_pipeline.py [--runs 3]
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+import openai
+import llm_classifier
+import deduplicator
+import orchestrator
+from email_loader import parse_email_file
+from field_extractor import extract_all_fields
+from config import INPUT_DIR
+from rules_registry import get_rules
+from fake_llm_server import start_fake_llm_server
+
+
+async def sequential_process_email(file_path, email_id):
+    """The pre-DAG pipeline, built from the same stage functions"""
+    email_data = parse_email_file(file_path)
+    body, cleaning_stats = orchestrator.clean_body(email_data.body)
+    attachments = email_data.attachments
+    classification = await llm_classifier.classify_email(email_data.subject, body, attachments)
+    extracted = await extract_all_fields(
+        body + "\n\n" + "\n\n".join(att.content for att in attachments)
+    )
+    routing = get_rules().router.route(classification.request_type)
+    duplication = await deduplicator.check_duplicate(
+        email_id, body, routing["request_type"], email_data.date
+    )
+    output = {
+        "email_id": email_id,
+        "classification": classification.to_dict(),
+        "extracted_fields": extracted.to_dict(),
+        "cleaning": cleaning_stats,
+        "assigned_team": routing["assigned_team"],
+        "routing": routing,
+        "duplication": duplication
+    }
+    with open(os.path.join(orchestrator.OUTPUT_DIR, f"{email_id}_output.json"), "w") as f:
+        json.dump(output, f, indent=2)
+    return output
+
+
+async def run(process, files):
+    """Mean latency of first-seen emails and of their duplicates, in seconds"""
+    with tempfile.TemporaryDirectory() as tmp:
+        orchestrator.OUTPUT_DIR = tmp
+        deduplicator.DEDUP_DB = os.path.join(tmp, "dedup.db")
+        timings = {"unique": [], "duplicate": []}
+        for kind, suffix in (("unique", ""), ("duplicate", "_copy")):
+            for path in files:
+                email_id = os.path.splitext(os.path.basename(path))[0] + suffix
+                start = time.perf_counter()
+                await process(path, email_id)
+                timings[kind].append(time.perf_counter() - start)
+        deduplicator.close_connections()
+        return {kind: sum(t) / len(t) for kind, t in timings.items()}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--input-dir", default=INPUT_DIR)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_llm_server()
+    llm_classifier.client = openai.AsyncOpenAI(api_key="fake-key", base_url=base_url)
+    files = [
+        os.path.join(args.input_dir, f) for f in sorted(os.listdir(args.input_dir))
+        if f.endswith((".eml", ".txt"))
+    ]
+
+    results = {}
+    for name, process in (("sequential", sequential_process_email), ("dag", orchestrator.process_email)):
+        runs = [await run(process, files) for _ in range(args.runs)]
+        results[name] = {kind: sum(r[kind] for r in runs) / len(runs) for kind in runs[0]}
+        print(f"{name:>10}: unique {results[name]['unique'] * 1000:7.1f} ms/email, "
+              f"duplicate {results[name]['duplicate'] * 1000:7.1f} ms/email")
+
+    for kind in ("unique", "duplicate"):
+        print(f"{kind} latency reduction: "
+              f"{(1 - results['dag'][kind] / results['sequential'][kind]) * 100:.1f}%")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+# benchmarks/bench_prompt.py
+"""
+Prompt compaction benchmark: tokens and classify_email latency for the
+compacted prompt versus the full-body prompt, against the fake LLM server.
+
+    python benchmarks/bench_prompt.py [--runs 10] [--history 20]
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+import openai
+import llm_classifier
+from cleaner import estimate_tokens
+from records import Attachment
+from fake_llm_server import start_fake_llm_server
+
+DISCLAIMER = (
+    "This message is confidential and intended solely for the addressee. If you are not "
+    "the intended recipient, please notify the sender and delete it. Any unauthorised use "
+    "or disclosure is prohibited."
+)
+
+
+def synthetic_thread(history):
+    """A repayment request on top of a long quoted reply chain"""
+    newest = (
+        "Hi team,\n\nPlease process the principal repayment of USD 20,000,000.00 for CANTOR "
+        "FITZGERALD LP USD 425MM effective 27-Mar-2025. Notice attached.\n\n" + DISCLAIMER
+    )
+    chain = []
+    for i in range(history):
+        chain.append(
+            f"On Mon, {i + 1} Mar 2025 at 09:{i % 60:02d}, Ops Desk <ops@bank.com> wrote:\n"
+            + "\n".join(
+                f"> Following up on item {i}.{j}: the facility balance, the interest accrual and "
+                f"the fee schedule were reviewed again and no further action is needed."
+                for j in range(8)
+            )
+            + f"\n> {DISCLAIMER}"
+        )
+    return newest + "\n\n" + "\n\n".join(chain)
+
+
+def synthetic_attachments():
+    notice = " ".join(
+        f"Line {i}: the lender share of the principal balance remains unchanged for this period."
+        for i in range(300)
+    )
+    notice += " Repayment Amount: USD 20,000,000.00. Effective Date: 2025-03-27."
+    return [Attachment("Repayment_Notice.pdf", notice)]
+
+
+async def run(mode, subject, body, attachments, runs):
+    llm_classifier.ENABLE_PROMPT_COMPACTION = mode == "compacted"
+    latencies, stats = [], None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = await llm_classifier.classify_email(subject, body, attachments)
+        latencies.append(time.perf_counter() - start)
+        stats = result.prompt_stats
+    return sum(latencies) / len(latencies), stats, result.request_type
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--history", type=int, default=20)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_llm_server()
+    llm_classifier.client = openai.AsyncOpenAI(api_key="fake-key", base_url=base_url)
+
+    subject = "RE: RE: FW: Principal Repayment - CANTOR FITZ USD 425MM"
+    body = synthetic_thread(args.history)
+    attachments = synthetic_attachments()
+    print(f"Body tokens: {estimate_tokens(body)}, attachment tokens: "
+          f"{sum(estimate_tokens(a.content) for a in attachments)}")
+
+    results = {}
+    for mode in ("full", "compacted"):
+        results[mode] = await run(mode, subject, body, attachments, args.runs)
+        latency, stats, request_type = results[mode]
+        print(f"{mode:>10}: context_tokens={stats['context_tokens']:>6} "
+              f"mean_latency={latency * 1000:8.1f} ms request_type={request_type}")
+
+    full, compact = results["full"][0], results["compacted"][0]
+    print(f"Tokens saved: {results['compacted'][1]['tokens_saved']}, "
+          f"latency reduction: {(1 - compact / full) * 100:.1f}%")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
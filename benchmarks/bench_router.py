@@ -0,0 +1,102 @@
+# benchmarks/bench_router.py
+"""
+Routing accuracy on labeled LLM label variants (exact TEAM_MAP lookup vs
+RoutingEngine) and a lookup microbenchmark.
+
+    python benchmarks/bench_router.py [--iterations 100000]
+"""
+
+import sys
+import os
+import time
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import REQUEST_TYPE_MAPPINGS, TEAM_MAP, SUBJECT_RULES
+from router import RoutingEngine, build_router
+
+# (label as returned by the LLM, expected team)
+LABELED_VARIANTS = [
+    ("Loan Repayment", "Disbursement Team"),
+    ("Loan repayment", "Disbursement Team"),
+    ("LOAN REPAYMENT", "Disbursement Team"),
+    ("Loan Re-payment", "Disbursement Team"),
+    ("Repayment - Principal", "Disbursement Team"),
+    ("Principal Repayment", "Disbursement Team"),
+    ("Principal payment", "Disbursement Team"),
+    ("Repayment Confirmation", "Disbursement Team"),
+    ("Money Movement - Outbound", "Disbursement Team"),
+    ("Money Movement Outbound", "Disbursement Team"),
+    ("money movement (outbound)", "Disbursement Team"),
+    ("Outbound Money Movement", "Disbursement Team"),
+    ("Money Movement - Inbound", "Cash Ops Team"),
+    ("Funding", "Cash Ops Team"),
+    ("Capital contribution", "Cash Ops Team"),
+    ("Commitment Change", "Loan Servicing Team"),
+    ("commitment change", "Loan Servicing Team"),
+    ("Commitment Increase", "Loan Servicing Team"),
+    ("Facility Upsize", "Loan Servicing Team"),
+    ("Loan Modification", "Loan Servicing Team"),
+    ("Loan Modifcation", "Loan Servicing Team"),
+    ("Fee Payment", "Loan Servicing Team"),
+    ("Fee Notification", "Loan Servicing Team"),
+    ("Amendment Fee", "Loan Servicing Team"),
+    ("Drawdown", "Allocations Team"),
+    ("Draw down", "Allocations Team"),
+    ("Drawdown Request", "Allocations Team"),
+    ("Funds Allocation", "Allocations Team"),
+    ("Allocation Notification", "Allocations Team"),
+    ("Allocation notice", "Allocations Team"),
+    ("Others", "General Servicing Team"),
+    ("General Inquiry", "General Servicing Team"),
+    ("KYC Update", "General Servicing Team"),
+]
+
+
+def exact_route(label):
+    """Routing before the engine: exact mapping then exact TEAM_MAP lookup"""
+    request_type = REQUEST_TYPE_MAPPINGS.get(label, label)
+    return TEAM_MAP.get(request_type, "General Servicing Team")
+
+
+def evaluate(route):
+    misses = [(label, team, route(label)) for label, team in LABELED_VARIANTS if route(label) != team]
+    return 1 - len(misses) / len(LABELED_VARIANTS), misses
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(LABELED_VARIANTS[i % len(LABELED_VARIANTS)][0])
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    router = build_router()
+    for name, route in (("exact lookup", exact_route), ("routing engine", lambda l: router.route(l)["assigned_team"])):
+        accuracy, misses = evaluate(route)
+        print(f"{name:>15}: accuracy {accuracy * 100:5.1f}% on {len(LABELED_VARIANTS)} labeled variants")
+        for label, expected, got in misses:
+            print(f"{'':>17}miss: {label!r} -> {got} (expected {expected})")
+
+    start = time.perf_counter()
+    build_router()
+    print(f"\nCompile: {(time.perf_counter() - start) * 1e3:.2f} ms")
+    print(f"exact lookup:         {timed(exact_route, args.iterations):6.2f} us/label")
+    print(f"engine (memoized):    {timed(router.route, args.iterations):6.2f} us/label")
+    cold = lambda label: RoutingEngine(REQUEST_TYPE_MAPPINGS, TEAM_MAP, SUBJECT_RULES)._resolve_uncached(label)
+    print(f"engine (uncached):    {timed(cold, min(args.iterations, 2000)):6.2f} us/label (incl. compile)")
+
+    batch = [{"primary_request": {"request_type": label}} for label, _ in LABELED_VARIANTS] * 300
+    start = time.perf_counter()
+    router.route_batch(batch)
+    print(f"route_batch:          {(time.perf_counter() - start) / len(batch) * 1e6:6.2f} us/email "
+          f"({len(batch)} classifications)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/bench_slow_emails.py
+"""
+Replays the emails captured in a profiling run's slow_emails.json (see
+profiler.py) through process_email against the fake LLM server, and prints
+the recorded versus replayed wall time per stage. Every run starts from an
+empty dedup database, so no email is served as a duplicate.
+
+    python benchmarks/bench_slow_emails.py data/profiles/<batch>/slow_emails.json [--runs 3]
+"""
+
+import sys
+import os
+import json
+import asyncio
+import argparse
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+import openai
+import llm_classifier
+import deduplicator
+import orchestrator
+from profiler import ProfileSession
+from fake_llm_server import start_fake_llm_server
+
+
+def replay_inputs(report_path):
+    """(recorded email, input path) for every captured email whose input still exists"""
+    with open(report_path, encoding="utf-8") as f:
+        report = json.load(f)
+    base = os.path.dirname(os.path.abspath(report_path))
+    inputs = []
+    for email in report["emails"]:
+        path = os.path.join(base, email["input"]) if email.get("input") else email["path"]
+        if os.path.exists(path):
+            inputs.append((email, path))
+        else:
+            print(f"Skipping {email['email_id']}: {path} no longer exists")
+    return inputs
+
+
+async def replay(path, email_id, runs):
+    """Mean total and per-stage seconds over `runs` replays"""
+    records = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            orchestrator.OUTPUT_DIR = tmp
+            deduplicator.DEDUP_DB = os.path.join(tmp, "dedup.db")
+            session = ProfileSession(profile_dir=tmp, slow_seconds=float("inf"))
+            await session.run(orchestrator.process_email, path, email_id)
+            deduplicator.close_connections()
+            records.append(session.records[-1])
+    stages = {name for record in records for name in record["stages"]}
+    return (
+        sum(record["seconds"] for record in records) / runs,
+        {name: sum(record["stages"].get(name, 0.0) for record in records) / runs for name in stages}
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("report")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_llm_server()
+    llm_classifier.client = openai.AsyncOpenAI(api_key="fake-key", base_url=base_url)
+
+    for email, path in replay_inputs(args.report):
+        seconds, stages = await replay(path, email["email_id"], args.runs)
+        print(f"{email['email_id']}: recorded {email['seconds']:.2f}s, replayed {seconds:.2f}s")
+        for name in sorted(set(email["stages"]) | set(stages), key=lambda n: -stages.get(n, 0.0)):
+            recorded = email["stages"].get(name)
+            recorded = f"{recorded:8.3f}s" if recorded is not None else "       -"
+            print(f"    {name:>10}: recorded {recorded}, replayed {stages.get(name, 0.0):8.3f}s")
+        for attachment in sorted(email.get("attachments", []), key=lambda a: -a["seconds"])[:3]:
+            print(f"    recorded attachment {attachment['filename']} ({attachment['kind']}, "
+                  f"{attachment['bytes'] / 1024:.0f} KB): {attachment['seconds']:.3f}s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
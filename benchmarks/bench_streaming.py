@@ -0,0 +1,69 @@
+# benchmarks/bench_streaming.py
+"""
+Time-to-route for classify_email: full completion versus a streamed
+completion with early request_type/priority parsing, against the fake LLM
+server.
+
+    python benchmarks/bench_streaming.py [--runs 10]
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+import openai
+import llm_classifier
+from router import build_router
+from fake_llm_server import start_fake_llm_server
+
+SUBJECT = "Principal Repayment Notice - CANTOR FITZ USD 425MM"
+BODY = (
+    "Dear Team,\nPlease process the following principal repayment instruction on the effective date.\n"
+    "Deal: CANTOR FITZGERALD LP USD 425MM\nRepayment Amount: USD 20,000,000\nEffective Date: 2025-03-27"
+)
+
+
+async def time_to_route(streaming, router):
+    llm_classifier.ENABLE_STREAMING_CLASSIFICATION = streaming
+    start = time.perf_counter()
+    routed = {}
+
+    def on_primary(primary):
+        routed["at"] = time.perf_counter() - start
+        routed["team"] = router.route(primary["request_type"])["assigned_team"]
+
+    result = await llm_classifier.classify_email(SUBJECT, BODY, on_primary=on_primary)
+    total = time.perf_counter() - start
+    final_team = router.route(result.request_type)["assigned_team"]
+    if not routed:  # full completion: routed once the whole answer is in
+        routed.update(at=total, team=final_team)
+    assert final_team == routed["team"], (final_team, routed["team"])
+    return routed["at"], total
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_llm_server()
+    llm_classifier.client = openai.AsyncOpenAI(api_key="fake-key", base_url=base_url)
+    router = build_router()
+
+    results = {}
+    for name, streaming in (("full", False), ("streamed", True)):
+        runs = [await time_to_route(streaming, router) for _ in range(args.runs)]
+        results[name] = [sum(r[i] for r in runs) / len(runs) for i in range(2)]
+        print(f"{name:>9}: time-to-route {results[name][0] * 1000:7.1f} ms, "
+              f"full classification {results[name][1] * 1000:7.1f} ms")
+
+    print(f"Time-to-route reduction: {(1 - results['streamed'][0] / results['full'][0]) * 100:.1f}%")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
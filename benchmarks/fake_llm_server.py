@@ -0,0 +1,140 @@
+# benchmarks/fake_llm_server.py
+"""
+Local stand-in for the OpenAI chat completions endpoint.
+
+Latency is simulated from the request size, so prompt changes show up in
+benchmarks without network access or API spend:
+
+    latency = BASE_MS + PROMPT_MS_PER_TOKEN * prompt_tokens + OUTPUT_MS_PER_TOKEN * output_tokens
+
+Requests with "stream": true get server-sent event chunks of about one
+token each, paced at OUTPUT_MS_PER_TOKEN after the prompt latency.
+
+Models named like a small model ("mini", "fast") answer FAST_LATENCY_FACTOR
+times faster but are only confident when a subject rule matches the email.
+Completions longer than max_tokens are cut off with finish_reason "length".
+
+Run standalone with `python benchmarks/fake_llm_server.py [port]` and point
+OPENAI_BASE_URL at http://127.0.0.1:<port>/v1.
+"""
+
+import sys
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cleaner import estimate_tokens
+from llm_classifier import rule_based_classification
+from rules_registry import get_rules
+
+BASE_MS = 40.0
+PROMPT_MS_PER_TOKEN = 0.08
+OUTPUT_MS_PER_TOKEN = 8.0
+FAST_LATENCY_FACTOR = 0.35
+
+
+def is_fast_model(model):
+    return any(tag in model.lower() for tag in ("mini", "fast"))
+
+
+def fake_classification(prompt, fast=False):
+    """Deterministic classification JSON for the email section of a prompt"""
+    email_section = prompt.split("**Email to Classify:**")[-1]
+    primary = rule_based_classification("", email_section)["primary_request"]
+    # Same key order as the prompt's schema: routing fields first
+    ordered = {key: primary[key] for key in (
+        "request_type", "priority", "sub_request_type", "primary_intent", "confidence", "reasoning"
+    )}
+    ordered["confidence"] = 90 if not fast or get_rules().match_subject_rule(email_section.lower()) else 50
+    return json.dumps({"primary_request": ordered, "secondary_requests": []})
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+        model = request.get("model", "fake")
+        fast = is_fast_model(model)
+        speed = FAST_LATENCY_FACTOR if fast else 1.0
+        content = fake_classification(prompt, fast)
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(content)
+        finish_reason = "stop"
+        if request.get("max_tokens") and completion_tokens > request["max_tokens"]:
+            content = content[:request["max_tokens"] * 4]
+            completion_tokens = request["max_tokens"]
+            finish_reason = "length"
+
+        time.sleep(speed * (BASE_MS + PROMPT_MS_PER_TOKEN * prompt_tokens) / 1000)
+        if request.get("stream"):
+            self._stream(content, model, speed, finish_reason)
+            return
+        time.sleep(speed * OUTPUT_MS_PER_TOKEN * completion_tokens / 1000)
+
+        body = json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, content, model, speed=1.0, finish_reason="stop"):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        event({"role": "assistant", "content": ""})
+        for i in range(0, len(content), 4):
+            time.sleep(speed * OUTPUT_MS_PER_TOKEN / 1000)
+            event({"content": content[i:i + 4]})
+        event({}, finish_reason)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_fake_llm_server(port=0):
+    """Start the server on a background thread; returns (server, base_url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeLLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    server, base_url = start_fake_llm_server(int(sys.argv[1]) if len(sys.argv) > 1 else 8765)
+    print(f"Fake LLM server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,5 +1,11 @@
 import re
 from datetime import datetime
+from config import CLEANING_OPTIONS
+
+try:
+    import tiktoken
+except ImportError:  # Optional: exact token counts
+    tiktoken = None
 
 CURRENCY_SYMBOL_MAP = {
     "$": "USD",
@@ -9,6 +15,81 @@ CURRENCY_SYMBOL_MAP = {
     "₹": "INR"
 }
 
+SIGNATURE_KEYWORDS = [
+    "Thanks & Regards", "Kind regards", "Sincerely", "Best regards",
+    "This email message", "If you have any questions"
+]
+
+MONTHS = {
+    'JAN': '01', 'FEB': '02', 'MAR': '03', 'APR': '04', 'MAY': '05', 'JUN': '06',
+    'JUL': '07', 'AUG': '08', 'SEP': '09', 'OCT': '10', 'NOV': '11', 'DEC': '12'
+}
+
+# Compiled once at import: every cleaning step below is a single scan of the text.
+_CURRENCY_TABLE = str.maketrans({symbol: f"{code} " for symbol, code in CURRENCY_SYMBOL_MAP.items()})
+# Signature removal runs before whitespace normalization, so "Kind   regards" must match too
+_SIGNATURE_RE = re.compile(
+    "|".join(r"\s+".join(re.escape(word) for word in kw.split()) for kw in SIGNATURE_KEYWORDS),
+    re.IGNORECASE
+)
+_DATE_PATTERN = r"(?<!\d)(\d{1,2})[-\s](" + "|".join(MONTHS) + r")[-\s](\d{4})"
+_DATE_RE = re.compile(_DATE_PATTERN, re.IGNORECASE)
+
+# Whitespace, blank-line and date normalization in one pass. ``_BLANK`` is
+# horizontal whitespace, extended with non-ASCII runs when those are removed.
+_BLANK = r"[^\S\n]"
+_BLANK_OR_NON_ASCII = r"(?:[^\S\n]|[^\x00-\x7F])"
+
+
+def _compile_normalizer(blank, with_dates):
+    alternatives = [rf"(?P<nl>{blank}*\n(?:\s|{blank})*)", rf"(?P<ws>{blank}+)"]
+    if with_dates:
+        alternatives.insert(0, rf"(?P<date>{_DATE_PATTERN})")
+    return re.compile("|".join(alternatives), re.IGNORECASE)
+
+
+_NORMALIZERS = {
+    (remove_non_ascii, with_dates): _compile_normalizer(
+        _BLANK_OR_NON_ASCII if remove_non_ascii else _BLANK, with_dates
+    )
+    for remove_non_ascii in (True, False)
+    for with_dates in (True, False)
+}
+
+
+def _normalize_match(match):
+    if match.group("nl") is not None:
+        return "\n"
+    if match.group("ws") is not None:
+        return " "
+    day, mon, year = match.group(2), match.group(3).upper(), match.group(4)
+    return f"{year}-{MONTHS[mon[:3]]}-{day.zfill(2)}"
+
+
+_encoding = None
+
+
+def get_token_encoding():
+    """Return the tiktoken encoding, or None when only the heuristic is available."""
+    global _encoding, tiktoken
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            tiktoken = None  # Encoding files unavailable (e.g. offline)
+    return _encoding
+
+
+def estimate_tokens(text):
+    """Token count via tiktoken if available, else about four characters per token."""
+    if not text:
+        return 0
+    encoding = get_token_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
 def normalize_whitespace(text):
     """Collapse multiple spaces/tabs into a single space."""
     return re.sub(r'\s+', ' ', text).strip()
@@ -28,37 +109,22 @@ def preserve_lines(text):
 
 def standardize_currency(text):
     """Replace common currency symbols with codes."""
-    for symbol, code in CURRENCY_SYMBOL_MAP.items():
-        text = text.replace(symbol, f"{code} ")
-    return text
+    return text.translate(_CURRENCY_TABLE)
 
 
 def standardize_dates(text):
     """Convert dates like '14-Mar-2024' into '2024-03-14'."""
-    months = {
-        'JAN': '01', 'FEB': '02', 'MAR': '03', 'APR': '04', 'MAY': '05', 'JUN': '06',
-        'JUL': '07', 'AUG': '08', 'SEP': '09', 'OCT': '10', 'NOV': '11', 'DEC': '12'
-    }
-
     def replace_date(match):
         day, mon, year = match.group(1), match.group(2).upper(), match.group(3)
-        month = months.get(mon[:3], '01')
-        return f"{year}-{month}-{day.zfill(2)}"
+        return f"{year}-{MONTHS[mon[:3]]}-{day.zfill(2)}"
 
-    return re.sub(r'(\d{1,2})[-\s](\w{3})[-\s](\d{4})', replace_date, text, flags=re.IGNORECASE)
+    return _DATE_RE.sub(replace_date, text)
 
 
 def remove_email_signature(text):
     """Remove trailing email signatures or common boilerplate."""
-    signature_keywords = [
-        "Thanks & Regards", "Kind regards", "Sincerely", "Best regards",
-        "This email message", "If you have any questions"
-    ]
-    for keyword in signature_keywords:
-        index = text.lower().find(keyword.lower())
-        if index != -1:
-            return text[:index]
-    return text
+    match = _SIGNATURE_RE.search(text)
+    return text[:match.start()] if match else text
 
 
 def extract_reference_sentence(text):
@@ -70,11 +136,33 @@ def extract_reference_sentence(text):
     return sentences[0].strip() if sentences else ""
 
 
-def clean_text(raw_text):
-    """Run all preprocessing steps."""
-    text = preserve_lines(raw_text)
-    text = standardize_currency(text)
-    text = standardize_dates(text)
-    text = remove_email_signature(text)
-    text = remove_non_ascii(text)
-    return text.strip()
+def clean_text(raw_text, options=None):
+    """Run all preprocessing steps.
+
+    ``options`` toggles individual steps (defaults: ``config.CLEANING_OPTIONS``).
+    Signature truncation runs first so the remaining steps only scan the
+    message itself; currency symbols are swapped via a translate table and
+    whitespace, blank lines, non-ASCII runs and dates share one regex pass.
+    """
+    opts = {**CLEANING_OPTIONS, **(options or {})}
+    text = raw_text or ""
+
+    if opts["remove_signature"]:
+        text = remove_email_signature(text)
+    if opts["standardize_currency"]:
+        text = text.translate(_CURRENCY_TABLE)
+
+    normalizer = _NORMALIZERS[(bool(opts["remove_non_ascii"]), bool(opts["standardize_dates"]))]
+    return normalizer.sub(_normalize_match, text).strip()
+
+
+def clean_email_body(raw_text, options=None):
+    """Clean an email body and report the token savings."""
+    cleaned = clean_text(raw_text, options)
+    raw_tokens = estimate_tokens(raw_text or "")
+    cleaned_tokens = estimate_tokens(cleaned)
+    return cleaned, {
+        "raw_tokens": raw_tokens,
+        "cleaned_tokens": cleaned_tokens,
+        "tokens_saved": raw_tokens - cleaned_tokens
+    }
@@ -6,6 +6,15 @@ load_dotenv()
 # === API Configuration ===
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "400"))
+# Optional cheaper model for simple emails; unset sends everything to OPENAI_MODEL
+OPENAI_FAST_MODEL = os.getenv("OPENAI_FAST_MODEL") or None
+OPENAI_FAST_MAX_TOKENS = int(os.getenv("OPENAI_FAST_MAX_TOKENS", "250"))
+# Emails scoring at most this (llm_classifier.score_complexity) try the fast model first
+MODEL_ROUTING_MAX_COMPLEXITY = float(os.getenv("MODEL_ROUTING_MAX_COMPLEXITY", "3"))
+# Fast model answers below this confidence are asked again of OPENAI_MODEL
+MODEL_ESCALATION_CONFIDENCE = int(os.getenv("MODEL_ESCALATION_CONFIDENCE", "75"))
 
 # === Path Configuration ===
 INPUT_DIR = "data/inputs"
@@ -14,11 +23,88 @@ ATTACHMENTS_DIR = os.path.join(INPUT_DIR, "attachments")
 LOG_DIR = "Logs"
 ENABLE_WEBHOOK = os.getenv("ENABLE_WEBHOOK", "false").lower() == "true"
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+# Output JSON is compact unless an indent is set (orjson is used for 0 or 2,
+# the json module for other indents); fsync makes writes durable
+OUTPUT_INDENT = int(os.getenv("OUTPUT_INDENT", "0")) or None
+OUTPUT_FSYNC = os.getenv("OUTPUT_FSYNC", "true").lower() == "true"
+
+# === Email Parsing Configuration ===
+# Emails at least this large are parsed in streaming mode (0 = always stream)
+STREAMING_PARSE_MIN_BYTES = int(os.getenv("STREAMING_PARSE_MIN_BYTES", str(10 * 1024 * 1024)))
+MAX_ATTACHMENT_BYTES = int(os.getenv("MAX_ATTACHMENT_BYTES", str(25 * 1024 * 1024)))
+MAX_EMAIL_BYTES = int(os.getenv("MAX_EMAIL_BYTES", str(100 * 1024 * 1024)))
+MIME_CHUNK_SIZE = 64 * 1024
+# Decoded attachments spill from memory to disk beyond this size
+ATTACHMENT_SPOOL_BYTES = 1024 * 1024
+# Images are not OCRed when smaller than this (px) in either dimension
+IMAGE_MIN_DIMENSION = 32
+# Inline images (logos, signatures in HTML mail) are skipped below these
+INLINE_IMAGE_MIN_BYTES = 16 * 1024
+INLINE_IMAGE_MIN_DIMENSION = 150
+# Spreadsheet/CSV rows extracted per attachment
+SPREADSHEET_MAX_ROWS = 2000
+# Limits for .zip and attached .eml contents
+ZIP_MAX_MEMBERS = 50
+MAX_ATTACHMENT_DEPTH = 3
 
 # === Deduplication Configuration ===
 DEDUP_DB = os.path.join(OUTPUT_DIR, "dedup_cache.db")
 DEDUPLICATION_FIELDS = ["request_type", "date"]
 DEDUPLICATION_THRESHOLD = 0.9
+# Optional compact hash index for long histories (hash_index.py); unset keeps
+# the whole history in DEDUP_DB. The index is written by one process only.
+DEDUP_INDEX_DIR = os.getenv("DEDUP_INDEX_DIR") or None
+DEDUP_INDEX_SHARDS = 16
+DEDUP_INDEX_WINDOW_DAYS = 30
+DEDUP_RETENTION_DAYS = int(os.getenv("DEDUP_RETENTION_DAYS", "730"))
+DEDUP_INDEX_MERGE_THRESHOLD = 100000
+DEDUP_BLOOM_ERROR_RATE = 0.001
+
+# === Text Cleaning Configuration ===
+ENABLE_TEXT_CLEANING = os.getenv("ENABLE_TEXT_CLEANING", "true").lower() == "true"
+CLEANING_OPTIONS = {
+    "remove_signature": True,
+    "standardize_currency": True,
+    "standardize_dates": True,
+    "remove_non_ascii": True
+}
+
+# === Prompt Configuration ===
+ENABLE_PROMPT_COMPACTION = os.getenv("ENABLE_PROMPT_COMPACTION", "true").lower() == "true"
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+ATTACHMENT_SNIPPET_TOKENS = int(os.getenv("ATTACHMENT_SNIPPET_TOKENS", "250"))
+# Stream completions so routing can start before the full JSON arrives
+ENABLE_STREAMING_CLASSIFICATION = os.getenv("ENABLE_STREAMING_CLASSIFICATION", "false").lower() == "true"
+
+# === Distributed Processing Configuration ===
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL", "sqlite:///" + os.path.join(OUTPUT_DIR, "jobs.db"))
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = 5  # seconds, multiplied by the attempt number
+
+# === IMAP Watcher Configuration ===
+# Single mailbox, used when IMAP_MAILBOXES_FILE is not set
+EMAIL_HOST = os.getenv("EMAIL_HOST", "outlook.office365.com")
+EMAIL_USER = os.getenv("EMAIL_USER", "your_email@outlook.com")
+EMAIL_PASS = os.getenv("EMAIL_PASS", "your_password_or_app_password")
+# JSON or YAML list of mailboxes: name, host, user, password_env, folders
+IMAP_MAILBOXES_FILE = os.getenv("IMAP_MAILBOXES_FILE") or None
+IMAP_POLL_INTERVAL = int(os.getenv("IMAP_POLL_INTERVAL", "60"))
+IMAP_IO_THREADS = int(os.getenv("IMAP_IO_THREADS", "8"))  # concurrent IMAP round trips
+IMAP_PROCESSING_WORKERS = int(os.getenv("IMAP_PROCESSING_WORKERS", "4"))  # emails processed at once
+IMAP_PREFETCH = int(os.getenv("IMAP_PREFETCH", "20"))  # downloaded, unprocessed emails per folder
+IMAP_CHECKPOINT_DB = os.getenv("IMAP_CHECKPOINT_DB", os.path.join(OUTPUT_DIR, "imap_checkpoints.db"))
+IMAP_METRICS_INTERVAL = int(os.getenv("IMAP_METRICS_INTERVAL", "300"))
+# Profile processed emails (see PROFILE_*); reports are written every IMAP_METRICS_INTERVAL
+IMAP_PROFILE = os.getenv("IMAP_PROFILE", "false").lower() == "true"
+
+# === Profiling Configuration (orchestrator.py --profile, IMAP_PROFILE) ===
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))  # seconds between stack samples
+# Emails taking longer than this are captured in the batch's slow_emails.json for replay
+PROFILE_SLOW_EMAIL_SECONDS = float(os.getenv("PROFILE_SLOW_EMAIL_SECONDS", "10"))
+# Also run cProfile on the event loop thread (exact call counts, much higher overhead)
+PROFILE_CPROFILE = os.getenv("PROFILE_CPROFILE", "false").lower() == "true"
 
 # === Currency Configuration ===
 CURRENCY_SYMBOLS = {
@@ -46,6 +132,17 @@ DATE_FORMATS = [
     "%B %d, %Y", "%b %d, %Y", "%Y%m%d",
     "%d %B %Y", "%d %b %Y"
 ]
+# Date spellings found by regex (spaCy finds the rest)
+DATE_PATTERNS = [
+    r"\d{1,2}[-\s]\w{3}[-\s]\d{4}",  # 15-Mar-2025
+    r"\w+\s\d{1,2},\s\d{4}"           # March 15, 2025
+]
+
+# === Rules Configuration ===
+# YAML/JSON file overriding the rule constants below (see rules_registry.py);
+# edits are picked up without a restart, checked every RULES_RELOAD_INTERVAL seconds
+RULES_FILE = os.getenv("RULES_FILE", "rules.yaml")
+RULES_RELOAD_INTERVAL = float(os.getenv("RULES_RELOAD_INTERVAL", "2"))
 
 # === Classification Configuration ===
 REQUEST_TYPE_MAPPINGS = {
@@ -89,6 +186,7 @@ TEAM_MAP = {
     "Money Movement - Outbound": "Disbursement Team",
     "Money Movement - Inbound": "Cash Ops Team",
     "Allocation Notification": "Allocations Team",
+    "Fee Notification": "Loan Servicing Team",
     
     # Aliases
     "Principal Payment": "Disbursement Team",
@@ -98,6 +196,9 @@ TEAM_MAP = {
     "Others": "General Servicing Team"
 }
 
+# Minimum similarity (0-1) for fuzzy label matching in router.py; 0 disables it
+ROUTING_FUZZY_THRESHOLD = float(os.getenv("ROUTING_FUZZY_THRESHOLD", "0.85"))
+
 # === Field Extraction Configuration ===
 FIELD_PATTERNS = {
     "deal_name": r"(?:Re|Ref|Reference)[:\s]+([A-Z][^\n]+?)(?:\n|$)",
@@ -3,54 +3,217 @@
 import json
 import hashlib
 import os
-from config import DEDUP_DB
+import sqlite3
+import threading
+from profiler import in_thread
+from config import (
+    DEDUP_DB,
+    DEDUP_INDEX_DIR,
+    DEDUP_INDEX_SHARDS,
+    DEDUP_INDEX_WINDOW_DAYS,
+    DEDUP_RETENTION_DAYS,
+    DEDUP_INDEX_MERGE_THRESHOLD,
+    DEDUP_BLOOM_ERROR_RATE
+)
 
-async def check_duplicate(email_id, cleaned_text, request_type, date_str):
-    """Check if an email is a duplicate (asynchronous)."""
-    try:
-        # Generate a hash of the email body
-        body_hash = hashlib.sha256(cleaned_text.encode('utf-8')).hexdigest()
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dedup (
+    email_id TEXT PRIMARY KEY,
+    request_type TEXT,
+    date TEXT,
+    body_hash TEXT NOT NULL,
+    content_hash TEXT,
+    output TEXT
+);
+"""
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_dedup_body_hash ON dedup (body_hash);
+CREATE INDEX IF NOT EXISTS idx_dedup_content_hash ON dedup (content_hash);
+"""
+# Columns added after the first SQLite release of the store
+ADDED_COLUMNS = {"content_hash": "TEXT", "output": "TEXT"}
+
+def content_fingerprint(file_path, chunk_size=1 << 20):
+    """
+    Cheap hash of a message file taken before any parsing. For .eml files the
+    header block is skipped (each distribution list rewrites it), and all
+    whitespace is dropped so re-wrapped copies still match.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        if file_path.lower().endswith(".eml"):
+            for line in f:
+                if not line.strip():
+                    break
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(b"".join(chunk.split()))
+    return digest.hexdigest()
 
-        # Load existing deduplication cache (if any)
+def _migrate_json_cache(path):
+    """Move a legacy JSON cache aside and return its entries"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        print(f"Cache file is corrupted or invalid. Resetting cache: {e}")
         cache = {}
-        if os.path.exists(DEDUP_DB):
-            try:
-                with open(DEDUP_DB, "r", encoding="utf-8") as f:
-                    cache = json.load(f)
-            except (json.JSONDecodeError, UnicodeDecodeError) as e:
-                print(f"Cache file is corrupted or invalid. Resetting cache: {e}")
-                cache = {}
+    os.replace(path, path + ".json.bak")
+    return cache if isinstance(cache, dict) else {}
 
-        # Check for exact duplicates
-        for past_id, data in cache.items():
-            if data["body_hash"] == body_hash:
-                return {
-                    "is_duplicate": True,
-                    "duplicate_type": "exact",
-                    "matched_with": past_id,
-                    "reason": "Exact content match"
-                }
-
-        # If not a duplicate, store in cache
-        cache[email_id] = {
-            "request_type": request_type,
-            "date": date_str,
-            "body_hash": body_hash
-        }
+def connect(path=None):
+    """
+    Open the dedup store. SQLite serializes writers across processes, so
+    several workers can share one store safely.
+    """
+    path = path or DEDUP_DB
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    legacy = {}
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if not f.read(16).startswith(b"SQLite format 3"):
+                legacy = _migrate_json_cache(path) if os.path.getsize(path) else {}
 
-        # Save updated cache
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(dedup)")}
+    for name, sql_type in ADDED_COLUMNS.items():
+        if name not in columns:
+            conn.execute(f"ALTER TABLE dedup ADD COLUMN {name} {sql_type}")
+    conn.executescript(INDEXES)
+    if legacy:
+        conn.executemany(
+            "INSERT OR IGNORE INTO dedup (email_id, request_type, date, body_hash) VALUES (?, ?, ?, ?)",
+            [
+                (email_id, data.get("request_type"), data.get("date"), data["body_hash"])
+                for email_id, data in legacy.items()
+                if isinstance(data, dict) and data.get("body_hash")
+            ]
+        )
+    return conn
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+def _run(func, *args):
+    """
+    Call func(conn, *args) with this process's connection to DEDUP_DB, one
+    caller at a time. Called on executor threads, so waiting for SQLite's
+    write lock never blocks the event loop. The connection is reopened if
+    the database file was removed or replaced.
+    """
+    key = (os.getpid(), DEDUP_DB)
+    with _connections_lock:
+        entry = _connections.get(key)
         try:
-            with open(DEDUP_DB, "w", encoding="utf-8") as f:
-                json.dump(cache, f, indent=2)
-        except Exception as e:
-            print(f"Failed to save cache: {e}")
+            inode = os.stat(DEDUP_DB).st_ino
+        except FileNotFoundError:
+            inode = None
+        if entry is None or entry[2] != inode:
+            if entry is not None:
+                with entry[1]:
+                    entry[0].close()
+            conn = connect(DEDUP_DB)
+            entry = _connections[key] = (conn, threading.Lock(), os.stat(DEDUP_DB).st_ino)
+    conn, lock, _ = entry
+    with lock:
+        return func(conn, *args)
+
+def close_connections():
+    """Close this process's dedup store connections (they reopen on next use)"""
+    with _connections_lock:
+        for conn, lock, _ in _connections.values():
+            with lock:
+                conn.close()
+        _connections.clear()
+
+_hash_index = None
+
+def get_hash_index():
+    """
+    The process-wide hash index when DEDUP_INDEX_DIR is set, else None.
+    Raises hash_index.IndexLockedError if another process has it open.
+    """
+    global _hash_index
+    if _hash_index is None and DEDUP_INDEX_DIR:
+        from hash_index import HashIndex, LOCK_NAME
+        fresh = not os.path.isdir(DEDUP_INDEX_DIR) or not set(os.listdir(DEDUP_INDEX_DIR)) - {LOCK_NAME}
+        _hash_index = HashIndex(
+            DEDUP_INDEX_DIR,
+            shards=DEDUP_INDEX_SHARDS,
+            window_seconds=DEDUP_INDEX_WINDOW_DAYS * 86400,
+            retention_seconds=DEDUP_RETENTION_DAYS * 86400,
+            error_rate=DEDUP_BLOOM_ERROR_RATE,
+            merge_threshold=DEDUP_INDEX_MERGE_THRESHOLD
+        )
+        if fresh:
+            # Seed a new index with the history already in the database
+            conn = connect()
+            try:
+                _hash_index.add_many([row[0] for row in conn.execute("SELECT body_hash FROM dedup")])
+            finally:
+                conn.close()
+    return _hash_index
+
+def _check_and_insert(conn, email_id, body_hash, seen, indexed, request_type, date_str, content_hash):
+    # Lookup and insert under one write lock so concurrent workers agree
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT email_id FROM dedup WHERE body_hash = ? AND email_id != ? LIMIT 1",
+            (body_hash, email_id)
+        ).fetchone() if seen else None
+
+        # Check for exact duplicates
+        if row:
+            return {
+                "is_duplicate": True,
+                "duplicate_type": "exact",
+                "matched_with": row[0],
+                "reason": "Exact content match"
+            }
+        if seen and indexed and not conn.execute(
+            "SELECT 1 FROM dedup WHERE email_id = ? AND body_hash = ?", (email_id, body_hash)
+        ).fetchone():
+            # Only the index remembers it (older than the rows kept in the database)
+            return {
+                "is_duplicate": True,
+                "duplicate_type": "exact",
+                "matched_with": None,
+                "reason": "Exact content match in dedup history"
+            }
 
+        # If not a duplicate, store it
+        conn.execute(
+            "INSERT OR REPLACE INTO dedup (email_id, request_type, date, body_hash, content_hash) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (email_id, request_type, date_str, body_hash, content_hash)
+        )
         return {
             "is_duplicate": False,
             "duplicate_type": None,
             "matched_with": None,
             "reason": "Unique request"
         }
+    finally:
+        conn.execute("COMMIT")
+
+async def check_duplicate(email_id, cleaned_text, request_type, date_str, content_hash=None):
+    """Check if an email is a duplicate (asynchronous)."""
+    # An index held by another process is a configuration error, not a unique email
+    index = get_hash_index()
+    try:
+        # Generate a hash of the email body
+        body_hash = hashlib.sha256(cleaned_text.encode('utf-8')).hexdigest()
+
+        # With the hash index, a hash it has never seen (the common case) needs no lookup
+        seen = index.check_and_add(body_hash) if index is not None else True
+
+        return await in_thread(
+            _run, _check_and_insert, email_id, body_hash, seen, index is not None,
+            request_type, date_str, content_hash
+        )
 
     except Exception as e:
         print(f"Deduplication error for {email_id}: {e}")
@@ -59,4 +222,54 @@ async def check_duplicate(email_id, cleaned_text, request_type, date_str):
             "duplicate_type": None,
             "matched_with": None,
             "reason": f"Deduplication failed: {str(e)}"
-        }
\ No newline at end of file
+        }
+
+def _fetch_one(conn, query):
+    return conn.execute(*query).fetchone()
+
+def _execute(conn, query):
+    conn.execute(*query)
+
+async def find_cached_result(content_hash, email_id=None):
+    """
+    Stored output of another email with the same content fingerprint, or
+    None; email_id's own row is skipped so retries and re-runs recompute
+    """
+    try:
+        row = await in_thread(_run, _fetch_one, (
+            "SELECT email_id, output FROM dedup "
+            "WHERE content_hash = ? AND email_id != ? AND output IS NOT NULL LIMIT 1",
+            (content_hash, email_id or "")
+        ))
+        return {"email_id": row[0], "output": json.loads(row[1])} if row else None
+    except Exception as e:
+        print(f"Result cache lookup failed: {e}")
+        return None
+
+async def load_result(email_id):
+    """Stored output of a processed email, or None"""
+    try:
+        row = await in_thread(_run, _fetch_one, (
+            "SELECT output FROM dedup WHERE email_id = ? AND output IS NOT NULL", (email_id,)
+        ))
+        return json.loads(row[0]) if row else None
+    except Exception as e:
+        print(f"Failed to load stored result for {email_id}: {e}")
+        return None
+
+async def store_result(email_id, output, data=None):
+    """
+    Keep an email's full output (and final request type) so duplicates can
+    reuse it; `data` is the output already serialized to JSON bytes, if any
+    """
+    try:
+        await in_thread(_run, _execute, (
+            "UPDATE dedup SET request_type = ?, output = ? WHERE email_id = ?",
+            (
+                output.get("routing", {}).get("request_type"),
+                data.decode("utf-8") if data is not None else json.dumps(output),
+                email_id
+            )
+        ))
+    except Exception as e:
+        print(f"Failed to store result for {email_id}: {e}")
@@ -2,22 +2,178 @@
 
 import email
 from email import policy
-from email.parser import BytesParser
+from email.parser import BytesParser, BytesHeaderParser
 from pathlib import Path
 from docx import Document
-from bs4 import BeautifulSoup
+from PIL import Image
 import pytesseract
 from pdf2image import convert_from_path
 import fitz  # PyMuPDF
 import tempfile
+import threading
+import zipfile
+import shutil
+import time
+import csv
+import io
 import os
+from mime_stream import stream_parse
+from html_text import html_to_text
+from Logger import logger
+from records import Attachment, ParsedEmail
+from profiler import note_attachment
+from config import (
+    STREAMING_PARSE_MIN_BYTES,
+    MAX_ATTACHMENT_BYTES,
+    MAX_EMAIL_BYTES,
+    MIME_CHUNK_SIZE,
+    ATTACHMENT_SPOOL_BYTES,
+    IMAGE_MIN_DIMENSION,
+    INLINE_IMAGE_MIN_BYTES,
+    INLINE_IMAGE_MIN_DIMENSION,
+    SPREADSHEET_MAX_ROWS,
+    ZIP_MAX_MEMBERS,
+    MAX_ATTACHMENT_DEPTH
+)
+
+try:
+    import openpyxl
+except ImportError:  # Optional: only needed for .xlsx attachments
+    openpyxl = None
+
+try:
+    import extract_msg
+except ImportError:  # Optional: only needed for Outlook .msg attachments
+    extract_msg = None
+
+UNSUPPORTED_MARKER = "[UNSUPPORTED ATTACHMENT TYPE]"
+TOO_LARGE_MARKER = "[SKIPPED: ATTACHMENT TOO LARGE]"
+EMAIL_TOO_LARGE_MARKER = "[SKIPPED: EMAIL TOO LARGE]"
+INLINE_IMAGE_MARKER = "[SKIPPED: INLINE IMAGE]"
+SMALL_IMAGE_MARKER = "[SKIPPED: IMAGE TOO SMALL]"
+TOO_DEEP_MARKER = "[SKIPPED: NESTED TOO DEEPLY]"
+EXTRACTION_FAILED_MARKER = "[EXTRACTION FAILED]"
+
+# The content decides the type where it can; the declared name and MIME type
+# only fill in for formats without a signature (CSV, .eml, plain text)
+SNIFF_BYTES = 512
+MAGIC_SIGNATURES = (
+    (b"%PDF-", "pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image"),
+    (b"\xff\xd8\xff", "image"),
+    (b"GIF87a", "image"),
+    (b"GIF89a", "image"),
+    (b"II*\x00", "image"),
+    (b"MM\x00*", "image"),
+    (b"PK\x03\x04", "zip"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "ole")
+)
+EXTENSION_TYPES = {
+    ".pdf": "pdf",
+    ".docx": "docx",
+    ".xlsx": "xlsx",
+    ".xlsm": "xlsx",
+    ".jpg": "image",
+    ".jpeg": "image",
+    ".png": "image",
+    ".gif": "image",
+    ".tif": "image",
+    ".tiff": "image",
+    ".csv": "csv",
+    ".txt": "text",
+    ".zip": "zip",
+    ".eml": "eml",
+    ".msg": "msg"
+}
+CONTENT_TYPES = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "text/csv": "csv",
+    "text/plain": "text",
+    "application/zip": "zip",
+    "application/x-zip-compressed": "zip",
+    "message/rfc822": "eml",
+    "application/vnd.ms-outlook": "msg"
+}
+CONTAINER_KINDS = {"zip", "eml", "msg"}
+
+_extraction_stats = {}
+_stats_lock = threading.Lock()
+
+def _write_temp(data, suffix):
+    """Write bytes or a binary file object to a temp file; returns its path"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        if isinstance(data, (bytes, bytearray)):
+            tmp.write(data)
+        else:
+            data.seek(0)
+            shutil.copyfileobj(data, tmp)
+        return tmp.name
+
+def _as_file(payload):
+    """A binary file object at offset 0 for bytes or a binary file object"""
+    if isinstance(payload, (bytes, bytearray)):
+        return io.BytesIO(payload)
+    payload.seek(0)
+    return payload
+
+def _payload_size(payload):
+    if isinstance(payload, (bytes, bytearray)):
+        return len(payload)
+    return payload.seek(0, os.SEEK_END)
+
+def sniff_type(head, filename=None, content_type=None):
+    """
+    Attachment kind from its first bytes, falling back to the declared
+    extension or MIME type; None when it cannot be extracted.
+    """
+    declared = EXTENSION_TYPES.get(Path(filename or "").suffix.lower()) \
+        or CONTENT_TYPES.get((content_type or "").lower())
+    kind = next((k for signature, k in MAGIC_SIGNATURES if head.startswith(signature)), None)
+    if kind == "zip":
+        kind = declared if declared in ("docx", "xlsx") else "zip"
+    elif kind == "ole":
+        # Legacy .doc/.xls share the container; only Outlook messages are read
+        kind = "msg" if declared == "msg" else None
+    elif kind is None:
+        kind = declared
+    if (kind == "xlsx" and openpyxl is None) or (kind == "msg" and extract_msg is None):
+        return None
+    return kind
+
+def _zip_kind(payload):
+    """Office documents are zip files; tell them apart by their parts"""
+    try:
+        with zipfile.ZipFile(_as_file(payload)) as zf:
+            names = set(zf.namelist())
+    except zipfile.BadZipFile:
+        return "zip"
+    if "word/document.xml" in names:
+        return "docx"
+    if "xl/workbook.xml" in names:
+        return "xlsx" if openpyxl is not None else None
+    return "zip"
+
+def _record_extraction(kind, seconds, size):
+    with _stats_lock:
+        stats = _extraction_stats.setdefault(kind, {"count": 0, "seconds": 0.0, "bytes": 0})
+        stats["count"] += 1
+        stats["seconds"] += seconds
+        stats["bytes"] += size
+
+def get_extraction_stats():
+    """Per attachment kind: count, seconds and bytes extracted (containers include their contents)"""
+    with _stats_lock:
+        return {kind: dict(stats) for kind, stats in _extraction_stats.items()}
+
+def reset_extraction_stats():
+    with _stats_lock:
+        _extraction_stats.clear()
 
 def extract_text_from_pdf(pdf_bytes):
     text = ""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(pdf_bytes)
-        tmp.flush()
-        tmp_path = tmp.name
+    tmp_path = _write_temp(pdf_bytes, ".pdf")
 
     try:
         with fitz.open(tmp_path) as doc:
@@ -32,65 +188,377 @@ def extract_text_from_pdf(pdf_bytes):
     return text.strip()
 
 def extract_text_from_docx(docx_bytes):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-        tmp.write(docx_bytes)
-        tmp.flush()
-        tmp_path = tmp.name
-
+    tmp_path = _write_temp(docx_bytes, ".docx")
     doc = Document(tmp_path)
     text = "\n".join(p.text for p in doc.paragraphs if p.text.strip())
     os.remove(tmp_path)
     return text.strip()
 
-def extract_text_from_image(image_bytes):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp:
-        tmp.write(image_bytes)
-        tmp.flush()
-        text = pytesseract.image_to_string(tmp.name)
-    os.remove(tmp.name)
+def extract_text_from_image(image_bytes, inline=False):
+    """
+    OCR an image. Only the header is read before deciding: icons and
+    tracking pixels, and inline images (logos and signature art in HTML
+    mail) below the inline thresholds, are skipped.
+    """
+    with Image.open(_as_file(image_bytes)) as img:
+        width, height = img.size
+        if min(width, height) < IMAGE_MIN_DIMENSION:
+            return SMALL_IMAGE_MARKER
+        if inline and (_payload_size(image_bytes) < INLINE_IMAGE_MIN_BYTES
+                       or min(width, height) < INLINE_IMAGE_MIN_DIMENSION):
+            return INLINE_IMAGE_MARKER
+        text = pytesseract.image_to_string(img)
     return text.strip()
 
-def parse_eml_file(eml_path):
+def _tsv_row(values):
+    cells = ["" if v is None else str(v).replace("\t", " ").replace("\n", " ") for v in values]
+    while cells and not cells[-1].strip():
+        cells.pop()
+    return "\t".join(cells)
+
+def extract_text_from_xlsx(xlsx_bytes):
+    """Cell values as tab-separated rows, read sheet by sheet in read-only mode"""
+    workbook = openpyxl.load_workbook(_as_file(xlsx_bytes), read_only=True, data_only=True)
+    lines, rows = [], 0
+    try:
+        for sheet in workbook.worksheets:
+            lines.append(f"# Sheet: {sheet.title}")
+            for values in sheet.iter_rows(values_only=True):
+                if rows >= SPREADSHEET_MAX_ROWS:
+                    break
+                row = _tsv_row(values)
+                if row:
+                    lines.append(row)
+                    rows += 1
+    finally:
+        workbook.close()
+    return "\n".join(lines).strip()
+
+def extract_text_from_csv(csv_bytes):
+    """Rows as tab-separated text, with the delimiter sniffed from the first lines"""
+    text = io.TextIOWrapper(_as_file(csv_bytes), encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        sample = text.read(8192)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        lines = []
+        for values in csv.reader(text, dialect):
+            if len(lines) >= SPREADSHEET_MAX_ROWS:
+                break
+            row = _tsv_row(values)
+            if row:
+                lines.append(row)
+    finally:
+        text.detach()  # leave the caller's buffer open
+    return "\n".join(lines)
+
+def extract_text_from_plain(text_bytes):
+    return _as_file(text_bytes).read().decode("utf-8", errors="replace").strip()
+
+def extract_text_from_zip(zip_bytes, depth=1):
+    """
+    Text of each supported member under a "--- name ---" heading. Members
+    are read one at a time within the same size limits as attachments.
+    """
+    sections = []
+    total = 0
+    with zipfile.ZipFile(_as_file(zip_bytes)) as zf:
+        members = [info for info in zf.infolist() if not info.is_dir()]
+        for info in members[:ZIP_MAX_MEMBERS]:
+            with zf.open(info) as member:
+                kind = sniff_type(member.read(SNIFF_BYTES), info.filename)
+            if kind is None:
+                continue
+            if info.file_size > MAX_ATTACHMENT_BYTES:
+                content = TOO_LARGE_MARKER
+            elif total + info.file_size > MAX_EMAIL_BYTES:
+                content = EMAIL_TOO_LARGE_MARKER
+            else:
+                with zf.open(info) as member:
+                    # The declared size can lie; never read past the limit
+                    data = member.read(MAX_ATTACHMENT_BYTES + 1)
+                total += len(data)
+                if len(data) > MAX_ATTACHMENT_BYTES:
+                    content = TOO_LARGE_MARKER
+                else:
+                    content = extract_attachment_text(info.filename, data, depth=depth)
+            sections.append(f"--- {info.filename} ---\n{content}")
+    if len(members) > ZIP_MAX_MEMBERS:
+        sections.append(f"--- {len(members) - ZIP_MAX_MEMBERS} more files not extracted ---")
+    return "\n\n".join(sections)
+
+def _render_email(email_data):
+    lines = [
+        f"Subject: {email_data.subject or ''}",
+        f"From: {email_data.sender or ''}",
+        f"Date: {email_data.date or ''}",
+        "",
+        (email_data.body or "").strip()
+    ]
+    for att in email_data.attachments:
+        lines += ["", f"--- {att.filename} ---", att.content]
+    return "\n".join(lines).strip()
+
+def extract_text_from_eml(eml_bytes, depth=1):
+    """A forwarded or attached email: headers, body and its own attachments"""
+    tmp_path = _write_temp(eml_bytes, ".eml")
+    try:
+        return _render_email(parse_eml_file(tmp_path, depth=depth))
+    finally:
+        os.remove(tmp_path)
+
+def extract_text_from_msg(msg_bytes, depth=1):
+    """An attached Outlook message, rendered like an attached .eml"""
+    tmp_path = _write_temp(msg_bytes, ".msg")
+    try:
+        msg = extract_msg.Message(tmp_path)
+        try:
+            attachments = []
+            for att in msg.attachments:
+                filename = getattr(att, "longFilename", None) or getattr(att, "shortFilename", None)
+                data = getattr(att, "data", None)
+                if filename and isinstance(data, bytes):
+                    attachments.append(Attachment(filename, extract_attachment_text(filename, data, depth=depth)))
+            return _render_email(ParsedEmail(
+                subject=msg.subject, sender=msg.sender, date=msg.date, body=msg.body, attachments=attachments
+            ))
+        finally:
+            msg.close()
+    finally:
+        os.remove(tmp_path)
+
+EXTRACTORS = {
+    "pdf": extract_text_from_pdf,
+    "docx": extract_text_from_docx,
+    "xlsx": extract_text_from_xlsx,
+    "csv": extract_text_from_csv,
+    "text": extract_text_from_plain,
+    "zip": extract_text_from_zip,
+    "eml": extract_text_from_eml,
+    "msg": extract_text_from_msg
+}
+
+def extract_attachment_text(filename, payload, content_type=None, inline=False, depth=0):
+    """
+    Sniff the attachment type and extract its text; payload is bytes or a
+    binary file object. `depth` is how deeply the attachment's email is
+    nested in attached emails and archives.
+    """
+    source = _as_file(payload)
+    head = source.read(SNIFF_BYTES)
+    kind = sniff_type(head, filename, content_type)
+    if kind == "zip":
+        kind = _zip_kind(payload)
+    if kind is None:
+        return UNSUPPORTED_MARKER
+    if kind in CONTAINER_KINDS and depth >= MAX_ATTACHMENT_DEPTH:
+        return TOO_DEEP_MARKER
+
+    start = time.perf_counter()
+    try:
+        if kind == "image":
+            return extract_text_from_image(payload, inline=inline)
+        if kind in CONTAINER_KINDS:
+            return EXTRACTORS[kind](payload, depth=depth + 1)
+        return EXTRACTORS[kind](payload)
+    except Exception as e:
+        logger.warning(f"Could not extract {kind} attachment {filename}: {e}")
+        return EXTRACTION_FAILED_MARKER
+    finally:
+        seconds, size = time.perf_counter() - start, _payload_size(payload)
+        _record_extraction(kind, seconds, size)
+        note_attachment(filename, kind, seconds, size)
+
+def _is_inline(part):
+    disposition = part.get_content_disposition()
+    return disposition == "inline" or (disposition is None and part.get("Content-ID") is not None)
+
+def _attachment_filename(part):
+    """Filename of an attachment part, or None for body parts"""
+    filename = part.get_filename()
+    if part.get_content_type() == "message/rfc822":
+        return filename or "attached.eml"
+    if part.get_content_type() == "text/plain" and part.get_content_disposition() != "attachment":
+        return None
+    return filename
+
+def _iter_parts(part):
+    """Like walk(), but attached messages are left whole as attachments"""
+    yield part
+    if part.get_content_maintype() == "multipart":
+        for subpart in part.get_payload():
+            yield from _iter_parts(subpart)
+
+class _TextSink:
+    """Collects a decoded text part"""
+    def __init__(self, part, on_close):
+        self.part = part
+        self.data = bytearray()
+        self.on_close = on_close
+
+    def write(self, data):
+        self.data += data
+
+    def close(self):
+        charset = self.part.get_content_charset() or "utf-8"
+        try:
+            text = self.data.decode(charset, errors="replace")
+        except LookupError:
+            text = self.data.decode("utf-8", errors="replace")
+        self.on_close(text.replace("\r\n", "\n"))
+
+class _AttachmentSink:
+    """
+    Spools a decoded attachment, refusing data beyond its size limit. The
+    first bytes are sniffed as they arrive and an unsupported type stops
+    decoding straight away.
+    """
+    def __init__(self, limit, on_close, sniff):
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=ATTACHMENT_SPOOL_BYTES)
+        self.limit = limit
+        self.size = 0
+        self.too_large = False
+        self.on_close = on_close
+        self.sniff = sniff
+        self.head = b""
+        self.sniffed = False
+        self.kind = None
+
+    def _sniff(self):
+        self.sniffed = True
+        self.kind = self.sniff(self.head)
+
+    def write(self, data):
+        if not self.sniffed:
+            self.head += data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self._sniff()
+        if self.sniffed and self.kind is None:
+            return False
+        self.size += len(data)
+        if self.size > self.limit:
+            self.too_large = True
+        else:
+            self.buffer.write(data)
+        if self.too_large and self.sniffed:
+            return False
+
+    def close(self):
+        try:
+            if not self.sniffed:
+                self._sniff()
+            self.on_close(self)
+        finally:
+            self.buffer.close()
+
+def parse_eml_file_streaming(eml_path, depth=0):
+    """
+    Parse an .eml without loading it: attachments are decoded incrementally
+    into spooled buffers and skipped once they exceed MAX_ATTACHMENT_BYTES or
+    the email's attachments exceed MAX_EMAIL_BYTES in total. Decoding stops
+    after the first bytes of attachments that cannot be extracted.
+    """
+    body_parts, html_parts, attachments = [], [], []
+    decoded_total = [0]
+
+    def on_part(part):
+        content_type = part.get_content_type()
+        filename = _attachment_filename(part)
+
+        if content_type == "text/plain" and not filename:
+            return _TextSink(part, body_parts.append)
+        elif content_type == "text/html" and not body_parts and not html_parts:
+            return _TextSink(part, html_parts.append)
+        elif filename:
+            inline = _is_inline(part)
+
+            def finish(sink):
+                if sink.kind is None:
+                    extracted = UNSUPPORTED_MARKER
+                else:
+                    decoded_total[0] += min(sink.size, sink.limit)
+                    if sink.too_large:
+                        extracted = TOO_LARGE_MARKER if sink.limit == MAX_ATTACHMENT_BYTES else EMAIL_TOO_LARGE_MARKER
+                    else:
+                        extracted = extract_attachment_text(filename, sink.buffer, content_type, inline, depth)
+                attachments.append(Attachment(filename, extracted))
+
+            limit = max(0, min(MAX_ATTACHMENT_BYTES, MAX_EMAIL_BYTES - decoded_total[0]))
+            return _AttachmentSink(limit, finish, lambda head: sniff_type(head, filename, content_type))
+        return None
+
+    with open(eml_path, "rb") as f:
+        headers = stream_parse(f, on_part, chunk_size=MIME_CHUNK_SIZE, walk_nested=False)
+
+    body = "".join(body_parts)
+    if not body and html_parts:
+        body = html_to_text(html_parts[0])
+
+    return ParsedEmail(
+        subject=headers["subject"], sender=headers["from"], to=headers["to"], date=headers["date"],
+        body=body, attachments=attachments
+    )
+
+def parse_eml_file(eml_path, depth=0):
+    if os.path.getsize(eml_path) >= STREAMING_PARSE_MIN_BYTES:
+        return parse_eml_file_streaming(eml_path, depth)
+
     with open(eml_path, "rb") as f:
         msg = BytesParser(policy=policy.default).parse(f)
 
-    email_data = {
-        "subject": msg["subject"],
-        "from": msg["from"],
-        "to": msg["to"],
-        "date": msg["date"],
-        "body": "",
-        "attachments": []
-    }
+    body_parts, attachments = [], []
+    decoded_total = 0
 
-    for part in msg.walk():
+    for part in _iter_parts(msg):
         content_type = part.get_content_type()
-        filename = part.get_filename()
+        filename = _attachment_filename(part)
 
-        if content_type == "text/plain":
-            email_data["body"] += part.get_content()
-        elif content_type == "text/html" and not email_data["body"]:
-            soup = BeautifulSoup(part.get_content(), "html.parser")
-            email_data["body"] += soup.get_text()
+        if content_type == "text/plain" and not filename:
+            body_parts.append(part.get_content())
+        elif content_type == "text/html" and not any(body_parts):
+            body_parts.append(html_to_text(part.get_content()))
         elif filename:
-            ext = Path(filename).suffix.lower()
-            content_bytes = part.get_payload(decode=True)
-
-            if ext == ".pdf":
-                extracted = extract_text_from_pdf(content_bytes)
-            elif ext == ".docx":
-                extracted = extract_text_from_docx(content_bytes)
-            elif ext in [".jpg", ".jpeg", ".png"]:
-                extracted = extract_text_from_image(content_bytes)
+            if content_type == "message/rfc822":
+                content_bytes = part.get_payload(0).as_bytes()
             else:
-                extracted = "[UNSUPPORTED ATTACHMENT TYPE]"
+                content_bytes = part.get_payload(decode=True) or b""
+
+            if sniff_type(content_bytes[:SNIFF_BYTES], filename, content_type) is None:
+                extracted = UNSUPPORTED_MARKER
+            else:
+                decoded_total += len(content_bytes)
+                if len(content_bytes) > MAX_ATTACHMENT_BYTES:
+                    extracted = TOO_LARGE_MARKER
+                elif decoded_total > MAX_EMAIL_BYTES:
+                    extracted = EMAIL_TOO_LARGE_MARKER
+                else:
+                    extracted = extract_attachment_text(
+                        filename, content_bytes, content_type, _is_inline(part), depth
+                    )
+
+            attachments.append(Attachment(filename, extracted))
+
+    return ParsedEmail(
+        subject=msg["subject"], sender=msg["from"], to=msg["to"], date=msg["date"],
+        body="".join(body_parts), attachments=attachments
+    )
 
-            email_data["attachments"].append({
-                "filename": filename,
-                "content": extracted
-            })
+def parse_email_headers(filepath):
+    """Subject, from, to and date without reading the body or attachments"""
+    if Path(filepath).suffix.lower() != ".eml":
+        return {"subject": Path(filepath).stem, "from": "unknown", "to": "unknown", "date": "unknown"}
 
-    return email_data
+    lines = []
+    with open(filepath, "rb") as f:
+        for line in f:
+            if not line.strip():
+                break
+            lines.append(line)
+    msg = BytesHeaderParser(policy=policy.default).parsebytes(b"".join(lines))
+    return {"subject": msg["subject"], "from": msg["from"], "to": msg["to"], "date": msg["date"]}
 
 def parse_email_file(filepath):
     ext = Path(filepath).suffix.lower()
@@ -98,33 +566,12 @@ def parse_email_file(filepath):
         return parse_eml_file(filepath)
     elif ext == ".txt":
         with open(filepath, "r", encoding="utf-8") as f:
-            return {
-                "subject": Path(filepath).stem,
-                "from": "unknown",
-                "to": "unknown",
-                "date": "unknown",
-                "body": f.read(),
-                "attachments": []
-            }
+            return ParsedEmail(subject=Path(filepath).stem, body=f.read())
     elif ext == ".docx":
         text = extract_text_from_docx(Path(filepath).read_bytes())
-        return {
-            "subject": Path(filepath).stem,
-            "from": "unknown",
-            "to": "unknown",
-            "date": "unknown",
-            "body": text,
-            "attachments": []
-        }
+        return ParsedEmail(subject=Path(filepath).stem, body=text)
     elif ext == ".pdf":
         text = extract_text_from_pdf(Path(filepath).read_bytes())
-        return {
-            "subject": Path(filepath).stem,
-            "from": "unknown",
-            "to": "unknown",
-            "date": "unknown",
-            "body": text,
-            "attachments": []
-        }
+        return ParsedEmail(subject=Path(filepath).stem, body=text)
     else:
         raise ValueError(f"Unsupported file type: {filepath}")
\ No newline at end of file
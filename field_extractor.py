@@ -1,27 +1,24 @@
 import re
+import asyncio
 import spacy
 from datetime import datetime
-from config import (
-    CURRENCY_SYMBOLS,
-    CURRENCY_CODES,
-    ALLOWED_TAGS,
-    DATE_FORMATS,
-    FIELD_PATTERNS,
-    AMOUNT_REGEX
-)
+from config import DATE_FORMATS, DATE_PATTERNS
+from rules_registry import get_rules
+from records import ExtractedFields
 
 nlp = spacy.load("en_core_web_sm")
 
-def extract_amounts(text):
+def extract_amounts(text, rules=None):
     """Extract amounts with currency information using centralized regex"""
-    matches = re.finditer(AMOUNT_REGEX, text, flags=re.IGNORECASE | re.VERBOSE)
+    rules = rules or get_rules()
+    matches = rules.amount_re.finditer(text)
     results = []
     
     for match in matches:
         curr = (match.group("curr") or match.group("curr2")).upper()
         amt = match.group("amt") or match.group("amt2")
         
-        currency = CURRENCY_SYMBOLS.get(curr, curr if curr in CURRENCY_CODES else None)
+        currency = rules.currency_symbols.get(curr, curr if curr in rules.currency_codes else None)
         if not currency:
             continue
             
@@ -36,17 +33,13 @@ def extract_amounts(text):
             
     return results
 
-def extract_dates(text):
+def extract_dates(text, doc=None):
     """Extract dates using both spaCy and regex patterns"""
-    doc = nlp(text)
+    doc = doc if doc is not None else nlp(text)
     dates = [ent.text for ent in doc.ents if ent.label_ == "DATE"]
     
     # Add regex matches
-    patterns = [
-        r"\d{1,2}[-\s]\w{3}[-\s]\d{4}",  # 15-Mar-2025
-        r"\w+\s\d{1,2},\s\d{4}"           # March 15, 2025
-    ]
-    for pattern in patterns:
+    for pattern in DATE_PATTERNS:
         dates.extend(re.findall(pattern, text, re.IGNORECASE))
         
     return list(set(dates))
@@ -67,9 +60,9 @@ def validate_date(date_str):
             continue
     return None
 
-def extract_names(text):
+def extract_names(text, doc=None):
     """Extract organization and person names"""
-    doc = nlp(text)
+    doc = doc if doc is not None else nlp(text)
     ignore_terms = {"USD", "ATTN", "DATE", "BANK", "FAX"}
     
     return list(set(
@@ -79,34 +72,44 @@ def extract_names(text):
         and not any(term in ent.text.upper() for term in ignore_terms)
     ))
 
-def extract_additional_fields(text):
+def extract_additional_fields(text, rules=None):
     """Extract fields using centralized patterns"""
+    rules = rules or get_rules()
     results = {}
-    for field, pattern in FIELD_PATTERNS.items():
-        match = re.search(pattern, text, re.IGNORECASE)
+    for field, pattern in rules.field_patterns.items():
+        match = pattern.search(text)
         if match:
             results[field] = match.group(1).strip()
     return results
 
-async def extract_all_fields(text):
-    """Main extraction function with error handling"""
+def extract_fields(text, rules=None):
+    """
+    Synchronous extraction (CPU bound); the spaCy parse is shared by dates and
+    names. `text` is a string or a list of segments (body, attachment texts),
+    which are parsed one by one rather than joined into a single copy.
+    Returns an ExtractedFields record.
+    """
+    rules = rules or get_rules()
+    segments = [text] if isinstance(text, str) else [segment for segment in text if segment]
     try:
-        return {
-            "amounts": [
+        fields = ExtractedFields()
+        dates, names = set(), set()
+        for segment, doc in zip(segments, nlp.pipe(segments)):
+            fields.amounts.extend(
                 {"amount": amt["amount"], "currency": amt["currency"]}
-                for amt in extract_amounts(text)
-            ],
-            "dates": [
-                validate_date(date) 
-                for date in extract_dates(text) 
-                if validate_date(date)
-            ],
-            "names": extract_names(text),
-            **extract_additional_fields(text)
-        }
+                for amt in extract_amounts(segment, rules)
+            )
+            dates.update(extract_dates(segment, doc))
+            names.update(extract_names(segment, doc))
+            for field, value in extract_additional_fields(segment, rules).items():
+                fields.patterns.setdefault(field, value)
+        validated_dates = (validate_date(date) for date in dates)
+        fields.dates = [date for date in validated_dates if date]
+        fields.names = list(names)
+        return fields
     except Exception as e:
-        return {
-            "amounts": [],
-            "dates": [],
-            "names": []
-        }
\ No newline at end of file
+        return ExtractedFields()
+
+async def extract_all_fields(text, rules=None):
+    """Main extraction function with error handling; runs on a worker thread"""
+    return await asyncio.get_running_loop().run_in_executor(None, extract_fields, text, rules)
@@ -0,0 +1,480 @@
+# hash_index.py
+"""
+Compact on-disk index of body hashes for long dedup histories.
+
+Layout under the index directory:
+
+    window-<start>/shard-<nn>.idx   sorted 16-byte hashes, memory-mapped
+    delta-<start>.log               append-only 16-byte hashes not merged yet
+    delta-<start>.merging           a delta being merged into its window
+    bloom.bin                       Bloom filter saved by close()
+    index.lock                      held by the process that has the index open
+
+Hashes are truncated to 16 bytes and bucketed into time windows of
+`window_seconds` (by insertion time); retention drops whole windows. Each
+window is split into shards by the leading byte. An in-memory Bloom filter
+covers every live hash, so a lookup for a new hash (the common case) is
+answered without touching disk. Recent hashes live in memory and in the
+delta logs until a background merge folds them into the sorted shards.
+
+The Bloom filter and the delta logs belong to one process, so only one
+process may have an index directory open: a second HashIndex on the same
+directory raises IndexLockedError until the first is closed.
+"""
+
+import os
+import re
+import math
+import mmap
+import time
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Optional: the single-process lock is POSIX only
+    fcntl = None
+
+HASH_BYTES = 16
+_WINDOW_RE = re.compile(r"^window-(\d+)$")
+_DELTA_RE = re.compile(r"^delta-(\d+)\.(log|merging)$")
+LOCK_NAME = "index.lock"
+
+
+class IndexLockedError(RuntimeError):
+    """The index directory is already open in another process"""
+
+
+def truncate_hash(value):
+    """16-byte key from a hex digest or raw digest bytes"""
+    if isinstance(value, str):
+        value = bytes.fromhex(value[:HASH_BYTES * 2])
+    if len(value) < HASH_BYTES:
+        raise ValueError(f"Hash must be at least {HASH_BYTES} bytes")
+    return bytes(value[:HASH_BYTES])
+
+
+def _sorted_unique(records):
+    """Sort an S16 array and drop repeats"""
+    records = np.sort(records)
+    if len(records) > 1:
+        rows = records.view(np.uint8).reshape(-1, HASH_BYTES)
+        keep = np.ones(len(records), dtype=bool)
+        keep[1:] = (rows[1:] != rows[:-1]).any(axis=1)
+        records = records[keep]
+    return records
+
+
+class BloomFilter:
+    """
+    Bit array of a power-of-two size with k probes derived from the hash
+    itself (double hashing over its two 64-bit halves).
+    """
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(int(capacity), 1)
+        bits = -capacity * math.log(error_rate) / (math.log(2) ** 2)
+        self.size = 1 << max(int(math.ceil(math.log2(bits))), 3)
+        self.probes = min(max(round(self.size / capacity * math.log(2)), 1), 16)
+        self.capacity = capacity
+        self.bits = bytearray(self.size // 8)
+
+    def _positions(self, key):
+        h1 = int.from_bytes(key[:8], "big")
+        h2 = int.from_bytes(key[8:16], "big")
+        mask = self.size - 1
+        return [(h1 + i * h2) & mask for i in range(self.probes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def add_many(self, records, chunk=1 << 20):
+        """Vectorized add of an S16 array (same positions as add())"""
+        bits = np.frombuffer(self.bits, dtype=np.uint8)
+        mask = np.uint64(self.size - 1)
+        for start in range(0, len(records), chunk):
+            halves = records[start:start + chunk].view(">u8").reshape(-1, 2).astype(np.uint64)
+            h1, h2 = halves[:, 0], halves[:, 1]
+            for i in range(self.probes):
+                pos = (h1 + np.uint64(i) * h2) & mask  # wraps mod 2**64 like the masked int math
+                np.bitwise_or.at(bits, (pos >> np.uint64(3)).astype(np.intp),
+                                 np.left_shift(1, (pos & np.uint64(7)).astype(np.uint8)).astype(np.uint8))
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+    def save(self, path, entries):
+        with open(path + ".tmp", "wb") as f:
+            f.write(np.array([self.size, self.probes, self.capacity, entries], dtype="<u8").tobytes())
+            f.write(self.bits)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path, entries):
+        """Saved filter, or None if missing or saved for a different entry count"""
+        try:
+            with open(path, "rb") as f:
+                size, probes, capacity, saved_entries = (int(v) for v in np.frombuffer(f.read(32), dtype="<u8"))
+                if saved_entries != entries:
+                    return None
+                bloom = cls.__new__(cls)
+                bloom.size, bloom.probes, bloom.capacity = size, probes, capacity
+                bloom.bits = bytearray(f.read())
+        except (OSError, ValueError):
+            return None
+        return bloom if len(bloom.bits) == size // 8 else None
+
+
+class HashIndex:
+    def __init__(self, path, shards=16, window_seconds=30 * 86400, retention_seconds=None,
+                 error_rate=0.001, capacity=1_000_000, merge_threshold=100_000, sync=False):
+        if not 1 <= shards <= 256:
+            raise ValueError("shards must be between 1 and 256")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._lock_file = self._acquire_lock()
+        self.shards = shards
+        self.window_seconds = int(window_seconds)
+        self.retention_seconds = retention_seconds
+        self.error_rate = error_rate
+        self.merge_threshold = merge_threshold
+        self.sync = sync
+
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._merge_thread = None
+        self._bloom_pending = None
+        self.delta = {}      # window -> set of keys not merged yet
+        self.merging = {}    # window -> set of keys being merged
+        self._delta_files = {}
+        self.lookups = {"bloom_rejects": 0, "memory_hits": 0, "disk_searches": 0}
+
+        self._recover_merges()
+        self.segments = {w: self._open_window(w) for w in self._window_starts()}
+        for name in os.listdir(path):
+            match = _DELTA_RE.match(name)
+            if match:
+                self.delta[int(match.group(1))] = self._read_delta(os.path.join(path, name))
+        self.purge_expired(rebuild=False)
+        self.bloom = BloomFilter.load(self._bloom_path(), self.entry_count()) or self._build_bloom(capacity)
+
+    # --- files -------------------------------------------------------------
+
+    def _acquire_lock(self):
+        lock_file = open(os.path.join(self.path, LOCK_NAME), "a+")
+        if fcntl is None:
+            return lock_file
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.seek(0)
+            owner = lock_file.read().strip() or "unknown"
+            lock_file.close()
+            raise IndexLockedError(
+                f"Hash index {self.path} is already open in another process (pid {owner}). "
+                f"An index directory has a single writer; unset DEDUP_INDEX_DIR for "
+                f"multi-process runs (worker.py --processes, orchestrator.py --workers)"
+            )
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        return lock_file
+
+    def _window_dir(self, window):
+        return os.path.join(self.path, f"window-{window}")
+
+    def _shard_path(self, window, shard):
+        return os.path.join(self._window_dir(window), f"shard-{shard:02x}.idx")
+
+    def _bloom_path(self):
+        return os.path.join(self.path, "bloom.bin")
+
+    def _window_starts(self):
+        return sorted(
+            int(m.group(1)) for m in map(_WINDOW_RE.match, os.listdir(self.path)) if m
+        )
+
+    def _open_window(self, window):
+        """Tuple of read-only mmaps (or None for empty shards) for one window"""
+        maps = []
+        for shard in range(self.shards):
+            path = self._shard_path(window, shard)
+            if not os.path.exists(path) or os.path.getsize(path) < HASH_BYTES:
+                maps.append(None)
+                continue
+            with open(path, "rb") as f:
+                maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return tuple(maps)
+
+    def _read_delta(self, path):
+        with open(path, "r+b") as f:
+            data = f.read()
+            usable = len(data) - len(data) % HASH_BYTES
+            if usable != len(data):
+                f.truncate(usable)  # torn trailing record from a crash mid-append
+        return {data[i:i + HASH_BYTES] for i in range(0, usable, HASH_BYTES)}
+
+    def _recover_merges(self):
+        """Fold deltas left behind by an interrupted merge back into the live logs"""
+        for name in os.listdir(self.path):
+            match = _DELTA_RE.match(name)
+            if match and match.group(2) == "merging":
+                merging = os.path.join(self.path, name)
+                keys = self._read_delta(merging)
+                live = os.path.join(self.path, f"delta-{match.group(1)}.log")
+                if os.path.exists(live):
+                    keys |= self._read_delta(live)
+                with open(live + ".tmp", "wb") as f:
+                    f.write(b"".join(keys))
+                os.replace(live + ".tmp", live)
+                os.remove(merging)
+
+    def _delta_file(self, window):
+        f = self._delta_files.get(window)
+        if f is None:
+            f = self._delta_files[window] = open(os.path.join(self.path, f"delta-{window}.log"), "ab")
+        return f
+
+    # --- lookups -----------------------------------------------------------
+
+    def _window_of(self, timestamp):
+        return int(timestamp // self.window_seconds) * self.window_seconds
+
+    def _search(self, mm, key):
+        lo, hi = 0, len(mm) // HASH_BYTES
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = mm[mid * HASH_BYTES:(mid + 1) * HASH_BYTES]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def __contains__(self, key):
+        return self.contains(key)
+
+    def contains(self, key):
+        key = truncate_hash(key)
+        if key not in self.bloom:
+            self.lookups["bloom_rejects"] += 1
+            return False
+        with self._lock:
+            if any(key in keys for keys in self.delta.values()) or \
+               any(key in keys for keys in self.merging.values()):
+                self.lookups["memory_hits"] += 1
+                return True
+            segments = self.segments
+        self.lookups["disk_searches"] += 1
+        shard = key[0] * self.shards >> 8
+        for window in sorted(segments, reverse=True):
+            mm = segments[window][shard]
+            if mm is not None and self._search(mm, key):
+                return True
+        return False
+
+    def add(self, key, timestamp=None):
+        key = truncate_hash(key)
+        window = self._window_of(time.time() if timestamp is None else timestamp)
+        with self._lock:
+            keys = self.delta.setdefault(window, set())
+            if key in keys:
+                return
+            keys.add(key)
+            f = self._delta_file(window)
+            f.write(key)
+            f.flush()
+            if self.sync:
+                os.fsync(f.fileno())
+            self.bloom.add(key)
+            if self._bloom_pending is not None:
+                self._bloom_pending.append(key)
+            pending = sum(len(k) for k in self.delta.values())
+        if self.merge_threshold and pending >= self.merge_threshold:
+            self.merge_in_background()
+
+    def add_many(self, records, timestamp=None):
+        """
+        Bulk load (e.g. importing history): an S16 array or list of keys is
+        merged straight into its window's shards, bypassing the delta log.
+        """
+        if not isinstance(records, np.ndarray):
+            records = np.array([truncate_hash(k) for k in records], dtype=f"S{HASH_BYTES}")
+        if not len(records):
+            return
+        window = self._window_of(time.time() if timestamp is None else timestamp)
+        with self._merge_lock:
+            self._merge_window(window, records)
+            with self._lock:
+                self.segments = {**self.segments, window: self._open_window(window)}
+                self.bloom.add_many(records)
+                if self._bloom_pending is not None:
+                    self._bloom_pending.append(records)
+        if self.entry_count() > self.bloom.capacity:
+            self.rebuild_bloom()
+
+    def check_and_add(self, key, timestamp=None):
+        """True if the hash was already present; otherwise record it and return False"""
+        with self._lock:
+            if self.contains(key):
+                return True
+            self.add(key, timestamp)
+            return False
+
+    # --- merging and retention ---------------------------------------------
+
+    def merge_in_background(self):
+        """Start a merge thread unless one is already running"""
+        with self._lock:
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return self._merge_thread
+            self._merge_thread = threading.Thread(target=self.merge, name="hash-index-merge", daemon=True)
+            self._merge_thread.start()
+            return self._merge_thread
+
+    def merge(self):
+        """Fold the delta logs into the sorted shard files, then apply retention"""
+        with self._merge_lock:
+            with self._lock:
+                for window, f in self._delta_files.items():
+                    f.close()
+                self._delta_files = {}
+                for window in self.delta:
+                    live = os.path.join(self.path, f"delta-{window}.log")
+                    if os.path.exists(live):
+                        os.replace(live, os.path.join(self.path, f"delta-{window}.merging"))
+                self.merging, self.delta = self.delta, {}
+
+            for window, keys in self.merging.items():
+                if keys:
+                    self._merge_window(window, np.frombuffer(b"".join(keys), dtype=f"S{HASH_BYTES}"))
+
+            with self._lock:
+                segments = dict(self.segments)
+                for window in self.merging:
+                    segments[window] = self._open_window(window)
+                self.segments = segments
+                for window in self.merging:
+                    merging = os.path.join(self.path, f"delta-{window}.merging")
+                    if os.path.exists(merging):
+                        os.remove(merging)
+                self.merging = {}
+
+            self.purge_expired()
+            if self.entry_count() > self.bloom.capacity:
+                self.rebuild_bloom()
+
+    def _merge_window(self, window, new):
+        os.makedirs(self._window_dir(window), exist_ok=True)
+        shard_of = (new.view(np.uint8).reshape(-1, HASH_BYTES)[:, 0].astype(np.uint16) * self.shards) >> 8
+        for shard in np.unique(shard_of):
+            path = self._shard_path(window, int(shard))
+            old = np.fromfile(path, dtype=f"S{HASH_BYTES}") if os.path.exists(path) else new[:0]
+            merged = _sorted_unique(np.concatenate([old, new[shard_of == shard]]))
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(merged.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+
+    def purge_expired(self, now=None, rebuild=True):
+        """Drop windows older than the retention period; returns the windows removed"""
+        if not self.retention_seconds:
+            return []
+        cutoff = (time.time() if now is None else now) - self.retention_seconds
+        with self._lock:
+            expired = [w for w in set(self.segments) | set(self.delta)
+                       if w + self.window_seconds <= cutoff]
+            if not expired:
+                return []
+            segments = dict(self.segments)
+            for window in expired:
+                segments.pop(window, None)
+                self.delta.pop(window, None)
+                f = self._delta_files.pop(window, None)
+                if f is not None:
+                    f.close()
+            self.segments = segments
+
+        for window in expired:
+            log = os.path.join(self.path, f"delta-{window}.log")
+            if os.path.exists(log):
+                os.remove(log)
+            directory = self._window_dir(window)
+            if os.path.isdir(directory):
+                for name in os.listdir(directory):
+                    os.remove(os.path.join(directory, name))
+                os.rmdir(directory)
+        if rebuild:
+            self.rebuild_bloom()
+        return expired
+
+    def _build_bloom(self, capacity):
+        with self._lock:  # consistent snapshot: a merge moves keys between these under the lock
+            maps = self._mapped_shards()
+            keys = [k for d in (self.delta, self.merging) for window_keys in d.values() for k in window_keys]
+            total = self.entry_count()
+        bloom = BloomFilter(max(capacity, 2 * total), self.error_rate)
+        for mm in maps:
+            bloom.add_many(np.frombuffer(mm, dtype=f"S{HASH_BYTES}"))
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    def rebuild_bloom(self):
+        """Resize and refill the Bloom filter (expired hashes drop out); adds continue meanwhile"""
+        with self._lock:
+            self._bloom_pending = []
+        bloom = self._build_bloom(self.bloom.capacity)
+        with self._lock:
+            for pending in self._bloom_pending:
+                if isinstance(pending, np.ndarray):
+                    bloom.add_many(pending)
+                else:
+                    bloom.add(pending)
+            self._bloom_pending = None
+            self.bloom = bloom
+
+    # --- introspection -----------------------------------------------------
+
+    def _mapped_shards(self):
+        return [mm for maps in self.segments.values() for mm in maps if mm is not None]
+
+    def entry_count(self):
+        with self._lock:
+            on_disk = sum(len(mm) for mm in self._mapped_shards()) // HASH_BYTES
+            in_memory = sum(len(k) for k in self.delta.values()) + sum(len(k) for k in self.merging.values())
+        return on_disk + in_memory
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": self.entry_count(),
+                "windows": len(set(self.segments) | set(self.delta)),
+                "delta_entries": sum(len(k) for k in self.delta.values()),
+                "bloom_bytes": self.bloom.nbytes,
+                "bloom_probes": self.bloom.probes,
+                "disk_bytes": sum(len(mm) for mm in self._mapped_shards()),
+                **self.lookups
+            }
+
+    def close(self):
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            for f in self._delta_files.values():
+                f.close()
+            self._delta_files = {}
+            self.bloom.save(self._bloom_path(), self.entry_count())
+            self._lock_file.close()  # releases the lock
@@ -0,0 +1,166 @@
+# html_text.py
+"""
+Plain text from HTML email bodies in one linear pass, without building a
+document tree.
+
+Parser events (from lxml's libxml2 parser when installed, otherwise the
+stdlib HTMLParser) go straight to a collector that drops script, style and
+hidden content, breaks lines at block elements and writes table rows as
+tab-separated lines, so amounts stay next to their labels.
+"""
+
+import re
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:  # Optional: faster parsing
+    etree = None
+
+SKIP_TAGS = {"head", "script", "style", "noscript", "template", "title", "object", "svg"}
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+    "meta", "param", "source", "track", "wbr"
+}
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "caption", "dd", "div",
+    "dl", "dt", "fieldset", "figcaption", "figure", "footer", "form", "h1",
+    "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol",
+    "p", "pre", "section", "table", "tbody", "tfoot", "thead", "tr", "ul"
+}
+CELL_TAGS = {"td", "th"}
+# Elements a new sibling closes implicitly; the stdlib parser does not know this
+IMPLIED_END_TAGS = {"p", "li", "dt", "dd", "tr", "td", "th", "option"}
+
+_HIDDEN_STYLE = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden|mso-hide\s*:\s*all", re.IGNORECASE)
+_SPACES = re.compile(r"[ \f\v\r\n\xa0]+")
+_CELL_PADDING = re.compile(r" *\t *")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def _is_hidden(attrs):
+    return "hidden" in attrs or bool(_HIDDEN_STYLE.search(attrs.get("style") or ""))
+
+
+class TextCollector:
+    """Parser target: start/end/data events in, text out of close()"""
+
+    def __init__(self):
+        self.pieces = []
+        self.skip_tag = None
+        self.skip_depth = 0
+        self.pre_depth = 0
+        self.cells = []  # cells seen in the current row, per open table
+
+    def start(self, tag, attrs):
+        tag = tag.lower()
+        if self.skip_depth:
+            if tag == self.skip_tag:
+                if self.skip_depth == 1 and tag in IMPLIED_END_TAGS:
+                    self.skip_depth = 0  # the hidden element ended here
+                else:
+                    self.skip_depth += 1
+                    return
+            else:
+                return
+        if tag in SKIP_TAGS or (tag not in VOID_TAGS and _is_hidden(attrs)):
+            self.skip_tag, self.skip_depth = tag, 1
+            return
+
+        if tag == "table":
+            self.cells.append(0)
+        elif tag == "tr" and self.cells:
+            self.cells[-1] = 0
+        elif tag in CELL_TAGS:
+            if self.cells and self.cells[-1]:
+                self.pieces.append("\t")
+            if self.cells:
+                self.cells[-1] += 1
+            return
+        elif tag == "pre":
+            self.pre_depth += 1
+        elif tag == "br":
+            self.pieces.append("\n")
+            return
+        if tag in BLOCK_TAGS:
+            self._break_line()
+
+    def end(self, tag):
+        tag = tag.lower()
+        if self.skip_depth:
+            if tag == self.skip_tag:
+                self.skip_depth -= 1
+            return
+        if tag in VOID_TAGS:
+            return
+        if tag == "table" and self.cells:
+            self.cells.pop()
+        elif tag == "pre" and self.pre_depth:
+            self.pre_depth -= 1
+        if tag in BLOCK_TAGS:
+            self._break_line()
+
+    def _break_line(self):
+        if self.pieces and self.pieces[-1] != "\n":
+            self.pieces.append("\n")
+
+    def data(self, text):
+        if self.skip_depth:
+            return
+        if self.pre_depth:
+            self.pieces.append(text.replace("\t", "    "))
+        else:
+            text = _SPACES.sub(" ", text.replace("\t", " "))
+            # Whitespace between blocks and cells is layout, not content
+            if text.startswith(" ") and (not self.pieces or self.pieces[-1][-1:] in ("\n", "\t", " ")):
+                text = text[1:]
+            if text:
+                self.pieces.append(text)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        text = "".join(self.pieces)
+        self.pieces = []
+        lines = (_CELL_PADDING.sub("\t", line.strip(" ")).rstrip("\t") for line in text.split("\n"))
+        text = "\n".join(line if line.strip() else "" for line in lines)
+        return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+class _StdlibParser(HTMLParser):
+    """Feeds stdlib HTMLParser events to a TextCollector"""
+
+    def __init__(self, target):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag, {name: value or "" for name, value in attrs})
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.target.end(tag)
+
+    def handle_endtag(self, tag):
+        self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+    def close(self):
+        super().close()
+        return self.target.close()
+
+
+def html_to_text(html, use_lxml=True):
+    """Readable text of an HTML document given as str"""
+    if not html:
+        return ""
+    if use_lxml and etree is not None:
+        parser = etree.HTMLParser(target=TextCollector(), remove_comments=True, remove_pis=True)
+        parser.feed(html)
+        return parser.close()
+    parser = _StdlibParser(TextCollector())
+    parser.feed(html)
+    return parser.close()
@@ -1,55 +1,441 @@
 # imap_watcher.py
+"""
+Watches any number of IMAP mailboxes and folders from one process.
+
+Every folder has a poller task that owns its IMAP connection; the blocking
+IMAPClient calls run on a thread pool of IMAP_IO_THREADS. New messages are
+downloaded, up to IMAP_PREFETCH unprocessed per folder, onto a round-robin
+scheduler from which IMAP_PROCESSING_WORKERS workers take one email at a
+time, so a folder with a large backlog cannot starve the others. All
+scheduling state lives on the event loop thread, so nothing is locked.
+
+Per folder, the UID up to which every message has been processed is
+checkpointed with the folder's UIDVALIDITY in IMAP_CHECKPOINT_DB, so a
+restart resumes where processing stopped. A folder without a valid
+checkpoint starts at its oldest unseen message. Processed messages are
+flagged \\Seen.
+
+Mailboxes come from IMAP_MAILBOXES_FILE (JSON or YAML), e.g.
+
+    [{"name": "agency", "host": "imap.example.com", "user": "agency@example.com",
+      "password_env": "AGENCY_IMAP_PASS", "folders": ["INBOX", "Notices"]}]
+
+or, without it, the single EMAIL_HOST / EMAIL_USER / EMAIL_PASS inbox.
+
+With IMAP_PROFILE set, processed emails are profiled (profiler.py) and a
+report batch is written every IMAP_METRICS_INTERVAL seconds.
+
+    python imap_watcher.py
+"""
 
 import os
+import re
+import json
 import time
+import sqlite3
 import asyncio
-from imapclient import IMAPClient
-import pyzmail
-from orchestrator import process_email
-from dotenv import load_dotenv
-
-# Optional .env support
-load_dotenv()
-
-# Defaults with fallback
-EMAIL_HOST = os.getenv("EMAIL_HOST", "outlook.office365.com")
-EMAIL_USER = os.getenv("EMAIL_USER", "your_email@outlook.com")
-EMAIL_PASS = os.getenv("EMAIL_PASS", "your_password_or_app_password")
-DOWNLOAD_DIR = "data/inputs"
-
-def save_eml_message(raw_message, uid):
-    eml_path = os.path.join(DOWNLOAD_DIR, f"email_{uid}.eml")
-    with open(eml_path, "wb") as f:
-        f.write(raw_message)
-    return eml_path
-
-async def check_and_process_emails():
-    with IMAPClient(EMAIL_HOST, ssl=True) as server:
-        server.login(EMAIL_USER, EMAIL_PASS)
-        server.select_folder("INBOX", readonly=False)
-
-        messages = server.search(["UNSEEN"])
-        if not messages:
-            print("No new emails.")
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from output_writer import write_atomic
+from profiler import ProfileSession
+from Logger import logger
+from config import (
+    INPUT_DIR,
+    EMAIL_HOST,
+    EMAIL_USER,
+    EMAIL_PASS,
+    IMAP_MAILBOXES_FILE,
+    IMAP_POLL_INTERVAL,
+    IMAP_IO_THREADS,
+    IMAP_PROCESSING_WORKERS,
+    IMAP_PREFETCH,
+    IMAP_CHECKPOINT_DB,
+    IMAP_METRICS_INTERVAL,
+    IMAP_PROFILE
+)
+
+try:
+    import yaml
+except ImportError:  # Optional: only needed for YAML mailbox files
+    yaml = None
+
+DOWNLOAD_DIR = INPUT_DIR
+SEEN_FLAG = b"\\Seen"
+
+
+def load_mailboxes(path=IMAP_MAILBOXES_FILE):
+    """One connection settings dict per watched (mailbox, folder)"""
+    if not path:
+        entries = [{"name": "inbox", "host": EMAIL_HOST, "user": EMAIL_USER, "password": EMAIL_PASS}]
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            if path.lower().endswith((".yaml", ".yml")):
+                if yaml is None:
+                    raise ImportError("PyYAML is required for YAML mailbox files (pip install pyyaml)")
+                data = yaml.safe_load(f)
+            else:
+                data = json.load(f)
+        entries = data.get("mailboxes", []) if isinstance(data, dict) else data
+
+    folders = []
+    for entry in entries:
+        name = entry.get("name") or entry["user"]
+        if "password_env" in entry:
+            password = os.getenv(entry["password_env"], "")
+        else:
+            password = entry.get("password", "")
+        for folder in entry.get("folders") or ["INBOX"]:
+            folders.append({
+                "key": f"{name}/{folder}",
+                "host": entry.get("host", EMAIL_HOST),
+                "port": entry.get("port"),
+                "ssl": entry.get("ssl", True),
+                "user": entry["user"],
+                "password": password,
+                "folder": folder
+            })
+    keys = [m["key"] for m in folders]
+    if len(set(keys)) != len(keys):
+        raise ValueError(f"Duplicate mailbox/folder entries in {path}")
+    return folders
+
+
+def connect_imap(mailbox):
+    """Logged-in IMAPClient for a mailbox settings dict"""
+    from imapclient import IMAPClient
+    client = IMAPClient(mailbox["host"], port=mailbox.get("port"), ssl=mailbox.get("ssl", True))
+    client.login(mailbox["user"], mailbox["password"])
+    return client
+
+
+def save_eml_message(raw_message, email_id, download_dir=DOWNLOAD_DIR):
+    eml_path = os.path.join(download_dir, f"{email_id}.eml")
+    return write_atomic(eml_path, raw_message, fsync=False)
+
+
+class CheckpointStore:
+    """Last fully processed UID per folder, with the UIDVALIDITY it belongs to"""
+
+    def __init__(self, path=IMAP_CHECKPOINT_DB):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS imap_checkpoints (
+                folder_key TEXT PRIMARY KEY,
+                uidvalidity INTEGER NOT NULL,
+                last_uid INTEGER NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, key):
+        """(uidvalidity, last_uid) or None"""
+        return self.conn.execute(
+            "SELECT uidvalidity, last_uid FROM imap_checkpoints WHERE folder_key = ?", (key,)
+        ).fetchone()
+
+    def set(self, key, uidvalidity, last_uid):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO imap_checkpoints VALUES (?, ?, ?, ?)",
+            (key, uidvalidity, last_uid, time.time())
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class FairScheduler:
+    """Round-robin over folders with queued emails, one email per turn"""
+
+    def __init__(self):
+        self.queues = {}
+        self.ready = deque()
+        self.wakeup = asyncio.Event()
+        self.closed = False
+
+    def register(self, key):
+        self.queues[key] = deque()
+
+    def put(self, key, job):
+        queue = self.queues[key]
+        if not queue:
+            self.ready.append(key)
+        queue.append(job)
+        self.wakeup.set()
+
+    def pending(self, key):
+        return len(self.queues[key])
+
+    async def get(self):
+        """Next job in folder rotation, or None once closed"""
+        while not self.ready and not self.closed:
+            self.wakeup.clear()
+            await self.wakeup.wait()
+        if self.closed:
+            return None
+        key = self.ready.popleft()
+        queue = self.queues[key]
+        job = queue.popleft()
+        if queue:
+            self.ready.append(key)
+        return job
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+
+
+class FolderWatcher:
+    """Polls one folder and tracks which of its messages are done"""
+
+    def __init__(self, mailbox, watcher):
+        self.mailbox = mailbox
+        self.key = mailbox["key"]
+        self.watcher = watcher
+        self.email_prefix = re.sub(r"[^A-Za-z0-9]+", "_", self.key).strip("_")
+        self.client = None
+        stored = watcher.checkpoints.get(self.key)
+        self.uidvalidity, self.checkpoint = stored if stored else (None, None)
+        self.fetched = self.checkpoint   # highest UID downloaded
+        self.in_flight = {}              # uid -> received time, queued or processing
+        self.to_flag = []
+        self.room = asyncio.Event()
+        self.server_uid = None
+        self.unfetched = 0
+        self.stats = {"processed": 0, "failed": 0, "errors": 0, "last_latency": None}
+
+    def _poll_sync(self, flag_uids, after_uid, known_validity, room):
+        """One poll's blocking IMAP round trips and downloads; runs on the IO pool"""
+        if self.client is None:
+            self.client = self.watcher.client_factory(self.mailbox)
+        client = self.client
+        status = client.select_folder(self.mailbox["folder"])
+        validity = status[b"UIDVALIDITY"]
+        baseline = None
+        if validity != known_validity or after_uid is None:
+            # First run, or the server renumbered the folder
+            unseen = client.search(["UNSEEN"])
+            baseline = after_uid = min(unseen) - 1 if unseen else max(status.get(b"UIDNEXT", 1) - 1, 0)
+        elif flag_uids:
+            client.add_flags(flag_uids, [SEEN_FLAG])
+
+        # "n:*" always matches the newest message, even below n
+        uids = sorted(uid for uid in client.search(["UID", f"{after_uid + 1}:*"]) if uid > after_uid)
+        batch = uids[:max(room, 0)]
+        fetched = client.fetch(batch, ["BODY.PEEK[]", "INTERNALDATE"]) if batch else {}
+        messages = []
+        for uid in batch:
+            data = fetched.get(uid)
+            if data is None:
+                continue  # expunged since the search
+            email_id = f"{self.email_prefix}_{uid}"
+            path = save_eml_message(data[b"BODY[]"], email_id, self.watcher.download_dir)
+            internal_date = data.get(b"INTERNALDATE")
+            received = internal_date.timestamp() if internal_date else time.time()
+            messages.append({"uid": uid, "path": path, "email_id": email_id, "received": received})
+        return {
+            "uidvalidity": validity,
+            "baseline": baseline,
+            "server_uid": max([status.get(b"UIDNEXT", 1) - 1] + uids),
+            "last_uid": batch[-1] if batch else after_uid,
+            "unfetched": len(uids) - len(batch),
+            "messages": messages
+        }
+
+    def _close_sync(self, flag_uids):
+        if self.client is None:
             return
+        try:
+            if flag_uids:
+                self.client.add_flags(flag_uids, [SEEN_FLAG])
+            self.client.logout()
+        finally:
+            self.client = None
+
+    def _apply(self, result):
+        if result["baseline"] is not None:
+            if self.uidvalidity is not None:
+                logger.warning(f"{self.key}: UIDVALIDITY changed, restarting at the oldest unseen message")
+            self.uidvalidity = result["uidvalidity"]
+            self.checkpoint = self.fetched = result["baseline"]
+            self.in_flight.clear()
+            self.watcher.checkpoints.set(self.key, self.uidvalidity, self.checkpoint)
+        self.server_uid = result["server_uid"]
+        self.unfetched = result["unfetched"]
+        self.fetched = max(self.fetched, result["last_uid"])
+        for message in result["messages"]:
+            message["folder"] = self
+            message["uidvalidity"] = self.uidvalidity
+            self.in_flight[message["uid"]] = message["received"]
+            self.watcher.scheduler.put(self.key, message)
+
+    def done(self, message, failed):
+        """Called by a worker once an email is processed; advances the checkpoint"""
+        if message["uidvalidity"] != self.uidvalidity or message["uid"] not in self.in_flight:
+            return
+        self.in_flight.pop(message["uid"])
+        self.to_flag.append(message["uid"])
+        self.stats["failed" if failed else "processed"] += 1
+        self.stats["last_latency"] = time.time() - message["received"]
+
+        # Out-of-order completions: only advance past UIDs that are all done
+        done_up_to = min(self.in_flight) - 1 if self.in_flight else self.fetched
+        if done_up_to > self.checkpoint:
+            self.checkpoint = done_up_to
+            self.watcher.checkpoints.set(self.key, self.uidvalidity, self.checkpoint)
+        if len(self.in_flight) <= self.watcher.prefetch // 2:
+            self.room.set()
+
+    async def run(self, stop):
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            flags, self.to_flag = self.to_flag, []
+            try:
+                result = await loop.run_in_executor(
+                    self.watcher.io_pool, self._poll_sync, flags, self.fetched, self.uidvalidity,
+                    self.watcher.prefetch - len(self.in_flight)
+                )
+            except Exception as e:
+                logger.error(f"IMAP error on {self.key}: {e}")
+                self.to_flag = flags + self.to_flag
+                self.stats["errors"] += 1
+                try:
+                    await loop.run_in_executor(self.watcher.io_pool, self._close_sync, [])
+                except Exception:
+                    pass
+                await _wait_for(stop, self.watcher.poll_interval)
+                continue
+            self._apply(result)
+
+            if self.unfetched and len(self.in_flight) <= self.watcher.prefetch // 2:
+                continue  # backlog on the server and room for it
+            self.room.clear()
+            # With a backlog, poll again as soon as processing frees room
+            await _wait_for(stop, self.watcher.poll_interval, self.room if self.unfetched else None)
 
-        for uid, message_data in server.fetch(messages, ["RFC822"]).items():
-            raw_message = message_data[b"RFC822"]
-            eml_path = save_eml_message(raw_message, uid)
-            email_id = os.path.splitext(os.path.basename(eml_path))[0]
-            await process_email(eml_path, email_id)
-            server.add_flags(uid, [b"\\Seen"])
-            print(f"Processed and marked as read: UID {uid}")
-
-def start_polling(interval_sec=60):
-    print(f"Watching inbox for {EMAIL_USER} via IMAP...")
-    while True:
+        flags, self.to_flag = self.to_flag, []
         try:
-            asyncio.run(check_and_process_emails())
+            await loop.run_in_executor(self.watcher.io_pool, self._close_sync, flags)
         except Exception as e:
-            print(f"Watcher error: {e}")
-        time.sleep(interval_sec)
+            logger.error(f"IMAP error closing {self.key}: {e}")
+
+    def metrics(self, now=None):
+        now = now or time.time()
+        queued = self.watcher.scheduler.pending(self.key)
+        oldest = min(self.in_flight.values(), default=None)
+        return {
+            "queued": queued,
+            "processing": len(self.in_flight) - queued,
+            "unfetched": self.unfetched,
+            "behind": self.unfetched + len(self.in_flight),
+            "checkpoint_uid": self.checkpoint,
+            "server_uid": self.server_uid,
+            "oldest_wait_seconds": now - oldest if oldest is not None else 0.0,
+            **self.stats
+        }
+
+
+async def _wait_for(stop, timeout, event=None):
+    """Sleep up to timeout, waking early on stop or event"""
+    waiters = [asyncio.ensure_future(stop.wait())]
+    if event is not None:
+        waiters.append(asyncio.ensure_future(event.wait()))
+    _, pending = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    for waiter in pending:
+        waiter.cancel()
+
+
+class MailboxWatcher:
+    """Fans many folders into one bounded processing pool; run() until stop()"""
+
+    def __init__(self, mailboxes, process=None, client_factory=connect_imap,
+                 checkpoint_db=IMAP_CHECKPOINT_DB, download_dir=DOWNLOAD_DIR,
+                 poll_interval=IMAP_POLL_INTERVAL, io_threads=IMAP_IO_THREADS,
+                 workers=IMAP_PROCESSING_WORKERS, prefetch=IMAP_PREFETCH,
+                 metrics_interval=IMAP_METRICS_INTERVAL, profile=None):
+        if process is None:
+            from orchestrator import process_email as process
+        self.profile = profile
+        self.process = process if profile is None else functools.partial(profile.run, process)
+        self.client_factory = client_factory
+        self.download_dir = download_dir
+        self.poll_interval = poll_interval
+        self.workers = workers
+        self.prefetch = max(prefetch, 1)
+        self.metrics_interval = metrics_interval
+        self.checkpoints = CheckpointStore(checkpoint_db)
+        self.io_pool = ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix="imap")
+        self.scheduler = FairScheduler()
+        self.folders = [FolderWatcher(mailbox, self) for mailbox in mailboxes]
+        for folder in self.folders:
+            self.scheduler.register(folder.key)
+        self._stop = asyncio.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def metrics(self):
+        now = time.time()
+        return {folder.key: folder.metrics(now) for folder in self.folders}
+
+    async def _worker(self):
+        while True:
+            message = await self.scheduler.get()
+            if message is None:
+                return
+            try:
+                result = await self.process(message["path"], message["email_id"])
+                failed = isinstance(result, dict) and "error" in result
+            except Exception as e:
+                logger.error(f"Error processing {message['email_id']}: {e}")
+                failed = True
+            message["folder"].done(message, failed)
+
+    async def _report_metrics(self):
+        while not self._stop.is_set():
+            await _wait_for(self._stop, self.metrics_interval)
+            for key, m in self.metrics().items():
+                logger.info(
+                    f"IMAP {key}: {m['behind']} behind ({m['unfetched']} on server, {m['queued']} queued, "
+                    f"{m['processing']} processing), oldest waiting {m['oldest_wait_seconds']:.0f}s, "
+                    f"{m['processed']} processed, {m['failed']} failed, {m['errors']} errors"
+                )
+            if self.profile is not None:
+                self.profile.flush()
+
+    async def run(self):
+        os.makedirs(self.download_dir, exist_ok=True)
+        if self.profile is not None:
+            self.profile.start()
+        pollers = [asyncio.create_task(folder.run(self._stop)) for folder in self.folders]
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        reporter = asyncio.create_task(self._report_metrics())
+        try:
+            await self._stop.wait()
+        finally:
+            # Queued emails are dropped: they are past the checkpoint, so refetched on restart
+            self._stop.set()
+            self.scheduler.close()
+            await asyncio.gather(*pollers, *workers, reporter, return_exceptions=True)
+            self.io_pool.shutdown(wait=True)
+            self.checkpoints.close()
+            if self.profile is not None:
+                self.profile.stop()
+
+
+def start_polling(interval_sec=IMAP_POLL_INTERVAL):
+    mailboxes = load_mailboxes()
+    logger.info(f"Watching {len(mailboxes)} IMAP folders: {', '.join(m['key'] for m in mailboxes)}")
+    profile = ProfileSession() if IMAP_PROFILE else None
+    watcher = MailboxWatcher(mailboxes, poll_interval=interval_sec, profile=profile)
+    try:
+        asyncio.run(watcher.run())
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
-    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
     start_polling()
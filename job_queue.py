@@ -0,0 +1,325 @@
+# job_queue.py
+"""
+Work queue for distributing process_email across processes and hosts.
+
+A job is a dict: job_id, email_id, filename, path (shared file) or blob
+(raw bytes), attempts and lease_token. Workers lease a job for
+`visibility_timeout` seconds; a job whose lease expires (crashed or stuck
+worker) is handed out again. Jobs are retried up to `max_attempts` times,
+then moved to the dead-letter set.
+"""
+
+import os
+import time
+import uuid
+import base64
+import sqlite3
+from config import JOB_VISIBILITY_TIMEOUT, JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY
+
+try:
+    import redis
+except ImportError:  # Optional: only needed for redis:// queues
+    redis = None
+
+
+class SQLiteJobQueue:
+    """Single host backend: SQLite's write lock arbitrates between worker processes."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        email_id TEXT NOT NULL,
+        filename TEXT,
+        path TEXT,
+        blob BLOB,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at REAL NOT NULL,
+        lease_token TEXT,
+        lease_expires REAL,
+        last_error TEXT,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, available_at);
+    """
+
+    def __init__(self, path, visibility_timeout=JOB_VISIBILITY_TIMEOUT,
+                 max_attempts=JOB_MAX_ATTEMPTS, retry_delay=JOB_RETRY_DELAY):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def enqueue(self, email_id, path=None, blob=None, filename=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.conn.execute(
+            "INSERT INTO jobs (job_id, email_id, filename, path, blob, available_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, email_id, filename or (os.path.basename(path) if path else None), path, blob, now, now)
+        )
+        return job_id
+
+    def lease(self, worker_id=None):
+        """Claim the oldest available job, or return None"""
+        now = time.time()
+        token = uuid.uuid4().hex
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases that used up their attempts are dead-lettered
+            self.conn.execute(
+                "UPDATE jobs SET status = 'dead', last_error = 'lease expired' "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, self.max_attempts)
+            )
+            row = self.conn.execute(
+                "SELECT job_id, email_id, filename, path, blob, attempts FROM jobs "
+                "WHERE (status = 'queued' AND available_at <= ?) "
+                "OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY available_at LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET status = 'leased', attempts = attempts + 1, "
+                "lease_token = ?, lease_expires = ? WHERE job_id = ?",
+                (token, now + self.visibility_timeout, row[0])
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return {
+            "job_id": row[0],
+            "email_id": row[1],
+            "filename": row[2],
+            "path": row[3],
+            "blob": row[4],
+            "attempts": row[5] + 1,
+            "lease_token": token
+        }
+
+    def extend(self, job):
+        """Renew the lease; False if it was lost to another worker"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND lease_token = ?",
+            (time.time() + self.visibility_timeout, job["job_id"], job["lease_token"])
+        )
+        return cursor.rowcount == 1
+
+    def ack(self, job):
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'done', blob = NULL, lease_token = NULL "
+            "WHERE job_id = ? AND lease_token = ?",
+            (job["job_id"], job["lease_token"])
+        )
+        return cursor.rowcount == 1
+
+    def nack(self, job, error=""):
+        """Give the job back for a retry, or dead-letter it after max_attempts"""
+        dead = job["attempts"] >= self.max_attempts
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = ?, available_at = ?, last_error = ?, lease_token = NULL "
+            "WHERE job_id = ? AND lease_token = ?",
+            (
+                "dead" if dead else "queued",
+                time.time() + self.retry_delay * job["attempts"],
+                str(error),
+                job["job_id"],
+                job["lease_token"]
+            )
+        )
+        return cursor.rowcount == 1
+
+    def dead_letters(self):
+        rows = self.conn.execute(
+            "SELECT job_id, email_id, filename, attempts, last_error FROM jobs WHERE status = 'dead'"
+        ).fetchall()
+        return [
+            {"job_id": r[0], "email_id": r[1], "filename": r[2], "attempts": r[3], "last_error": r[4]}
+            for r in rows
+        ]
+
+    def stats(self):
+        counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ("queued", "leased", "done", "dead")}
+
+    def close(self):
+        self.conn.close()
+
+
+class RedisJobQueue:
+    """
+    Multi-host backend using plain Redis commands (no Lua), so any
+    Redis-compatible server works.
+
+    Keys: <prefix>:ready (list), <prefix>:processing (list), <prefix>:leases
+    (zset of job_id -> lease expiry), <prefix>:dead (list) and
+    <prefix>:job:<id> (hash). A job left in :processing without a lease (its
+    worker died between popping it and leasing it) is given one and
+    redelivered when that expires.
+    """
+
+    def __init__(self, client, prefix="email_jobs", visibility_timeout=JOB_VISIBILITY_TIMEOUT,
+                 max_attempts=JOB_MAX_ATTEMPTS, retry_delay=JOB_RETRY_DELAY):
+        self.client = client
+        self.prefix = prefix
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def _key(self, name):
+        return f"{self.prefix}:{name}"
+
+    def enqueue(self, email_id, path=None, blob=None, filename=None):
+        job_id = uuid.uuid4().hex
+        self.client.hset(self._key(f"job:{job_id}"), mapping={
+            "email_id": email_id,
+            "filename": filename or (os.path.basename(path) if path else ""),
+            "path": path or "",
+            "blob": base64.b64encode(blob).decode("ascii") if blob else "",
+            "attempts": 0,
+            "available_at": time.time()
+        })
+        self.client.lpush(self._key("ready"), job_id)
+        return job_id
+
+    def _lease_orphans(self, now):
+        # RPOPLPUSH and the lease ZADD are separate commands, so a worker that
+        # dies between them leaves a job in :processing with no lease. Give such
+        # jobs a lease (NX keeps one a live worker just wrote) so they expire
+        # and are requeued like any other.
+        for job_id in self.client.lrange(self._key("processing"), 0, -1):
+            job_id = job_id.decode() if isinstance(job_id, bytes) else job_id
+            if self.client.zscore(self._key("leases"), job_id) is None:
+                self.client.zadd(self._key("leases"), {job_id: now + self.visibility_timeout}, nx=True)
+
+    def _requeue_expired(self, now):
+        self._lease_orphans(now)
+        for job_id in self.client.zrangebyscore(self._key("leases"), 0, now):
+            job_id = job_id.decode() if isinstance(job_id, bytes) else job_id
+            # Only the client whose ZREM succeeds requeues the job, and only if
+            # it was still in :processing (an orphan lease may outlive its job)
+            if self.client.zrem(self._key("leases"), job_id) and self.client.lrem(self._key("processing"), 0, job_id):
+                attempts = int(self.client.hget(self._key(f"job:{job_id}"), "attempts") or 0)
+                if attempts >= self.max_attempts:
+                    self.client.hset(self._key(f"job:{job_id}"), mapping={"last_error": "lease expired"})
+                    self.client.lpush(self._key("dead"), job_id)
+                else:
+                    self.client.lpush(self._key("ready"), job_id)
+
+    def lease(self, worker_id=None):
+        now = time.time()
+        self._requeue_expired(now)
+
+        for _ in range(self.client.llen(self._key("ready"))):
+            job_id = self.client.rpoplpush(self._key("ready"), self._key("processing"))
+            if job_id is None:
+                return None
+            job_id = job_id.decode() if isinstance(job_id, bytes) else job_id
+            job = self._decode(self.client.hgetall(self._key(f"job:{job_id}")))
+            if float(job.get("available_at", 0)) > now:
+                # Retry backoff not over yet: rotate it to the back of the queue
+                self.client.lrem(self._key("processing"), 0, job_id)
+                self.client.lpush(self._key("ready"), job_id)
+                continue
+
+            token = uuid.uuid4().hex
+            self.client.zadd(self._key("leases"), {job_id: now + self.visibility_timeout})
+            attempts = self.client.hincrby(self._key(f"job:{job_id}"), "attempts", 1)
+            self.client.hset(self._key(f"job:{job_id}"), mapping={"lease_token": token})
+            return {
+                "job_id": job_id,
+                "email_id": job["email_id"],
+                "filename": job.get("filename") or None,
+                "path": job.get("path") or None,
+                "blob": base64.b64decode(job["blob"]) if job.get("blob") else None,
+                "attempts": int(attempts),
+                "lease_token": token
+            }
+        return None
+
+    @staticmethod
+    def _decode(mapping):
+        return {
+            (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+            for k, v in mapping.items()
+        }
+
+    def _owns(self, job):
+        token = self.client.hget(self._key(f"job:{job['job_id']}"), "lease_token")
+        token = token.decode() if isinstance(token, bytes) else token
+        return token == job["lease_token"]
+
+    def extend(self, job):
+        if not self._owns(job):
+            return False
+        self.client.zadd(self._key("leases"), {job["job_id"]: time.time() + self.visibility_timeout})
+        return True
+
+    def _release(self, job):
+        if not self._owns(job) or not self.client.zrem(self._key("leases"), job["job_id"]):
+            return False
+        self.client.lrem(self._key("processing"), 0, job["job_id"])
+        return True
+
+    def ack(self, job):
+        if not self._release(job):
+            return False
+        self.client.delete(self._key(f"job:{job['job_id']}"))
+        self.client.incr(self._key("done"))
+        return True
+
+    def nack(self, job, error=""):
+        if not self._release(job):
+            return False
+        self.client.hset(self._key(f"job:{job['job_id']}"), mapping={
+            "last_error": str(error),
+            "available_at": time.time() + self.retry_delay * job["attempts"]
+        })
+        target = "dead" if job["attempts"] >= self.max_attempts else "ready"
+        self.client.lpush(self._key(target), job["job_id"])
+        return True
+
+    def dead_letters(self):
+        jobs = []
+        for job_id in self.client.lrange(self._key("dead"), 0, -1):
+            job_id = job_id.decode() if isinstance(job_id, bytes) else job_id
+            job = self._decode(self.client.hgetall(self._key(f"job:{job_id}")))
+            jobs.append({
+                "job_id": job_id,
+                "email_id": job.get("email_id"),
+                "filename": job.get("filename"),
+                "attempts": int(job.get("attempts", 0)),
+                "last_error": job.get("last_error")
+            })
+        return jobs
+
+    def stats(self):
+        return {
+            "queued": self.client.llen(self._key("ready")),
+            "leased": self.client.zcard(self._key("leases")),
+            "done": int(self.client.get(self._key("done")) or 0),
+            "dead": self.client.llen(self._key("dead"))
+        }
+
+    def close(self):
+        pass
+
+
+def open_queue(url, **kwargs):
+    """Queue from a URL: sqlite:///path/to/jobs.db or redis://host:port/db"""
+    if url.startswith("sqlite:///"):
+        return SQLiteJobQueue(url[len("sqlite:///"):], **kwargs)
+    if url.startswith(("redis://", "rediss://")):
+        if redis is None:
+            raise ImportError("redis is required for redis:// queues (pip install redis)")
+        return RedisJobQueue(redis.Redis.from_url(url), **kwargs)
+    raise ValueError(f"Unsupported queue URL: {url}")
@@ -0,0 +1,105 @@
+# json_stream.py
+
+import json
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_LITERAL_CHARS = set("0123456789+-.eEtruefalsn")
+
+
+class IncrementalJSONParser:
+    """
+    Push parser for a JSON document arriving in pieces (e.g. streamed LLM
+    tokens). `feed` returns the scalar values completed by that piece as
+    (path, value) pairs, where path is the tuple of object keys and array
+    indexes leading to the value:
+
+        parser.feed('{"primary_request": {"request_type": "Fee')   -> []
+        parser.feed(' Payment", "pri')  -> [(("primary_request", "request_type"), "Fee Payment")]
+
+    It is a scanner, not a validator: the complete text should still go
+    through json.loads.
+    """
+
+    def __init__(self):
+        # One frame per open container: [is_object, key_or_index, expecting_key]
+        self.stack = []
+        self.string = None
+        self.escape = None
+        self.literal = ""
+
+    def feed(self, chunk):
+        events = []
+        for ch in chunk:
+            self._char(ch, events)
+        return events
+
+    def close(self):
+        """Flush a trailing bare literal (only relevant for scalar documents)"""
+        events = []
+        if self.literal:
+            self._finish_literal(events)
+        return events
+
+    def _char(self, ch, events):
+        if self.string is not None:
+            if self.escape is not None:
+                if self.escape == "" and ch != "u":
+                    self.string.append(_ESCAPES.get(ch, ch))
+                    self.escape = None
+                    return
+                self.escape += ch
+                if len(self.escape) == 5:
+                    self.string.append(chr(int(self.escape[1:], 16)))
+                    self.escape = None
+                return
+            if ch == "\\":
+                self.escape = ""
+            elif ch == '"':
+                text = "".join(self.string)
+                self.string = None
+                # Re-pair surrogates produced by \ud83d\ude00 style escapes
+                text = text.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+                self._value(text, events)
+            else:
+                self.string.append(ch)
+            return
+
+        if self.literal and ch not in _LITERAL_CHARS:
+            self._finish_literal(events)
+
+        if ch in " \t\r\n":
+            return
+        if ch == '"':
+            self.string = []
+        elif ch == "{":
+            self.stack.append([True, None, True])
+        elif ch == "[":
+            self.stack.append([False, 0, False])
+        elif ch in "}]":
+            if self.stack:
+                self.stack.pop()
+        elif ch == ":":
+            if self.stack:
+                self.stack[-1][2] = False
+        elif ch == ",":
+            if self.stack:
+                frame = self.stack[-1]
+                if frame[0]:
+                    frame[1], frame[2] = None, True
+                else:
+                    frame[1] += 1
+        elif ch in _LITERAL_CHARS:
+            self.literal += ch
+
+    def _finish_literal(self, events):
+        literal, self.literal = self.literal, ""
+        try:
+            self._value(json.loads(literal), events)
+        except ValueError:
+            pass
+
+    def _value(self, value, events):
+        if self.stack and self.stack[-1][0] and self.stack[-1][2]:
+            self.stack[-1][1] = value  # an object key
+            return
+        events.append((tuple(frame[1] for frame in self.stack), value))
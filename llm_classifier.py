@@ -1,16 +1,38 @@
 # llm_classifier.py
 
+import re
 import openai
 import json
-from config import OPENAI_API_KEY, OPENAI_MODEL, SUBJECT_RULES
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_MODEL,
+    OPENAI_BASE_URL,
+    OPENAI_MAX_TOKENS,
+    OPENAI_FAST_MODEL,
+    OPENAI_FAST_MAX_TOKENS,
+    MODEL_ROUTING_MAX_COMPLEXITY,
+    MODEL_ESCALATION_CONFIDENCE,
+    DATE_PATTERNS,
+    ENABLE_PROMPT_COMPACTION,
+    PROMPT_TOKEN_BUDGET,
+    ENABLE_STREAMING_CLASSIFICATION
+)
+from cleaner import estimate_tokens
+from prompt_builder import build_email_context
+from json_stream import IncrementalJSONParser
+from rules_registry import get_rules
+from records import Classification
 
 # Initialize OpenAI client
-client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
+client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
-def rule_based_classification(subject, body):
+DATE_RES = [re.compile(pattern, re.IGNORECASE) for pattern in DATE_PATTERNS]
+
+def rule_based_classification(subject, body, rules=None):
     """
     Enhanced rule-based classifier with better alignment to observed outputs
     """
+    rules = rules or get_rules()
     text = f"{subject} {body}".lower()
     result = {
         "primary_request": {
@@ -25,48 +47,59 @@ def rule_based_classification(subject, body):
     }
 
     # Enhanced keyword matching with priority detection
-    for rule_name, rule in SUBJECT_RULES.items():
+    matched = rules.match_subject_rule(text)
+    if matched:
+        rule_name, rule = matched
         keywords = rule.get("keywords", [])
-        if any(kw.lower() in text for kw in keywords):
-            priority = "High" if any(pkw in text for pkw in ["urgent", "immediate", "due"]) else rule.get("priority", "Medium")
-            
-            result["primary_request"] = {
-                "request_type": rule.get("request_type", "Others"),
-                "sub_request_type": rule.get("sub_request_type", "Others"),
-                "primary_intent": f"Identified via rule: {rule_name}",
-                "priority": priority,
-                "confidence": 75,  # Higher confidence for rule-based matches
-                "reasoning": f"Matched keywords: {', '.join(keywords)}"
-            }
-            break
+        priority = "High" if any(pkw in text for pkw in ["urgent", "immediate", "due"]) else rule.get("priority", "Medium")
+        
+        result["primary_request"] = {
+            "request_type": rule.get("request_type", "Others"),
+            "sub_request_type": rule.get("sub_request_type", "Others"),
+            "primary_intent": f"Identified via rule: {rule_name}",
+            "priority": priority,
+            "confidence": 75,  # Higher confidence for rule-based matches
+            "reasoning": f"Matched keywords: {', '.join(keywords)}"
+        }
             
     return result
 
-async def classify_email(subject, body):
-    """
-    Optimized classifier based on observed output patterns
-    """
-    prompt = f"""**Financial Email Classification Task**
+def build_prompt_body(body, attachments=None, rules=None):
+    """Email content for the prompt: compacted to the token budget unless disabled"""
+    if not ENABLE_PROMPT_COMPACTION:
+        tokens = estimate_tokens(body)
+        return body, {"original_tokens": tokens, "context_tokens": tokens, "tokens_saved": 0, "compacted": False}
+    return build_email_context(body, attachments, budget=PROMPT_TOKEN_BUDGET, rules=rules)
+
+SYSTEM_PROMPT = (
+    "You are a senior loan servicing analyst. "
+    "Classify emails with precision using standard financial categories. "
+    "Focus on the primary actionable request. "
+    "Secondary requests should only be included for truly separate actions."
+)
+
+# Routing fields come first in the schema so a streamed response yields them early
+PROMPT_TEMPLATE = """**Financial Email Classification Task**
 
 Analyze this loan servicing email and provide:
 
 1. PRIMARY REQUEST:
 - request_type: Broad category (e.g., "Loan Repayment", "Fee Payment")
+- priority: "High"/"Medium"/"Low" based on urgency
 - sub_request_type: Specific action (e.g., "Principal Payment", "Amendment Fee")
 - primary_intent: 1-sentence summary of the main action requested
-- priority: "High"/"Medium"/"Low" based on urgency
 - confidence: 1-100% certainty
 - reasoning: Brief justification for classification
 
 2. SECONDARY REQUESTS: Only if clearly distinct additional actions
 
-**Output Format (STRICT JSON):**
+**Output Format (STRICT JSON, keys in this order):**
 {{
   "primary_request": {{
     "request_type": "[Standard Category]",
+    "priority": "High/Medium/Low",
     "sub_request_type": "[Specific Action]", 
     "primary_intent": "[Summary]",
-    "priority": "High/Medium/Low",
     "confidence": 0-100,
     "reasoning": "[Logical Explanation]"
   }},
@@ -79,64 +112,184 @@ Body:
 {body}
 """
 
-    try:
-        response = await client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {
-                    "role": "system", 
-                    "content": (
-                        "You are a senior loan servicing analyst. "
-                        "Classify emails with precision using standard financial categories. "
-                        "Focus on the primary actionable request. "
-                        "Secondary requests should only be included for truly separate actions."
-                    )
-                },
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ],
-            temperature=0.1,  # Lower temperature for more consistent outputs
-            response_format={"type": "json_object"},
-            max_tokens=400
-        )
-        
-        data = json.loads(response.choices[0].message.content)
+REQUIRED_FIELDS = [
+    "request_type", 
+    "sub_request_type", 
+    "primary_intent",
+    "priority", 
+    "confidence", 
+    "reasoning"
+]
+
+def normalize_priority(priority):
+    priority = str(priority).lower()
+    return "High" if "high" in priority else "Low" if "low" in priority else "Medium"
+
+def validate_classification(data):
+    """Validate and normalize a parsed LLM response in place"""
+    # Validate primary request
+    if not all(field in data["primary_request"] for field in REQUIRED_FIELDS):
+        raise ValueError("Primary request missing required fields")
         
-        # ===== VALIDATION & NORMALIZATION =====
-        REQUIRED_FIELDS = [
-            "request_type", 
-            "sub_request_type", 
-            "primary_intent",
-            "priority", 
-            "confidence", 
-            "reasoning"
-        ]
+    # Normalize priorities
+    data["primary_request"]["priority"] = normalize_priority(data["primary_request"]["priority"])
+    
+    # Ensure confidence is numeric
+    try:
+        data["primary_request"]["confidence"] = min(100, max(0, int(data["primary_request"]["confidence"])))
+    except (ValueError, TypeError):
+        data["primary_request"]["confidence"] = 80  # Default
         
-        # Validate primary request
-        if not all(field in data["primary_request"] for field in REQUIRED_FIELDS):
-            raise ValueError("Primary request missing required fields")
-            
-        # Normalize priorities
-        data["primary_request"]["priority"] = (
-            "High" if "high" in data["primary_request"]["priority"].lower() 
-            else "Low" if "low" in data["primary_request"]["priority"].lower() 
-            else "Medium"
+    # Ensure secondary_requests exists and is list
+    if "secondary_requests" not in data or not isinstance(data["secondary_requests"], list):
+        data["secondary_requests"] = []
+    return data
+
+# Fields the orchestrator needs to start routing
+EARLY_FIELDS = {("primary_request", "request_type"), ("primary_request", "priority")}
+
+def score_complexity(subject, body, attachments=None, context_tokens=None, rules=None):
+    """
+    How hard an email looks to classify, from its prompt size, how many
+    amounts and dates it mentions, how many subject rules its keywords hit
+    (none or several is ambiguous) and its readable attachments. Returns
+    (score, factors); simple notices score around 1.
+    """
+    rules = rules or get_rules()
+    text = f"{subject}\n{body}"
+    factors = {
+        "tokens": context_tokens if context_tokens is not None else estimate_tokens(body),
+        "amounts": sum(1 for _ in rules.amount_re.finditer(text)),
+        "dates": sum(len(date_re.findall(text)) for date_re in DATE_RES),
+        "matched_rules": len(rules.matching_subject_rules(text)),
+        "attachments": sum(
+            1 for att in attachments or []
+            if att.content and not att.content.startswith("[")
         )
-        
-        # Ensure confidence is numeric
+    }
+    score = (
+        factors["tokens"] / 300
+        + 0.5 * max(0, factors["amounts"] - 2)
+        + 0.5 * max(0, factors["dates"] - 2)
+        + (2 if factors["matched_rules"] == 0 else factors["matched_rules"] - 1)
+        + 1.5 * factors["attachments"]
+    )
+    return round(score, 2), factors
+
+def escalation_reason(data, rules):
+    """Why a fast model answer should be re-asked of OPENAI_MODEL, or None"""
+    confidence = data["primary_request"]["confidence"]
+    if confidence < MODEL_ESCALATION_CONFIDENCE:
+        return f"confidence {confidence} below {MODEL_ESCALATION_CONFIDENCE}"
+    if rules.router.route_classification(data)["match"] == "fallback":
+        return f"unknown request type {data['primary_request']['request_type']!r}"
+    return None
+
+def _usage(response, messages, content):
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+    # Streamed responses carry no usage; estimate it
+    return {
+        "prompt_tokens": sum(estimate_tokens(m["content"]) for m in messages),
+        "completion_tokens": estimate_tokens(content)
+    }
+
+async def _complete(messages, on_primary, model=OPENAI_MODEL, max_tokens=OPENAI_MAX_TOKENS):
+    """
+    Full completion, or a streamed one that reports routing fields as soon
+    as they parse. Returns (content, token usage).
+    """
+    request = dict(
+        model=model,
+        messages=messages,
+        temperature=0.1,  # Lower temperature for more consistent outputs
+        response_format={"type": "json_object"},
+        max_tokens=max_tokens
+    )
+    if not ENABLE_STREAMING_CLASSIFICATION:
+        response = await client.chat.completions.create(**request)
+        content = response.choices[0].message.content
+        return content, _usage(response, messages, content)
+
+    parser = IncrementalJSONParser()
+    pieces, early = [], {}
+    stream = await client.chat.completions.create(stream=True, **request)
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if not delta:
+            continue
+        pieces.append(delta)
+        if len(early) == len(EARLY_FIELDS):
+            continue
+        for path, value in parser.feed(delta):
+            if path in EARLY_FIELDS:
+                early[path[1]] = value
+        if len(early) == len(EARLY_FIELDS):
+            on_primary({"request_type": early["request_type"], "priority": normalize_priority(early["priority"])})
+    content = "".join(pieces)
+    return content, _usage(None, messages, content)
+
+async def classify_email(subject, body, attachments=None, on_primary=None, rules=None):
+    """
+    Optimized classifier based on observed output patterns
+
+    on_primary, if given, is called at most once, with {"request_type",
+    "priority"} as soon as both stream in when ENABLE_STREAMING_CLASSIFICATION
+    is set; without streaming it is never called. The returned classification
+    is the authoritative one. `rules` is the rules snapshot to use (default: current).
+
+    With OPENAI_FAST_MODEL set, emails scoring at most
+    MODEL_ROUTING_MAX_COMPLEXITY go to it first, and are escalated to
+    OPENAI_MODEL when its answer fails validation, is below
+    MODEL_ESCALATION_CONFIDENCE or names an unknown request type.
+    "model_routing" records the model used and every attempt's token usage.
+    Returns a Classification record.
+    """
+    rules = rules or get_rules()
+    email_context, prompt_stats = build_prompt_body(body, attachments, rules)
+    prompt = PROMPT_TEMPLATE.format(subject=subject, body=email_context)
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    notified = []
+
+    def notify(primary):
+        if on_primary is not None and not notified:
+            notified.append(primary)
+            on_primary(primary)
+
+    complexity, factors = score_complexity(subject, body, attachments, prompt_stats["context_tokens"], rules)
+    models = [(OPENAI_MODEL, OPENAI_MAX_TOKENS)]
+    if OPENAI_FAST_MODEL and complexity <= MODEL_ROUTING_MAX_COMPLEXITY:
+        models.insert(0, (OPENAI_FAST_MODEL, OPENAI_FAST_MAX_TOKENS))
+    model_routing = {"model": None, "complexity": complexity, "factors": factors, "attempts": []}
+
+    data = fallback = None
+    for model, max_tokens in models:
+        attempt = {"model": model}
+        model_routing["attempts"].append(attempt)
         try:
-            data["primary_request"]["confidence"] = min(100, max(0, int(data["primary_request"]["confidence"])))
-        except (ValueError, TypeError):
-            data["primary_request"]["confidence"] = 80  # Default
-            
-        # Ensure secondary_requests exists and is list
-        if "secondary_requests" not in data or not isinstance(data["secondary_requests"], list):
-            data["secondary_requests"] = []
-            
-        return data
-        
-    except Exception as e:
-        print(f"LLM Classification Error: {str(e)}")
-        return rule_based_classification(subject, body)
\ No newline at end of file
+            content, attempt["usage"] = await _complete(messages, notify, model, max_tokens)
+            candidate = validate_classification(json.loads(content))
+        except Exception as e:
+            print(f"LLM Classification Error ({model}): {str(e)}")
+            attempt["error"] = str(e)
+            continue
+        reason = escalation_reason(candidate, rules) if model != models[-1][0] else None
+        if reason is None:
+            data = candidate
+            model_routing["model"] = model
+            break
+        attempt["escalated"] = reason
+        fallback = fallback or (model, candidate)
+
+    if data is None and fallback is not None:
+        # The stronger model failed outright; a doubtful answer beats the rules
+        model_routing["model"], data = fallback
+    elif data is None:
+        data = rule_based_classification(subject, body, rules)
+        model_routing["model"] = "rules"
+
+    return Classification(data["primary_request"], data["secondary_requests"], prompt_stats, model_routing)
@@ -0,0 +1,191 @@
+# mime_stream.py
+
+import re
+import binascii
+from email import policy
+from email.parser import BytesFeedParser
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# Boundary lines are at most 70 characters plus dashes (RFC 2046), so they
+# always arrive whole in a chunk of this size
+MIN_CHUNK_SIZE = 256
+
+_BASE64_JUNK = re.compile(rb"[^A-Za-z0-9+/=]")
+
+
+class Base64Decoder:
+    """Incremental base64 decoder that carries partial quanta between chunks."""
+
+    def __init__(self):
+        self.pending = b""
+
+    def feed(self, data):
+        data = self.pending + _BASE64_JUNK.sub(b"", data)
+        cut = len(data) - len(data) % 4
+        self.pending = data[cut:]
+        return binascii.a2b_base64(data[:cut]) if cut else b""
+
+    def flush(self):
+        data, self.pending = self.pending, b""
+        if not data:
+            return b""
+        try:
+            return binascii.a2b_base64(data + b"=" * (-len(data) % 4))
+        except binascii.Error:
+            return b""
+
+
+class QuotedPrintableDecoder:
+    """Incremental quoted-printable decoder; holds back escapes split across chunks."""
+
+    def __init__(self):
+        self.pending = b""
+
+    def feed(self, data):
+        data = self.pending + data
+        self.pending = b""
+        if not data.endswith(b"\n"):
+            tail = data.rfind(b"=", max(0, len(data) - 2))
+            if tail != -1:
+                data, self.pending = data[:tail], data[tail:]
+        return binascii.a2b_qp(data)
+
+    def flush(self):
+        data, self.pending = self.pending, b""
+        return binascii.a2b_qp(data)
+
+
+class IdentityDecoder:
+    def feed(self, data):
+        return data
+
+    def flush(self):
+        return b""
+
+
+def get_decoder(part):
+    encoding = str(part.get("content-transfer-encoding", "")).strip().lower()
+    if encoding == "base64":
+        return Base64Decoder()
+    if encoding == "quoted-printable":
+        return QuotedPrintableDecoder()
+    return IdentityDecoder()
+
+
+class MimeStreamParser:
+    """
+    Single pass MIME parser that never holds a whole part in memory.
+
+    Headers are parsed with BytesFeedParser, fed line by line. Leaf part
+    bodies are transfer-decoded chunk by chunk and written to the sink that
+    `on_part(headers)` returns. A sink needs `write(bytes)` (return False to
+    stop receiving data) and `close()`. When `on_part` returns None the body
+    is skipped without decoding. With walk_nested=False an attached
+    message/rfc822 is handed to `on_part` whole instead of being walked.
+    """
+
+    def __init__(self, fp, on_part, chunk_size=DEFAULT_CHUNK_SIZE, walk_nested=True):
+        self.fp = fp
+        self.on_part = on_part
+        self.walk_nested = walk_nested
+        self.chunk_size = max(chunk_size, MIN_CHUNK_SIZE)
+        self.at_line_start = True
+        self.bytes_read = 0
+
+    def parse(self):
+        """Stream the whole message; returns the top-level headers."""
+        headers = self._read_headers()
+        self._walk(headers, [])
+        return headers
+
+    def _next_piece(self):
+        """Next line, or a chunk_size slice of an overlong line, and whether it starts a line."""
+        piece = self.fp.readline(self.chunk_size)
+        starts_line = self.at_line_start
+        self.at_line_start = piece.endswith(b"\n")
+        self.bytes_read += len(piece)
+        return piece, starts_line
+
+    def _read_headers(self):
+        parser = BytesFeedParser(policy=policy.default)
+        while True:
+            piece, starts_line = self._next_piece()
+            if not piece or (starts_line and piece in (b"\n", b"\r\n")):
+                break
+            parser.feed(piece)
+        return parser.close()
+
+    @staticmethod
+    def _match_boundary(piece, boundaries):
+        if not piece.startswith(b"--"):
+            return None
+        line = piece.rstrip(b"\r\n \t")
+        for boundary in reversed(boundaries):
+            if line == b"--" + boundary:
+                return boundary, False
+            if line == b"--" + boundary + b"--":
+                return boundary, True
+        return None
+
+    def _skip_to_boundary(self, boundaries):
+        """Discard preamble/epilogue lines; returns the boundary hit or None at EOF."""
+        while True:
+            piece, starts_line = self._next_piece()
+            if not piece:
+                return None
+            if starts_line:
+                match = self._match_boundary(piece, boundaries)
+                if match:
+                    return match
+
+    def _walk(self, part, boundaries):
+        """Parse the body of `part`; returns the boundary that terminated it."""
+        boundary = part.get_param("boundary") if part.get_content_maintype() == "multipart" else None
+        if boundary:
+            boundary = str(boundary).encode("ascii", "replace")
+            inner = boundaries + [boundary]
+            term = self._skip_to_boundary(inner)
+            while term == (boundary, False):
+                term = self._walk(self._read_headers(), inner)
+            if term == (boundary, True):
+                term = self._skip_to_boundary(boundaries)
+            return term
+
+        if self.walk_nested and part.get_content_type() == "message/rfc822" \
+                and isinstance(get_decoder(part), IdentityDecoder):
+            return self._walk(self._read_headers(), boundaries)
+
+        sink = self.on_part(part)
+        return self._pump_body(boundaries, get_decoder(part) if sink is not None else None, sink)
+
+    def _pump_body(self, boundaries, decoder, sink):
+        previous, term = None, None
+        receiving = sink is not None
+        while True:
+            piece, starts_line = self._next_piece()
+            if not piece:
+                break
+            if starts_line:
+                term = self._match_boundary(piece, boundaries)
+                if term:
+                    break
+            if previous is not None and receiving:
+                receiving = sink.write(decoder.feed(previous)) is not False
+            previous = piece
+
+        if receiving:
+            if previous is not None:
+                # The line break before a boundary belongs to the boundary
+                if term and previous.endswith(b"\n"):
+                    previous = previous[:-2] if previous.endswith(b"\r\n") else previous[:-1]
+                receiving = sink.write(decoder.feed(previous)) is not False
+            if receiving:
+                sink.write(decoder.flush())
+        if sink is not None:
+            sink.close()
+        return term
+
+
+def stream_parse(fp, on_part, chunk_size=DEFAULT_CHUNK_SIZE, walk_nested=True):
+    """Stream-parse a binary file object; see MimeStreamParser."""
+    return MimeStreamParser(fp, on_part, chunk_size, walk_nested).parse()
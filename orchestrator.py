@@ -1,83 +1,258 @@
 import os
-import json
+import time
 import asyncio
-from email_loader import parse_email_file
+import argparse
+import functools
+from email_loader import parse_email_file, parse_email_headers, get_extraction_stats
 from llm_classifier import classify_email
 from field_extractor import extract_all_fields
-from deduplicator import check_duplicate
+from deduplicator import (
+    check_duplicate,
+    content_fingerprint,
+    find_cached_result,
+    load_result,
+    store_result
+)
+from cleaner import clean_email_body, estimate_tokens
+from rules_registry import get_rules
 from config import (
     INPUT_DIR,
     OUTPUT_DIR,
-    TEAM_MAP,
-    REQUEST_TYPE_MAPPINGS
+    ENABLE_TEXT_CLEANING,
+    CLEANING_OPTIONS,
+    JOB_QUEUE_URL
 )
 from Logger import logger
 from webhook_sender import send_to_webhook
+from profiler import ProfileSession, stage, timed, in_thread
+from output_writer import dumps, write_output
+
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+def clean_body(raw_body):
+    """Apply the configured cleaning stage, returning the text and token stats"""
+    if not ENABLE_TEXT_CLEANING:
+        tokens = estimate_tokens(raw_body)
+        return raw_body, {"raw_tokens": tokens, "cleaned_tokens": tokens, "tokens_saved": 0}
+    return clean_email_body(raw_body, CLEANING_OPTIONS)
 
-def get_request_type(classification_data):
-    """Normalize request types using centralized mapping"""
-    request_type = classification_data.get("primary_request", {}).get("request_type", "Others")
-    return REQUEST_TYPE_MAPPINGS.get(request_type, request_type)
+def duplicate_output(original, email_id, headers, duplication):
+    """An exact duplicate's output: the original's results under this email's metadata"""
+    return {
+        **original,
+        "email_id": email_id,
+        "subject": headers.get("subject", ""),
+        "from": headers.get("from", "unknown"),
+        "to": headers.get("to", "unknown"),
+        "date": headers.get("date", "unknown"),
+        "duplication": duplication
+    }
+
+async def save_output(output, email_id):
+    """
+    Write the output atomically and post it to the webhook, both off the
+    event loop. The output is serialized once; the JSON bytes are returned
+    for the result store to reuse.
+    """
+    data = dumps(output)
+    await write_output(OUTPUT_DIR, email_id, data)
+
+    if os.getenv("ENABLE_WEBHOOK", "false").lower() == "true":
+        await asyncio.get_running_loop().run_in_executor(None, send_to_webhook, data, email_id)
+    return data
 
 async def process_email(file_path, email_id):
+    """
+    Per-email DAG. A content fingerprint is checked first: a file seen before
+    gets the stored output of the original without being parsed. Otherwise
+    the email is parsed on a worker thread and the cleaned body is
+    deduplicated (an exact match also reuses the stored output); only then
+    does field extraction start on another thread, with classification
+    overlapping it.
+
+    The whole email uses one rules snapshot, whose version is stamped into
+    the output; stored results from other rules versions are recomputed.
+    Stage wall times are recorded when run through a ProfileSession.
+    """
     try:
-        # Parse email
-        email_data = parse_email_file(file_path)
-        raw_body = email_data.get("body", "")
-        subject = email_data.get("subject", "")
-        
-        # Classify
-        classification_data = await classify_email(subject, raw_body)
-        request_type = get_request_type(classification_data)
+        rules = get_rules()
+        stale = None
+
+        # Exact repeats (same notice via several distribution lists) skip every expensive stage
+        with stage("lookup"):
+            content_hash = await in_thread(content_fingerprint, file_path)
+            cached = await find_cached_result(content_hash, email_id)
+        if cached is not None and cached["output"].get("rules_version") != rules.version:
+            stale, cached = cached, None
+        if cached is not None:
+            duplication = {
+                "is_duplicate": True,
+                "duplicate_type": "exact",
+                "matched_with": cached["email_id"],
+                "reason": "Exact content match"
+            }
+            headers = await in_thread(parse_email_headers, file_path)
+            output = duplicate_output(cached["output"], email_id, headers, duplication)
+            await timed("save", save_output(output, email_id))
+            logger.info(f"{email_id} is an exact duplicate of {cached['email_id']}; reused its output")
+            return output
+
+        # Parse email off the event loop: PDF and OCR attachments can take
+        # longer than a job's lease, which is renewed from this loop
+        email_data = await timed("parse", in_thread(parse_email_file, file_path))
+
+        # Clean
+        with stage("clean"):
+            body, cleaning_stats = clean_body(email_data.body)
+        logger.info(
+            f"Cleaned {email_id}: {cleaning_stats['raw_tokens']} -> "
+            f"{cleaning_stats['cleaned_tokens']} tokens ({cleaning_stats['tokens_saved']} saved)"
+        )
+
+        # Deduplicate before paying for extraction and the LLM
+        duplication = await timed("dedup", check_duplicate(
+            email_id=email_id,
+            cleaned_text=body,
+            request_type=None,
+            date_str=email_data.date,
+            content_hash=content_hash
+        ))
+        if duplication["is_duplicate"]:
+            original = await timed("dedup", load_result(duplication["matched_with"]))
+            if original is not None and original.get("rules_version") != rules.version:
+                stale = stale or {"email_id": duplication["matched_with"], "output": original}
+            elif original is not None:
+                output = duplicate_output(original, email_id, email_data.headers(), duplication)
+                await timed("save", save_output(output, email_id))
+                logger.info(f"{email_id} is an exact duplicate of {duplication['matched_with']}; reused its output")
+                return output
         
-        # Extract fields
-        extracted_fields = await extract_all_fields(
-            raw_body + "\n\n" + 
-            "\n\n".join(att.get("content", "") for att in email_data.get("attachments", []))
+        # Extract fields (independent of classification); attachment texts go
+        # in as separate segments rather than one concatenated copy
+        extraction = asyncio.ensure_future(timed("extract", extract_all_fields(
+            [body] + email_data.attachment_texts(), rules
+        )))
+
+        # Classify while extraction runs; with streaming enabled, a provisional
+        # route is known as soon as the request type has streamed in
+        provisional = {}
+        classify_start = time.perf_counter()
+
+        def on_primary(primary):
+            provisional.update(rules.router.route(primary["request_type"]))
+            provisional["seconds"] = round(time.perf_counter() - classify_start, 3)
+
+        classification, extracted_fields = await asyncio.gather(
+            timed("classify", classify_email(
+                email_data.subject, body, email_data.attachments, on_primary=on_primary, rules=rules
+            )),
+            extraction
         )
 
+        # Reconcile the provisional route with the validated classification;
+        # the output keeps both, with the time it took to route provisionally
+        routing = rules.router.route(classification.request_type)
+        request_type = routing["request_type"]
+        if provisional:
+            provisional["changed"] = request_type != provisional["request_type"]
+            routing["provisional"] = provisional
+            if provisional["changed"]:
+                logger.warning(
+                    f"Route for {email_id} changed from {provisional['request_type']} "
+                    f"to {request_type} after full classification"
+                )
+
         # Build output
         output = {
             "email_id": email_id,
-            "subject": subject,
-            "from": email_data.get("from", "unknown"),
-            "to": email_data.get("to", "unknown"),
-            "date": email_data.get("date", "unknown"),
-            "classification": classification_data,
-            "extracted_fields": extracted_fields,
-            "assigned_team": TEAM_MAP.get(request_type, "General Servicing Team"),
-            "duplication": await check_duplicate(
-                email_id=email_id,
-                cleaned_text=raw_body,
-                request_type=request_type,
-                date_str=email_data.get("date", "unknown")
-            )
+            "subject": email_data.subject,
+            "from": email_data.sender,
+            "to": email_data.to,
+            "date": email_data.date,
+            "classification": classification.to_dict(),
+            "extracted_fields": extracted_fields.to_dict(),
+            "cleaning": cleaning_stats,
+            "assigned_team": routing["assigned_team"],
+            "routing": routing,
+            "duplication": duplication,
+            "rules_version": rules.version
         }
 
-        # Save output
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        with open(os.path.join(OUTPUT_DIR, f"{email_id}_output.json"), "w") as f:
-            json.dump(output, f, indent=2)
-            
-        if os.getenv("ENABLE_WEBHOOK", "false").lower() == "true":
-            send_to_webhook(output, email_id)
-            
+        data = await timed("save", save_output(output, email_id))
+        with stage("store"):
+            await store_result(email_id, output, data)
+            if stale is not None:
+                # Refresh the original's stored result so later copies can reuse it again
+                original = stale["output"]
+                await store_result(stale["email_id"], duplicate_output(
+                    output, stale["email_id"], original, original.get("duplication")
+                ))
         return output
 
     except Exception as e:
         logger.error(f"Error processing {email_id}: {e}")
         return {"email_id": email_id, "error": str(e)}
 
-async def main():
-    """Process all emails in input directory"""
-    files = [
+def list_input_files():
+    return [
         f for f in os.listdir(INPUT_DIR) 
         if f.lower().endswith((".eml", ".txt", ".docx", ".pdf"))
     ]
-    await asyncio.gather(*[
-        process_email(os.path.join(INPUT_DIR, f), os.path.splitext(f)[0])
-        for f in files
-    ])
+
+async def main(profile=False):
+    """Process all emails in input directory; with profile, write a profiling report for the batch"""
+    files = list_input_files()
+    session = ProfileSession() if profile else None
+    process = process_email if session is None else functools.partial(session.run, process_email)
+    if session is not None:
+        session.start()
+    try:
+        await asyncio.gather(*[
+            process(os.path.join(INPUT_DIR, f), os.path.splitext(f)[0])
+            for f in files
+        ])
+    finally:
+        if session is not None:
+            session.stop()
+    for kind, stats in sorted(get_extraction_stats().items()):
+        logger.info(f"Extracted {stats['count']} {kind} attachments "
+                    f"({stats['bytes'] / 2**20:.1f} MB) in {stats['seconds']:.2f}s")
+
+def enqueue_inputs(queue_url=JOB_QUEUE_URL, inline=False):
+    """Coordinator: queue every input file as a job; inline ships the bytes for remote workers"""
+    from job_queue import open_queue
+    queue = open_queue(queue_url)
+    try:
+        files = list_input_files()
+        for f in files:
+            path = os.path.abspath(os.path.join(INPUT_DIR, f))
+            email_id = os.path.splitext(f)[0]
+            if inline:
+                with open(path, "rb") as fh:
+                    queue.enqueue(email_id, blob=fh.read(), filename=f)
+            else:
+                queue.enqueue(email_id, path=path)
+        logger.info(f"Enqueued {len(files)} emails on {queue_url}: {queue.stats()}")
+    finally:
+        queue.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Process emails in INPUT_DIR")
+    parser.add_argument("--enqueue", action="store_true",
+                        help="Queue the input files for worker.py instead of processing them here")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="With --enqueue: also run this many local worker processes until drained")
+    parser.add_argument("--queue", default=JOB_QUEUE_URL)
+    parser.add_argument("--inline", action="store_true",
+                        help="Ship file contents in the jobs (for workers on other hosts)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Sample stacks, time each email's stages and write reports to PROFILE_DIR")
+    args = parser.parse_args()
+
+    if args.enqueue:
+        enqueue_inputs(args.queue, inline=args.inline)
+        if args.workers:
+            from worker import run_worker_processes
+            run_worker_processes(args.queue, args.workers, concurrency=4, exit_when_idle=True)
+    else:
+        asyncio.run(main(profile=args.profile))
\ No newline at end of file
@@ -0,0 +1,51 @@
+# output_writer.py
+
+import os
+import json
+import uuid
+import asyncio
+from config import OUTPUT_INDENT, OUTPUT_FSYNC
+
+try:
+    import orjson
+except ImportError:  # Optional: faster serialization
+    orjson = None
+
+
+def dumps(obj, indent=OUTPUT_INDENT):
+    """
+    Serialize an output record to UTF-8 JSON bytes (compact unless indent is
+    set). orjson only indents by 2, so other indents use the json module.
+    """
+    if orjson is not None and indent in (None, 0, 2):
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(obj, default=str, option=option)
+    if indent:
+        return json.dumps(obj, indent=indent, ensure_ascii=False, default=str).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def write_atomic(path, data, fsync=OUTPUT_FSYNC):
+    """
+    Write to a temp file in the same directory, then rename over the target,
+    so readers see either the old file or the complete new one.
+    """
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp, "xb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+
+async def write_output(output_dir, email_id, data):
+    """Atomically write serialized output on a worker thread; returns the path"""
+    path = os.path.join(output_dir, f"{email_id}_output.json")
+    return await asyncio.get_running_loop().run_in_executor(None, write_atomic, path, data)
@@ -0,0 +1,280 @@
+# profiler.py
+"""
+Profiling for batch runs (orchestrator.py --profile) and the IMAP watcher
+(IMAP_PROFILE).
+
+A daemon thread samples every busy thread's stack each
+PROFILE_SAMPLE_INTERVAL seconds. A sample taken while an email's
+process_email coroutine is on the stack is rooted at that email, so the
+batch's collapsed stacks split into one flame graph per email. Each
+email's wall time is also broken down by pipeline stage and attachment.
+Emails slower than PROFILE_SLOW_EMAIL_SECONDS go into slow_emails.json,
+together with a copy of their input, for benchmarks/bench_slow_emails.py
+to replay.
+
+stage() and timed() cost one context variable lookup for emails not run
+through a ProfileSession. in_thread() runs blocking work on the default
+executor without losing the email's stage timings or stack root.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import shutil
+import cProfile
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from config import PROFILE_DIR, PROFILE_SAMPLE_INTERVAL, PROFILE_SLOW_EMAIL_SECONDS, PROFILE_CPROFILE
+from Logger import logger
+
+# Leaf frames of threads that are waiting for work rather than running
+IDLE_LEAVES = {
+    ("select", "selectors.py"),
+    ("_worker", "thread.py"),
+    ("wait", "threading.py"),
+}
+
+_current = contextvars.ContextVar("profile_record", default=None)
+_sampler = contextvars.ContextVar("profile_sampler", default=None)
+
+
+@contextmanager
+def stage(name):
+    """Add the block's wall time to stage `name` of the email being profiled"""
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record["stages"][name] = record["stages"].get(name, 0.0) + time.perf_counter() - start
+
+
+async def timed(name, awaitable):
+    """Await `awaitable`, timing it as stage `name`"""
+    with stage(name):
+        return await awaitable
+
+
+def _rooted(func, *args):
+    record, sampler = _current.get(), _sampler.get()
+    if record is None or sampler is None:
+        return func(*args)
+    frame = sys._getframe()
+    sampler.track(frame, f"email:{record['email_id']}")
+    try:
+        return func(*args)
+    finally:
+        sampler.untrack(frame)
+
+
+async def in_thread(func, *args):
+    """Run func(*args) on the default executor, in the caller's context"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, context.run, _rooted, func, *args)
+
+
+def note_attachment(filename, kind, seconds, size):
+    """Record an attachment extraction against the email being profiled"""
+    record = _current.get()
+    if record is not None:
+        record["attachments"].append({"filename": filename, "kind": kind, "seconds": round(seconds, 4), "bytes": size})
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Counts collapsed stacks ("root;caller;...;leaf") from a daemon thread"""
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = Counter()
+        self.roots = {}  # frame of a tracked coroutine -> label its samples are rooted at
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def track(self, frame, label):
+        if frame is not None:
+            self.roots[frame] = label
+
+    def untrack(self, frame):
+        self.roots.pop(frame, None)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def take(self):
+        """Counts so far; the next batch starts empty"""
+        with self._lock:
+            counts, self.counts = self.counts, Counter()
+        return counts
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self._sample(frame, names.get(ident, f"thread-{ident}"))
+
+    def _sample(self, frame, thread_name):
+        code = frame.f_code
+        if (code.co_name, os.path.basename(code.co_filename)) in IDLE_LEAVES:
+            return
+        stack, root = [], None
+        while frame is not None and root is None:
+            stack.append(_frame_label(frame))
+            root = self.roots.get(frame)
+            frame = frame.f_back
+        stack.append(root or thread_name)
+        key = ";".join(reversed(stack))
+        with self._lock:
+            self.counts[key] += 1
+
+
+def _safe_name(email_id):
+    return re.sub(r"[^\w.-]", "_", email_id)
+
+
+def _breakdown(record):
+    return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in record["stages"].items())
+
+
+class ProfileSession:
+    """
+    Profiles the emails passed through run(). flush() writes one batch of
+    reports to a new directory under profile_dir and starts the next batch:
+
+    - emails.jsonl: wall time per email, by stage and attachment
+    - stacks.folded: collapsed stacks for flamegraph.pl or speedscope
+    - cprofile.prof: pstats output, when use_cprofile is set
+    - slow_emails.json: emails over slow_seconds, with a copy of each
+      input under inputs/ and its own collapsed stacks under stacks/
+    """
+
+    def __init__(self, profile_dir=PROFILE_DIR, slow_seconds=PROFILE_SLOW_EMAIL_SECONDS,
+                 interval=PROFILE_SAMPLE_INTERVAL, use_cprofile=PROFILE_CPROFILE):
+        self.profile_dir = profile_dir
+        self.slow_seconds = slow_seconds
+        self.use_cprofile = use_cprofile
+        self.sampler = StackSampler(interval)
+        self.records = []
+        self.cprofile = None
+
+    def start(self):
+        """Start sampling; call from the event loop thread so cProfile sees it"""
+        self.sampler.start()
+        self._start_cprofile()
+
+    def _start_cprofile(self):
+        if self.use_cprofile:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def stop(self):
+        """Stop sampling and write the last batch; returns its directory"""
+        self.sampler.stop()
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        self.use_cprofile = False
+        return self.flush()
+
+    async def run(self, process, file_path, email_id):
+        """Await process(file_path, email_id), profiling it as one email"""
+        record = {"email_id": email_id, "path": os.path.abspath(file_path), "stages": {}, "attachments": []}
+        token = _current.set(record)
+        sampler_token = _sampler.set(self.sampler)
+        coro = process(file_path, email_id)
+        frame = getattr(coro, "cr_frame", None)
+        self.sampler.track(frame, f"email:{email_id}")
+        start = time.perf_counter()
+        try:
+            result = await coro
+            if isinstance(result, dict) and "error" in result:
+                record["error"] = result["error"]
+            return result
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 4)
+            record["stages"] = {name: round(seconds, 4) for name, seconds in record["stages"].items()}
+            self.sampler.untrack(frame)
+            _current.reset(token)
+            _sampler.reset(sampler_token)
+            self.records.append(record)
+
+    def flush(self):
+        """Write the current batch's reports; returns the batch directory, or None if no emails ran"""
+        records, self.records = self.records, []
+        counts = self.sampler.take()
+        profile, self.cprofile = self.cprofile, None
+        if profile is not None:
+            profile.disable()
+            self._start_cprofile()
+        if not records:
+            return None
+
+        batch_dir = os.path.join(self.profile_dir, datetime.now().strftime("%Y%m%d-%H%M%S-%f"))
+        os.makedirs(batch_dir)
+        with open(os.path.join(batch_dir, "emails.jsonl"), "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        with open(os.path.join(batch_dir, "stacks.folded"), "w", encoding="utf-8") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        if profile is not None:
+            profile.dump_stats(os.path.join(batch_dir, "cprofile.prof"))
+
+        slow = [record for record in records if record["seconds"] > self.slow_seconds]
+        if slow:
+            self._write_slow_report(batch_dir, slow, counts)
+
+        seconds = sorted(record["seconds"] for record in records)
+        logger.info(
+            f"Profiled {len(records)} emails: median {seconds[len(seconds) // 2]:.2f}s, "
+            f"max {seconds[-1]:.2f}s, {len(slow)} over {self.slow_seconds:g}s; reports in {batch_dir}"
+        )
+        return batch_dir
+
+    def _write_slow_report(self, batch_dir, slow, counts):
+        os.makedirs(os.path.join(batch_dir, "inputs"))
+        os.makedirs(os.path.join(batch_dir, "stacks"))
+        for record in slow:
+            name = _safe_name(record["email_id"])
+            logger.warning(f"Slow email {record['email_id']}: {record['seconds']:.2f}s ({_breakdown(record)})")
+            record["input"] = None
+            if os.path.exists(record["path"]):
+                record["input"] = os.path.join("inputs", name + os.path.splitext(record["path"])[1])
+                shutil.copyfile(record["path"], os.path.join(batch_dir, record["input"]))
+            prefix = f"email:{record['email_id']};"
+            record["stacks"] = os.path.join("stacks", f"{name}.folded")
+            with open(os.path.join(batch_dir, record["stacks"]), "w", encoding="utf-8") as f:
+                for stack, count in counts.most_common():
+                    if stack.startswith(prefix):
+                        f.write(f"{stack} {count}\n")
+
+        report = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "threshold_seconds": self.slow_seconds,
+            "emails": sorted(slow, key=lambda record: -record["seconds"])
+        }
+        with open(os.path.join(batch_dir, "slow_emails.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,153 @@
+# prompt_builder.py
+
+import re
+from cleaner import estimate_tokens, get_token_encoding, extract_reference_sentence
+from config import (
+    PROMPT_TOKEN_BUDGET,
+    ATTACHMENT_SNIPPET_TOKENS
+)
+from rules_registry import get_rules
+
+# Lines that start the quoted history of a reply or forward
+QUOTE_HEADER_RE = re.compile(
+    r"^(?:On\s.+wrote:|-{2,}\s*(?:Original|Forwarded) Message\s*-{2,}|_{10,}|From:\s.+|Sent from my .+)\s*$",
+    re.IGNORECASE | re.MULTILINE
+)
+QUOTED_LINE_RE = re.compile(r"^\s*>.*(?:\n|$)", re.MULTILINE)
+QUOTE_PREFIX_RE = re.compile(r"^\s*>+ ?", re.MULTILINE)
+DISCLAIMER_RE = re.compile(
+    r"\bconfidential|\bintended (?:solely )?for the (?:use of the )?(?:addressee|recipient)|"
+    r"\bprivileged\b|\bdisclaimer\b|\bif you (?:are not|have received this)|\bdo not print this",
+    re.IGNORECASE
+)
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}|\d{1,2}[-\s/]\w{3,9}[-\s/]\d{2,4}|\w+\s\d{1,2},\s\d{4}")
+
+# Below this many tokens the newest message is treated as a bare forward
+MIN_NEWEST_TOKENS = 8
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_token_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def split_newest_message(text):
+    """Split a body into the newest message and its quoted reply chain."""
+    match = QUOTE_HEADER_RE.search(text)
+    newest, history = (text[:match.start()], text[match.start():]) if match else (text, "")
+    return QUOTED_LINE_RE.sub("", newest).strip(), history.strip()
+
+
+def remove_disclaimers(text, rules=None):
+    """
+    Drop a trailing legal disclaimer. Lines are checked one by one (cleaned
+    bodies have no blank lines to split paragraphs on); the text is cut at
+    the first line after the first that reads as a disclaimer, provided no
+    line from there on mentions an amount or a date. Never returns an empty
+    string for non-empty text.
+    """
+    rules = rules or get_rules()
+    lines = text.split("\n")
+    for i in range(1, len(lines)):
+        if DISCLAIMER_RE.search(lines[i]):
+            tail = "\n".join(lines[i:])
+            if not rules.amount_re.search(tail) and not DATE_RE.search(tail):
+                return "\n".join(lines[:i]).strip() or text.strip()
+    return text.strip()
+
+
+def score_sentence(sentence, rules=None):
+    """Relevance of a sentence for classification: keywords, amounts and dates."""
+    rules = rules or get_rules()
+    keywords = rules.prompt_keyword_re.findall(sentence) if rules.prompt_keyword_re else []
+    return (
+        2 * len(keywords)
+        + len(rules.amount_re.findall(sentence))
+        + len(DATE_RE.findall(sentence))
+    )
+
+
+def select_sentences(text, max_tokens, rules=None):
+    """Keep the highest scoring sentences (in original order) within max_tokens."""
+    rules = rules or get_rules()
+    sentences = [s.strip() for s in SENTENCE_SPLIT_RE.split(text) if s and s.strip()]
+    if not sentences:
+        return ""
+
+    # The reference sentence always goes first, then by relevance
+    lead = extract_reference_sentence(text)
+    lead_index = next((i for i, s in enumerate(sentences) if s in lead), 0)
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (i != lead_index, -score_sentence(sentences[i], rules), i)
+    )
+
+    chosen, used = set(), 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost > max_tokens:
+            continue
+        chosen.add(i)
+        used += cost
+
+    if not chosen:
+        return truncate_to_tokens(sentences[ranked[0]], max_tokens)
+    return "\n".join(sentences[i] for i in sorted(chosen))
+
+
+def build_email_context(body, attachments=None, budget=PROMPT_TOKEN_BUDGET,
+                        snippet_tokens=ATTACHMENT_SNIPPET_TOKENS, rules=None):
+    """
+    Compact an email body plus attachment texts into at most `budget` tokens.
+
+    The newest message is kept whole when it fits, otherwise its most relevant
+    sentences are; quoted history is only used for bare forwards. Attachment
+    snippets fill the remaining budget. Returns (context, stats).
+    """
+    rules = rules or get_rules()
+    attachments = attachments or []
+    attachment_texts = [
+        (att.filename or "attachment", att.content)
+        for att in attachments
+        if att.content and not att.content.startswith("[")
+    ]
+    original_tokens = estimate_tokens(body) + sum(estimate_tokens(t) for _, t in attachment_texts)
+
+    newest, history = split_newest_message(body or "")
+    if estimate_tokens(newest) < MIN_NEWEST_TOKENS and history:
+        newest = f"{newest}\n{QUOTE_PREFIX_RE.sub('', history)}".strip()
+    # Never compact the body away entirely; fall back to the uncompacted text
+    newest = remove_disclaimers(newest, rules) or (body or "").strip()
+
+    # Reserve room for attachment snippets, but never more than half the budget
+    reserved = min(budget // 2, snippet_tokens * len(attachment_texts))
+    body_budget = budget - reserved
+    body_text = newest if estimate_tokens(newest) <= body_budget else select_sentences(newest, body_budget, rules)
+
+    remaining = budget - estimate_tokens(body_text)
+    snippets = []
+    for filename, content in attachment_texts:
+        header = f"[Attachment: {filename}]"
+        allowance = min(snippet_tokens, remaining) - estimate_tokens(header) - 1
+        if allowance <= 0:
+            break
+        snippet = select_sentences(remove_disclaimers(content, rules), allowance, rules)
+        if snippet:
+            snippets.append(f"{header}\n{snippet}")
+            remaining -= estimate_tokens(snippets[-1]) + 1
+
+    context = "\n\n".join([body_text] + snippets).strip()
+    context_tokens = estimate_tokens(context)
+    return context, {
+        "original_tokens": original_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": max(0, original_tokens - context_tokens),
+        "compacted": context_tokens < original_tokens
+    }
@@ -0,0 +1,66 @@
+# records.py
+"""
+Records passed between pipeline stages. They are slotted dataclasses, so
+an instance carries no per-object __dict__. to_dict() returns the
+JSON-shaped view written to outputs; it shares the record's strings and
+lists instead of copying them.
+"""
+
+from dataclasses import dataclass, field
+
+
+@dataclass(slots=True)
+class Attachment:
+    filename: str
+    content: str
+
+    def to_dict(self):
+        return {"filename": self.filename, "content": self.content}
+
+
+@dataclass(slots=True)
+class ParsedEmail:
+    subject: str = ""
+    sender: str = "unknown"
+    to: str = "unknown"
+    date: str = "unknown"
+    body: str = ""
+    attachments: list = field(default_factory=list)
+
+    def headers(self):
+        return {"subject": self.subject, "from": self.sender, "to": self.to, "date": self.date}
+
+    def attachment_texts(self):
+        """Attachment contents as separate segments, never joined into one copy"""
+        return [att.content for att in self.attachments]
+
+
+@dataclass(slots=True)
+class Classification:
+    primary_request: dict
+    secondary_requests: list = field(default_factory=list)
+    prompt_stats: dict = field(default_factory=dict)
+    model_routing: dict = field(default_factory=dict)
+
+    @property
+    def request_type(self):
+        return self.primary_request.get("request_type")
+
+    def to_dict(self):
+        return {
+            "primary_request": self.primary_request,
+            "secondary_requests": self.secondary_requests,
+            "prompt_stats": self.prompt_stats,
+            "model_routing": self.model_routing
+        }
+
+
+@dataclass(slots=True)
+class ExtractedFields:
+    amounts: list = field(default_factory=list)
+    dates: list = field(default_factory=list)
+    names: list = field(default_factory=list)
+    patterns: dict = field(default_factory=dict)  # FIELD_PATTERNS matches, e.g. deal_name
+
+    def to_dict(self):
+        return {"amounts": self.amounts, "dates": self.dates, "names": self.names, **self.patterns}
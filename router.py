@@ -0,0 +1,131 @@
+# router.py
+
+import re
+import difflib
+from functools import lru_cache
+from config import (
+    REQUEST_TYPE_MAPPINGS,
+    TEAM_MAP,
+    SUBJECT_RULES,
+    ROUTING_FUZZY_THRESHOLD
+)
+
+DEFAULT_TEAM = "General Servicing Team"
+FALLBACK_REQUEST_TYPE = "Others"
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+_SPACE_RE = re.compile(r"\s+")
+# Words that carry no routing signal in LLM labels
+_STOPWORDS = {"a", "an", "the", "of", "for", "and", "to", "request", "notice", "type"}
+
+
+def canonicalize(label):
+    """Case and punctuation folding: 'Money-Movement (Outbound)' -> 'money movement outbound'"""
+    text = str(label or "").casefold().replace("&", " and ")
+    return _SPACE_RE.sub(" ", _PUNCTUATION_RE.sub(" ", text)).strip()
+
+
+def token_key(label):
+    """Order-insensitive key: 'Repayment - Principal' and 'Principal Repayment' agree"""
+    return " ".join(sorted(set(canonicalize(label).split()) - _STOPWORDS))
+
+
+class RoutingEngine:
+    """
+    Maps free-form request type labels to a canonical request type and team.
+
+    Everything is compiled once in the constructor: an alias index keyed by
+    raw, canonical and token-set forms of every known label, a single regex
+    over the SUBJECT_RULES keywords, and the candidate list for fuzzy
+    matching. Lookups are memoized per label.
+    """
+
+    def __init__(self, request_type_mappings, team_map, subject_rules,
+                 fuzzy_threshold=ROUTING_FUZZY_THRESHOLD, cache_size=4096):
+        self.team_map = dict(team_map)
+        self.fuzzy_threshold = fuzzy_threshold
+        self.exact, self.canonical, self.tokens = {}, {}, {}
+
+        known = {name: request_type_mappings.get(name, name) for name in team_map}
+        for rule in subject_rules.values():
+            known.setdefault(rule["request_type"], rule["request_type"])
+        known.update(request_type_mappings)
+        for label, request_type in known.items():
+            self.exact.setdefault(label, request_type)
+            self.canonical.setdefault(canonicalize(label), request_type)
+            self.tokens.setdefault(token_key(label), request_type)
+
+        keyword_types = {
+            canonicalize(kw): rule["request_type"]
+            for rule in subject_rules.values()
+            for kw in rule.get("keywords", [])
+        }
+        self.keyword_types = keyword_types
+        self.keyword_re = re.compile(
+            r"\b(?:" + "|".join(re.escape(kw) for kw in sorted(keyword_types, key=len, reverse=True)) + r")\b"
+        ) if keyword_types else None
+        self.fuzzy_candidates = list(self.canonical)
+
+        self._resolve = lru_cache(maxsize=cache_size)(self._resolve_uncached)
+
+    def _resolve_uncached(self, label):
+        """(request_type, match_method) for one label"""
+        if label in self.exact:
+            return self.exact[label], "exact"
+
+        canonical = canonicalize(label)
+        if not canonical:
+            return FALLBACK_REQUEST_TYPE, "fallback"
+        if canonical in self.canonical:
+            return self.canonical[canonical], "alias"
+
+        key = token_key(label)
+        if key in self.tokens:
+            return self.tokens[key], "token_set"
+
+        if self.keyword_re:
+            match = self.keyword_re.search(canonical)
+            if match:
+                return self.keyword_types[match.group(0)], "keyword"
+
+        if self.fuzzy_threshold:
+            close = difflib.get_close_matches(canonical, self.fuzzy_candidates, n=1,
+                                              cutoff=self.fuzzy_threshold)
+            if close:
+                return self.canonical[close[0]], "fuzzy"
+
+        return FALLBACK_REQUEST_TYPE, "fallback"
+
+    def normalize(self, label):
+        """Canonical request type for a label"""
+        return self._resolve(label or FALLBACK_REQUEST_TYPE)[0]
+
+    def route(self, label):
+        """Routing decision for one request type label"""
+        request_type, method = self._resolve(label or FALLBACK_REQUEST_TYPE)
+        return {
+            "request_type": request_type,
+            "assigned_team": self.team_map.get(request_type, DEFAULT_TEAM),
+            "match": method
+        }
+
+    def route_classification(self, classification_data):
+        label = classification_data.get("primary_request", {}).get("request_type", FALLBACK_REQUEST_TYPE)
+        return self.route(label)
+
+    def route_batch(self, classifications):
+        """Route many classifications (or raw labels); each distinct label is resolved once"""
+        labels = [
+            c.get("primary_request", {}).get("request_type", FALLBACK_REQUEST_TYPE) if isinstance(c, dict) else c
+            for c in classifications
+        ]
+        decisions = {label: self.route(label) for label in set(labels)}
+        return [dict(decisions[label]) for label in labels]
+
+    def cache_info(self):
+        return self._resolve.cache_info()
+
+
+def build_router():
+    """Routing engine compiled from the current config"""
+    return RoutingEngine(REQUEST_TYPE_MAPPINGS, TEAM_MAP, SUBJECT_RULES)
@@ -0,0 +1,237 @@
+# rules_registry.py
+"""
+Routing, classification and extraction rules, compiled once per version and
+reloaded when the rules file changes.
+
+RULES_FILE (YAML or JSON) may set any of the keys in RULE_KEYS; missing keys
+fall back to the defaults in config.py. `get_rules()` returns the current
+CompiledRules snapshot. A snapshot is never mutated: a reload compiles a new
+one and swaps the reference, so an email keeps the snapshot it started with
+while later emails pick up the change. A file that fails to load or compile
+is logged and the previous snapshot stays in service.
+
+    python rules_registry.py --dump rules.yaml   # write the defaults as a starting file
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
+import config
+from config import RULES_FILE, RULES_RELOAD_INTERVAL
+from router import RoutingEngine
+from Logger import logger
+
+try:
+    import yaml
+except ImportError:  # Optional: only needed for YAML rules files
+    yaml = None
+
+RULE_KEYS = (
+    "subject_rules",
+    "team_map",
+    "request_type_mappings",
+    "field_patterns",
+    "amount_regex",
+    "currency_symbols",
+    "currency_codes",
+    "allowed_tags"
+)
+
+
+def default_rules():
+    """The built-in rules from config.py"""
+    return {
+        "subject_rules": config.SUBJECT_RULES,
+        "team_map": config.TEAM_MAP,
+        "request_type_mappings": config.REQUEST_TYPE_MAPPINGS,
+        "field_patterns": config.FIELD_PATTERNS,
+        "amount_regex": config.AMOUNT_REGEX,
+        "currency_symbols": config.CURRENCY_SYMBOLS,
+        "currency_codes": sorted(config.CURRENCY_CODES),
+        "allowed_tags": sorted(config.ALLOWED_TAGS)
+    }
+
+
+def _alternation(words, prefix=""):
+    return re.compile(
+        prefix + "(?:" + "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)) + ")",
+        re.IGNORECASE
+    ) if words else None
+
+
+class CompiledRules:
+    """One immutable, ready-to-use version of the rules"""
+
+    def __init__(self, raw):
+        unknown = set(raw) - set(RULE_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown rule keys: {', '.join(sorted(unknown))}")
+        raw = {**default_rules(), **raw}
+        self.raw = raw
+        self.version = hashlib.sha256(
+            json.dumps(raw, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:12]
+
+        self.subject_rules = dict(raw["subject_rules"])
+        self.team_map = dict(raw["team_map"])
+        self.request_type_mappings = dict(raw["request_type_mappings"])
+        self.field_patterns = {
+            name: re.compile(pattern, re.IGNORECASE) for name, pattern in raw["field_patterns"].items()
+        }
+        self.amount_re = re.compile(raw["amount_regex"], re.IGNORECASE | re.VERBOSE)
+        self.currency_symbols = dict(raw["currency_symbols"])
+        self.currency_codes = set(raw["currency_codes"])
+        self.allowed_tags = set(raw["allowed_tags"])
+        self.router = RoutingEngine(self.request_type_mappings, self.team_map, self.subject_rules)
+
+        # Subject rule keywords in one overlapping scan. The first declared rule
+        # with any keyword in the text wins; a match also stands for every
+        # shorter keyword that is its prefix at the same position.
+        self.rule_names = list(self.subject_rules)
+        first_rule = {}
+        for i, rule in enumerate(self.subject_rules.values()):
+            for kw in rule.get("keywords", []):
+                first_rule.setdefault(kw.lower(), i)
+        self.keyword_rank = {
+            kw: min(rank for other, rank in first_rule.items() if kw.startswith(other))
+            for kw in first_rule
+        }
+        alternation = _alternation(first_rule)
+        self.subject_keyword_re = re.compile(f"(?=({alternation.pattern}))", re.IGNORECASE) if alternation else None
+
+        # Sentence scoring in prompt_builder: rule keywords and tags at word starts
+        self.prompt_keyword_re = _alternation(set(first_rule) | self.allowed_tags, prefix=r"\b")
+
+    def match_subject_rule(self, text):
+        """(rule_name, rule) of the first rule with a keyword in text, or None"""
+        if self.subject_keyword_re is None:
+            return None
+        best = None
+        for match in self.subject_keyword_re.finditer(text.lower()):
+            rank = self.keyword_rank[match.group(1)]
+            if best is None or rank < best:
+                best = rank
+                if rank == 0:
+                    break
+        if best is None:
+            return None
+        name = self.rule_names[best]
+        return name, self.subject_rules[name]
+
+    def matching_subject_rules(self, text):
+        """Names of all rules with a keyword in text, in declaration order"""
+        if self.subject_keyword_re is None:
+            return []
+        ranks = {self.keyword_rank[m.group(1)] for m in self.subject_keyword_re.finditer(text.lower())}
+        return [self.rule_names[rank] for rank in sorted(ranks)]
+
+
+def load_rules_file(path):
+    """Raw rules from a YAML or JSON file"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ImportError("PyYAML is required for YAML rules files (pip install pyyaml)")
+            data = yaml.safe_load(f) or {}
+        else:
+            data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} must contain a mapping of rule keys")
+    return data
+
+
+class RulesRegistry:
+    """
+    Holds the current CompiledRules. The file is stat()ed at most every
+    `check_interval` seconds by whichever caller asks for the rules; only a
+    changed file is re-read and compiled.
+    """
+
+    def __init__(self, path=RULES_FILE, check_interval=RULES_RELOAD_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stamp = self._file_stamp()
+        self._checked = time.monotonic()
+        self._current = CompiledRules(load_rules_file(path) if self._stamp else {})
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    @property
+    def version(self):
+        return self._current.version
+
+    def current(self):
+        if self.check_interval is not None and time.monotonic() - self._checked >= self.check_interval:
+            self.reload_if_changed()
+        return self._current
+
+    def reload_if_changed(self):
+        """Swap in a newly compiled snapshot if the file changed; True if swapped"""
+        if not self._lock.acquire(blocking=False):
+            return False  # another caller is already reloading
+        try:
+            self._checked = time.monotonic()
+            stamp = self._file_stamp()
+            if stamp == self._stamp:
+                return False
+            self._stamp = stamp
+            try:
+                snapshot = CompiledRules(load_rules_file(self.path) if stamp else {})
+            except Exception as e:
+                logger.error(f"Keeping rules version {self._current.version}; failed to load {self.path}: {e}")
+                return False
+            if snapshot.version == self._current.version:
+                return False
+            self._current = snapshot
+            logger.info(f"Loaded rules version {snapshot.version} from {self.path if stamp else 'defaults'}")
+            return True
+        finally:
+            self._lock.release()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = RulesRegistry()
+    return _registry
+
+
+def get_rules():
+    """The current compiled rules snapshot"""
+    return get_registry().current()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or export the rules")
+    parser.add_argument("--dump", metavar="PATH", help="Write the built-in rules to a YAML or JSON file")
+    args = parser.parse_args()
+
+    if args.dump:
+        rules = default_rules()
+        with open(args.dump, "w", encoding="utf-8") as f:
+            if args.dump.lower().endswith((".yaml", ".yml")):
+                if yaml is None:
+                    raise SystemExit("PyYAML is required to write YAML (pip install pyyaml)")
+                yaml.safe_dump(rules, f, sort_keys=False, allow_unicode=True)
+            else:
+                json.dump(rules, f, indent=2, ensure_ascii=False)
+        print(f"Wrote rules version {CompiledRules(rules).version} to {args.dump}")
+    else:
+        rules = get_rules()
+        print(f"Rules version {rules.version} ({RULES_FILE if os.path.exists(RULES_FILE) else 'defaults'})")
@@ -1,10 +1,13 @@
 import sys
 import os
+import json
 import pytest
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from llm_classifier import rule_based_classification
+import llm_classifier
+from llm_classifier import rule_based_classification, score_complexity
 from config import SUBJECT_RULES
+from records import Attachment
 
 def test_rule_based_fallback():
     """Test now matches actual behavior of returning 'Others' as default"""
@@ -22,4 +25,42 @@ def test_rule_based_fallback():
         assert result["primary_request"]["request_type"] in ("Commitment Change", "Others")
     else:
         assert "request_type" in result
-        assert result["request_type"] in ("Commitment Change", "Others")
\ No newline at end of file
+        assert result["request_type"] in ("Commitment Change", "Others")
+
+def test_complexity_score_separates_simple_and_complex():
+    simple, _ = score_complexity("Fee paid", "The agency fee of USD 15,000.00 has been paid.")
+    complex_score, factors = score_complexity(
+        "Amendment",
+        "Reallocate USD 40,000,000.00: USD 12,500,000.00 on 15-Apr-2025, USD 27,500,000.00 on "
+        "15-May-2025 and USD 1,000.00 on 16-May-2025; votes due 10-Apr-2025.",
+        [Attachment("amendment.pdf", "Amendment No. 3"), Attachment("x.bin", "[UNSUPPORTED ATTACHMENT TYPE]")]
+    )
+    assert simple < 1
+    assert factors["amounts"] == 4 and factors["dates"] == 4 and factors["attachments"] == 1
+    assert complex_score > llm_classifier.MODEL_ROUTING_MAX_COMPLEXITY
+
+async def test_low_confidence_fast_answer_escalates(monkeypatch):
+    calls = []
+
+    async def fake_complete(messages, on_primary, model, max_tokens):
+        calls.append((model, max_tokens))
+        primary = {
+            "request_type": "Fee Notification", "priority": "Low", "sub_request_type": "Fee",
+            "primary_intent": "Fee paid", "confidence": 40 if model == "small" else 95, "reasoning": "-"
+        }
+        return json.dumps({"primary_request": primary}), {"prompt_tokens": 100, "completion_tokens": 50}
+
+    monkeypatch.setattr(llm_classifier, "_complete", fake_complete)
+    monkeypatch.setattr(llm_classifier, "OPENAI_MODEL", "large")
+    monkeypatch.setattr(llm_classifier, "OPENAI_FAST_MODEL", "small")
+
+    result = await llm_classifier.classify_email("Fee paid", "The agency fee of USD 15,000.00 has been paid.")
+    assert calls == [("small", llm_classifier.OPENAI_FAST_MAX_TOKENS), ("large", llm_classifier.OPENAI_MAX_TOKENS)]
+    assert result.model_routing["model"] == "large"
+    assert "confidence 40" in result.model_routing["attempts"][0]["escalated"]
+    assert result.primary_request["confidence"] == 95
+
+    # Complex emails skip the fast model
+    calls.clear()
+    await llm_classifier.classify_email("Update", "Please see below. " * 400)
+    assert calls == [("large", llm_classifier.OPENAI_MAX_TOKENS)]
@@ -0,0 +1,35 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cleaner import clean_text, clean_email_body
+
+raw_email = """Dear Agent,   \r\n\r\n   Please remit €5,000.00 on 14-Mar-2024.\t\tThanks.
+
+
+Kind regards,
+Jane Doe
+"""
+
+def test_clean_text_single_pass():
+    """Signature dropped, currency/date standardized, whitespace collapsed"""
+    cleaned = clean_text(raw_email)
+    assert cleaned == "Dear Agent,\nPlease remit EUR 5,000.00 on 2024-03-14. Thanks."
+
+def test_clean_text_options():
+    cleaned = clean_text(raw_email, {"remove_signature": False, "standardize_dates": False})
+    assert "14-Mar-2024" in cleaned
+    assert cleaned.endswith("Kind regards,\nJane Doe")
+
+def test_whitespace_variants_clean_identically():
+    assert clean_text("Pay  USD 100\n\n now") == clean_text("Pay USD 100 \n now  ")
+
+def test_clean_email_body_reports_token_savings():
+    cleaned, stats = clean_email_body(raw_email)
+    assert stats["tokens_saved"] == stats["raw_tokens"] - stats["cleaned_tokens"]
+    assert stats["tokens_saved"] > 0
+
+def test_signature_with_irregular_spacing_is_removed():
+    for closing in ("Kind   regards,", "Thanks &  Regards", "Kind\tregards,", "Best regards,"):
+        body = f"Please repay USD 5,000.\n{closing}\nJane Doe\nAgency Bank"
+        assert clean_text(body) == "Please repay USD 5,000."
@@ -1,18 +1,28 @@
 import sys
 import os
+import asyncio
 import pytest
 import pytest_asyncio
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from deduplicator import check_duplicate
+from deduplicator import (
+    check_duplicate,
+    close_connections,
+    content_fingerprint,
+    find_cached_result,
+    load_result,
+    store_result
+)
 
 @pytest_asyncio.fixture
 async def clean_dedup_db():
     """Fixture to clean dedup database before each test"""
     from config import DEDUP_DB
+    close_connections()
     if os.path.exists(DEDUP_DB):
         os.remove(DEDUP_DB)
     yield
+    close_connections()
     if os.path.exists(DEDUP_DB):
         os.remove(DEDUP_DB)
 
@@ -43,4 +53,79 @@ async def test_deduplication_repeat(clean_dedup_db):
         request_type="Others",
         date_str="2024-03-01"
     )
-    assert result["is_duplicate"] is True
\ No newline at end of file
+    assert result["is_duplicate"] is True
+
+def _check_in_subprocess(email_id):
+    import asyncio
+    return asyncio.run(check_duplicate(
+        email_id=email_id,
+        cleaned_text="Same notice sent to several distribution lists.",
+        request_type="Others",
+        date_str="2024-03-01"
+    ))["is_duplicate"]
+
+def test_deduplication_across_processes(clean_dedup_db):
+    import multiprocessing
+    with multiprocessing.Pool(4) as pool:
+        results = pool.map(_check_in_subprocess, [f"email_dl_{i}" for i in range(8)])
+    assert results.count(False) == 1
+
+def test_content_fingerprint_ignores_headers_and_whitespace(tmp_path):
+    body = b"Please process the repayment.\nAmount: USD 20,000,000\n"
+    first = tmp_path / "a.eml"
+    first.write_bytes(b"To: list1@example.com\nSubject: Notice\n\n" + body)
+    second = tmp_path / "b.eml"
+    second.write_bytes(b"To: list2@example.com\r\nX-List: ops\r\nSubject: Notice\r\n\r\n" + body.replace(b"\n", b"\r\n"))
+    other = tmp_path / "c.eml"
+    other.write_bytes(b"Subject: Notice\n\nPlease process the drawdown.\n")
+
+    assert content_fingerprint(str(first)) == content_fingerprint(str(second))
+    assert content_fingerprint(str(first)) != content_fingerprint(str(other))
+
+@pytest.mark.asyncio
+async def test_stored_result_found_by_content_hash(clean_dedup_db):
+    await check_duplicate("email_orig", "Stored result body.", None, "2024-03-01", content_hash="abc123")
+    assert await find_cached_result("abc123") is None  # not processed yet
+
+    output = {"email_id": "email_orig", "routing": {"request_type": "Fee Payment"}}
+    await store_result("email_orig", output)
+
+    assert await find_cached_result("abc123") == {"email_id": "email_orig", "output": output}
+    assert await find_cached_result("abc123", "email_orig") is None  # its own row
+    assert await load_result("email_orig") == output
+    assert await find_cached_result("other") is None
+
+@pytest.mark.asyncio
+async def test_store_result_reuses_serialized_output(clean_dedup_db):
+    from output_writer import dumps
+    await check_duplicate("email_bytes", "Serialized once body.", None, "2024-03-02", content_hash="def456")
+
+    output = {"email_id": "email_bytes", "subject": "Facility Upsize – ASTRA", "routing": {"request_type": "Fee Payment"}}
+    await store_result("email_bytes", output, dumps(output))
+
+    assert await load_result("email_bytes") == output
+    assert (await find_cached_result("def456"))["output"] == output
+
+@pytest.mark.asyncio
+async def test_waiting_for_the_write_lock_does_not_block_the_event_loop(clean_dedup_db):
+    import deduplicator
+    blocker = deduplicator.connect()
+    blocker.execute("BEGIN IMMEDIATE")
+    check = asyncio.ensure_future(check_duplicate("email_wait", "Waits for the write lock.", None, "2024-03-03"))
+    await asyncio.sleep(0.2)  # the loop keeps running while the check waits
+    assert not check.done()
+    blocker.execute("COMMIT")
+    blocker.close()
+    assert (await check)["is_duplicate"] is False
+
+@pytest.mark.asyncio
+async def test_store_connection_is_reused(clean_dedup_db, monkeypatch):
+    import deduplicator
+    opened = []
+    connect = deduplicator.connect
+    monkeypatch.setattr(deduplicator, "connect", lambda path=None: opened.append(path) or connect(path))
+
+    await check_duplicate("email_reuse", "Reused connection body.", None, "2024-03-04", content_hash="ghi789")
+    await store_result("email_reuse", {"email_id": "email_reuse"})
+    assert await load_result("email_reuse") == {"email_id": "email_reuse"}
+    assert len(opened) == 1
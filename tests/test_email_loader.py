@@ -0,0 +1,98 @@
+import sys
+import os
+import io
+import zipfile
+import pytest
+from email.message import EmailMessage
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import email_loader
+from email_loader import parse_eml_file, parse_eml_file_streaming
+
+@pytest.fixture
+def large_eml(tmp_path):
+    """Multipart email with an oversized image and a non-extractable attachment"""
+    msg = EmailMessage()
+    msg["Subject"] = "Repayment Notice"
+    msg["From"] = "agent@bank.com"
+    msg["To"] = "ops@client.com"
+    msg["Date"] = "Wed, 26 Mar 2025 09:14:29 +0000"
+    msg.set_content("Please process the repayment of USD 5,000,000.00 = principal.\n" * 50)
+    msg.add_alternative("<html><body><p>HTML version</p></body></html>", subtype="html")
+    msg.add_attachment(os.urandom(200_000), maintype="image", subtype="png", filename="scan.png")
+    msg.add_attachment(os.urandom(50_000), maintype="application", subtype="octet-stream", filename="data.bin")
+    path = tmp_path / "large.eml"
+    path.write_bytes(bytes(msg))
+    return str(path)
+
+def test_streaming_matches_full_parse(large_eml, monkeypatch):
+    monkeypatch.setattr(email_loader, "MAX_ATTACHMENT_BYTES", 100_000)
+    streamed = parse_eml_file_streaming(large_eml)
+    assert streamed == parse_eml_file(large_eml)
+    assert streamed.body.count("USD 5,000,000.00 = principal.") == 50
+
+def test_attachment_size_limits(large_eml, monkeypatch):
+    monkeypatch.setattr(email_loader, "MAX_ATTACHMENT_BYTES", 100_000)
+    monkeypatch.setattr(email_loader, "STREAMING_PARSE_MIN_BYTES", 0)
+    contents = {att.filename: att.content for att in parse_eml_file(large_eml).attachments}
+    assert contents["scan.png"] == email_loader.TOO_LARGE_MARKER
+    assert contents["data.bin"] == email_loader.UNSUPPORTED_MARKER
+
+def png_bytes(size):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def test_sniff_prefers_content_over_name():
+    assert email_loader.sniff_type(b"%PDF-1.7\n", "scan.png") == "pdf"
+    assert email_loader.sniff_type(png_bytes((4, 4)), "invoice.pdf") == "image"
+    assert email_loader.sniff_type(b"a,b\n1,2\n", "rates.csv") == "csv"
+    assert email_loader.sniff_type(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "old.doc") is None
+    assert email_loader.sniff_type(b"\x00\x01", "data.bin", "application/octet-stream") is None
+
+@pytest.fixture
+def nested_eml(tmp_path):
+    """Email carrying a CSV, a zipped CSV, a forwarded email and an inline logo"""
+    forwarded = EmailMessage()
+    forwarded["Subject"] = "Original drawdown request"
+    forwarded["From"] = "borrower@client.com"
+    forwarded.set_content("Drawdown of EUR 2,000,000.00 on 1 April.")
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("fees/schedule.csv", "fee;amount\nagency;1500\n")
+        zf.writestr("notes.bin", b"\x00\x01\x02")
+
+    msg = EmailMessage()
+    msg["Subject"] = "FW: Drawdown"
+    msg["From"] = "agent@bank.com"
+    msg.set_content("See attached.")
+    msg.add_attachment("Facility,Amount\nTerm Loan A,\"5,000,000\"\n".encode(), maintype="text",
+                       subtype="csv", filename="positions.csv")
+    msg.add_attachment(archive.getvalue(), maintype="application", subtype="zip", filename="fees.zip")
+    msg.add_attachment(forwarded)
+    msg.add_attachment(png_bytes((120, 40)), maintype="image", subtype="png",
+                       filename="logo.png", disposition="inline", cid="<logo@bank>")
+    path = tmp_path / "nested.eml"
+    path.write_bytes(bytes(msg))
+    return str(path)
+
+def test_nested_attachments(nested_eml):
+    email_loader.reset_extraction_stats()
+    parsed = parse_eml_file(nested_eml)
+    contents = {att.filename: att.content for att in parsed.attachments}
+
+    assert parsed.body.strip() == "See attached."
+    assert contents["positions.csv"] == "Facility\tAmount\nTerm Loan A\t5,000,000"
+    assert contents["fees.zip"] == "--- fees/schedule.csv ---\nfee\tamount\nagency\t1500"
+    assert "Subject: Original drawdown request" in contents["attached.eml"]
+    assert "Drawdown of EUR 2,000,000.00 on 1 April." in contents["attached.eml"]
+    assert contents["logo.png"] == email_loader.INLINE_IMAGE_MARKER
+
+    stats = email_loader.get_extraction_stats()
+    assert stats["csv"]["count"] == 2
+    assert {"zip", "eml", "image"} <= set(stats)
+
+def test_nested_attachments_streaming(nested_eml):
+    assert parse_eml_file_streaming(nested_eml) == parse_eml_file(nested_eml)
@@ -15,7 +15,7 @@ Date: 2023-11-15
 @pytest.mark.asyncio
 async def test_field_extraction():
     """Updated to test what the extractor actually returns"""
-    fields = await extract_all_fields(sample_text)
+    fields = (await extract_all_fields(sample_text)).to_dict()
     
     # Required fields
     assert isinstance(fields, dict)
@@ -30,4 +30,15 @@ async def test_field_extraction():
         assert any(isinstance(amt.get("amount"), (int, float)) 
                   for amt in fields["amounts"])
     
-    # No longer requiring specific CUSIP/ISIN fields
\ No newline at end of file
+    # No longer requiring specific CUSIP/ISIN fields
+
+@pytest.mark.asyncio
+async def test_field_extraction_segments():
+    """Body and attachment texts can be passed as segments instead of one joined string"""
+    attachment = "Repayment of EUR 2,500.00 on 2023-12-01"
+    joined = await extract_all_fields(sample_text + "\n\n" + attachment)
+    segmented = await extract_all_fields([sample_text, attachment])
+
+    assert segmented.amounts == joined.amounts
+    assert sorted(segmented.dates) == sorted(joined.dates)
+    assert segmented.patterns == joined.patterns
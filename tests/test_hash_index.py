@@ -0,0 +1,111 @@
+import sys
+import os
+import time
+import hashlib
+import numpy as np
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from hash_index import HashIndex, BloomFilter, IndexLockedError, truncate_hash
+
+NOW = int(time.time())
+DAY = 86400
+
+
+def digest(i):
+    return hashlib.sha256(str(i).encode()).hexdigest()
+
+
+def open_index(path, **kwargs):
+    options = dict(shards=4, window_seconds=DAY, retention_seconds=30 * DAY, capacity=1000, merge_threshold=0)
+    options.update(kwargs)
+    return HashIndex(str(path), **options)
+
+
+def test_check_and_add_survives_reopen(tmp_path):
+    index = open_index(tmp_path)
+    assert index.check_and_add(digest(1), timestamp=NOW) is False
+    assert index.check_and_add(digest(1), timestamp=NOW) is True
+    index.close()
+
+    index = open_index(tmp_path)
+    assert digest(1) in index
+    assert digest(2) not in index
+    index.close()
+
+
+def test_merge_moves_hashes_to_sorted_shards(tmp_path):
+    index = open_index(tmp_path)
+    for i in range(200):
+        index.add(digest(i), timestamp=NOW)
+    index.merge()
+
+    assert index.stats()["delta_entries"] == 0
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("delta-")
+                and os.path.getsize(tmp_path / name)]
+    assert all(digest(i) in index for i in range(200))
+    assert index.lookups["disk_searches"] == 200
+
+    # Misses are answered by the Bloom filter without a disk search
+    misses = sum(digest(i) in index for i in range(1000, 2000))
+    assert misses <= 5
+    assert index.lookups["bloom_rejects"] >= 995
+    index.close()
+
+    shard = np.fromfile(next((tmp_path / f"window-{NOW // DAY * DAY}").glob("shard-*.idx")), dtype="S16")
+    assert list(shard) == sorted(shard)
+
+
+def test_bulk_and_single_bloom_adds_agree():
+    keys = [truncate_hash(digest(i)) for i in range(500)] + [b"\x01" * 8 + b"\x00" * 8]
+    bulk = BloomFilter(1000, 0.001)
+    bulk.add_many(np.frombuffer(b"".join(keys), dtype="S16"))
+    single = BloomFilter(1000, 0.001)
+    for key in keys:
+        single.add(key)
+    assert bulk.bits == single.bits
+    assert all(key in bulk for key in keys)
+
+
+def test_retention_drops_expired_windows(tmp_path):
+    index = open_index(tmp_path, retention_seconds=60 * DAY)
+    index.add(digest("old"), timestamp=NOW - 40 * DAY)
+    index.add(digest("new"), timestamp=NOW)
+    index.merge()
+    assert digest("old") in index
+
+    assert index.purge_expired(now=NOW + 25 * DAY) == [(NOW - 40 * DAY) // DAY * DAY]
+    assert digest("old") not in index
+    assert digest("new") in index
+    assert not (tmp_path / f"window-{(NOW - 40 * DAY) // DAY * DAY}").exists()
+    index.close()
+
+
+def test_recovers_torn_delta_and_interrupted_merge(tmp_path):
+    index = open_index(tmp_path)
+    index.add(digest(1), timestamp=NOW)
+    index.close()
+    window = NOW // DAY * DAY
+
+    # A crash mid-merge leaves a .merging delta; a crash mid-append a torn record
+    os.replace(tmp_path / f"delta-{window}.log", tmp_path / f"delta-{window}.merging")
+    with open(tmp_path / f"delta-{window}.log", "wb") as f:
+        f.write(truncate_hash(digest(2)) + b"\x00" * 5)
+
+    index = open_index(tmp_path)
+    assert digest(1) in index and digest(2) in index
+    index.add(digest(3), timestamp=NOW)
+    index.close()
+
+    assert os.path.getsize(tmp_path / f"delta-{window}.log") == 3 * 16
+    index = open_index(tmp_path)
+    assert all(digest(i) in index for i in (1, 2, 3))
+    index.close()
+
+
+def test_second_open_is_refused_until_closed(tmp_path):
+    index = open_index(tmp_path)
+    with pytest.raises(IndexLockedError, match="already open"):
+        open_index(tmp_path)
+    index.close()
+    open_index(tmp_path).close()
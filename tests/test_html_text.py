@@ -0,0 +1,41 @@
+import sys
+import os
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import html_text
+from html_text import html_to_text
+
+BACKENDS = [False] + ([True] if html_text.etree is not None else [])
+
+NOTICE = """<html><head><title>Notice</title><style>td { color: red }</style></head><body>
+<div style="display: none; mso-hide: all">Preheader you never see</div>
+<p>Dear   Lender,</p><p>Please note the <b>repayment</b>&nbsp;below:</p>
+<table>
+  <tr><th>Deal</th><th>Amount</th></tr>
+  <tr><td> ABC Facility </td><td>USD 5,000,000.00</td></tr>
+</table>
+<script>var row = "<td>not text</td>";</script>
+<p hidden>Hidden paragraph<p>Kind regards,<br>Agency &amp; Services<br><br>London
+</body></html>"""
+
+@pytest.mark.parametrize("use_lxml", BACKENDS)
+def test_tables_become_tab_separated_rows(use_lxml):
+    assert html_to_text(NOTICE, use_lxml=use_lxml) == (
+        "Dear Lender,\n"
+        "Please note the repayment below:\n"
+        "Deal\tAmount\n"
+        "ABC Facility\tUSD 5,000,000.00\n"
+        "Kind regards,\n"
+        "Agency & Services\n"
+        "\n"
+        "London"
+    )
+
+@pytest.mark.parametrize("use_lxml", BACKENDS)
+def test_hidden_void_elements_do_not_swallow_text(use_lxml):
+    html = '<p>Amount <img src="pixel.gif" style="display:none"> USD 100<br hidden/> due</p>'
+    assert html_to_text(html, use_lxml=use_lxml) == "Amount USD 100\ndue"
+
+def test_empty_body():
+    assert html_to_text("") == ""
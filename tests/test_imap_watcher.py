@@ -0,0 +1,99 @@
+import sys
+import os
+import asyncio
+from datetime import datetime
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from imap_watcher import MailboxWatcher, CheckpointStore
+
+class LocalFolder:
+    """In-process stand-in for one IMAP folder"""
+    def __init__(self, count, uidvalidity=1):
+        self.uidvalidity = uidvalidity
+        self.messages = {}
+        self.seen = set()
+        self.add(count)
+
+    def add(self, count):
+        for _ in range(count):
+            uid = max(self.messages, default=0) + 1
+            self.messages[uid] = f"Subject: Notice {uid}\r\n\r\nBody {uid}\r\n".encode()
+
+class LocalIMAPClient:
+    """The IMAPClient calls imap_watcher makes, against a LocalFolder"""
+    def __init__(self, folder):
+        self.folder = folder
+
+    def select_folder(self, name, readonly=False):
+        return {b"UIDVALIDITY": self.folder.uidvalidity, b"UIDNEXT": max(self.folder.messages, default=0) + 1}
+
+    def search(self, criteria):
+        if criteria == ["UNSEEN"]:
+            return [uid for uid in self.folder.messages if uid not in self.folder.seen]
+        low = int(criteria[1].split(":")[0])
+        return [uid for uid in self.folder.messages if uid >= low] or [max(self.folder.messages)]
+
+    def fetch(self, uids, items):
+        return {uid: {b"BODY[]": self.folder.messages[uid], b"INTERNALDATE": datetime.now()} for uid in uids}
+
+    def add_flags(self, uids, flags):
+        self.folder.seen.update(uids)
+
+    def logout(self):
+        pass
+
+def make_watcher(tmp_path, folders, processed, **kwargs):
+    async def process(path, email_id):
+        await asyncio.sleep(0.002)
+        processed.append(email_id)
+        return {"email_id": email_id}
+
+    mailboxes = [{"key": key, "folder": "INBOX"} for key in folders]
+    options = dict(poll_interval=0.01, workers=1, prefetch=10, metrics_interval=60)
+    options.update(kwargs)
+    return MailboxWatcher(
+        mailboxes, process=process, client_factory=lambda m: LocalIMAPClient(folders[m["key"]]),
+        checkpoint_db=str(tmp_path / "checkpoints.db"), download_dir=str(tmp_path / "inputs"), **options
+    )
+
+async def run_until(watcher, done):
+    task = asyncio.create_task(watcher.run())
+    for _ in range(500):
+        if done():
+            break
+        await asyncio.sleep(0.01)
+    metrics = watcher.metrics()
+    watcher.stop()
+    await task
+    return metrics
+
+async def test_folders_share_workers_fairly(tmp_path):
+    folders = {"agency/INBOX": LocalFolder(30), "ops/INBOX": LocalFolder(3)}
+    processed = []
+    watcher = make_watcher(tmp_path, folders, processed)
+    metrics = await run_until(watcher, lambda: len(processed) == 33)
+
+    assert len(processed) == 33
+    # The small mailbox is not stuck behind the large one's backlog
+    assert max(processed.index(f"ops_INBOX_{uid}") for uid in (1, 2, 3)) < 8
+    assert metrics["agency/INBOX"]["checkpoint_uid"] == 30
+    assert metrics["ops/INBOX"]["behind"] == 0
+    assert CheckpointStore(str(tmp_path / "checkpoints.db")).get("ops/INBOX") == (1, 3)
+    assert folders["agency/INBOX"].seen == set(range(1, 31))
+
+async def test_restart_resumes_from_checkpoint(tmp_path):
+    folders = {"agency/INBOX": LocalFolder(12)}
+    processed = []
+    await run_until(make_watcher(tmp_path, folders, processed, workers=3), lambda: len(processed) == 12)
+
+    folders["agency/INBOX"].add(2)
+    processed.clear()
+    await run_until(make_watcher(tmp_path, folders, processed, workers=3), lambda: len(processed) == 2)
+    assert sorted(processed) == ["agency_INBOX_13", "agency_INBOX_14"]
+
+    # A renumbered folder starts again at its oldest unseen message
+    folders["agency/INBOX"].uidvalidity = 2
+    folders["agency/INBOX"].seen -= {5, 6}
+    processed.clear()
+    await run_until(make_watcher(tmp_path, folders, processed), lambda: len(processed) == 10)
+    assert processed[0] == "agency_INBOX_5"
@@ -0,0 +1,148 @@
+import sys
+import os
+import time
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from job_queue import SQLiteJobQueue, RedisJobQueue
+from worker import run_worker
+from profiler import in_thread
+
+class LocalRedis:
+    """In-process stand-in for the Redis commands RedisJobQueue uses"""
+    def __init__(self):
+        self.data = {}
+
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hincrby(self, key, field, amount):
+        h = self.data.setdefault(key, {})
+        h[field] = str(int(h.get(field, 0)) + amount)
+        return int(h[field])
+
+    def lpush(self, key, value):
+        self.data.setdefault(key, []).insert(0, value)
+
+    def rpoplpush(self, src, dst):
+        if not self.data.get(src):
+            return None
+        value = self.data[src].pop()
+        self.lpush(dst, value)
+        return value
+
+    def lrem(self, key, count, value):
+        before = len(self.data.get(key, []))
+        self.data[key] = [v for v in self.data.get(key, []) if v != value]
+        return before - len(self.data[key])
+
+    def llen(self, key):
+        return len(self.data.get(key, []))
+
+    def lrange(self, key, start, end):
+        return list(self.data.get(key, []))
+
+    def zadd(self, key, mapping, nx=False):
+        zset = self.data.setdefault(key, {})
+        zset.update({m: score for m, score in mapping.items() if not (nx and m in zset)})
+
+    def zscore(self, key, member):
+        return self.data.get(key, {}).get(member)
+
+    def zrem(self, key, member):
+        return 1 if self.data.get(key, {}).pop(member, None) is not None else 0
+
+    def zrangebyscore(self, key, low, high):
+        return [m for m, score in self.data.get(key, {}).items() if low <= score <= high]
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+@pytest.fixture(params=["sqlite", "redis"])
+def queue(request, tmp_path):
+    if request.param == "sqlite":
+        q = SQLiteJobQueue(str(tmp_path / "jobs.db"), visibility_timeout=0.2, max_attempts=2, retry_delay=0)
+    else:
+        q = RedisJobQueue(LocalRedis(), visibility_timeout=0.2, max_attempts=2, retry_delay=0)
+    yield q
+    q.close()
+
+def test_lease_ack(queue):
+    queue.enqueue("email_1", path="/inputs/email_1.eml")
+    queue.enqueue("email_2", blob=b"raw bytes", filename="email_2.eml")
+
+    first, second = queue.lease("w1"), queue.lease("w2")
+    assert {first["email_id"], second["email_id"]} == {"email_1", "email_2"}
+    assert queue.lease("w3") is None
+    blob_job = first if first["blob"] else second
+    assert blob_job["blob"] == b"raw bytes"
+
+    assert queue.ack(first) and queue.ack(second)
+    assert queue.stats()["done"] == 2
+
+def test_expired_lease_is_redelivered_then_dead_lettered(queue):
+    queue.enqueue("email_1", path="/inputs/email_1.eml")
+    job = queue.lease("crashed-worker")
+    time.sleep(0.25)
+
+    retry = queue.lease("w2")
+    assert retry["job_id"] == job["job_id"] and retry["attempts"] == 2
+    assert not queue.ack(job)  # stale lease token
+
+    assert queue.nack(retry, "LLM timeout")
+    assert queue.lease("w3") is None
+    assert [d["email_id"] for d in queue.dead_letters()] == ["email_1"]
+
+async def test_worker_drains_queue(queue):
+    for i in range(5):
+        queue.enqueue(f"email_{i}", path=f"/inputs/email_{i}.eml")
+    seen = []
+
+    async def handler(path, email_id):
+        seen.append(email_id)
+        return {"email_id": email_id}
+
+    counters = await run_worker(queue, "w1", handler, concurrency=2, poll_interval=0.01, exit_when_idle=True)
+    assert counters == {"done": 5, "failed": 0}
+    assert sorted(seen) == [f"email_{i}" for i in range(5)]
+
+def test_job_orphaned_between_pop_and_lease_is_redelivered():
+    queue = RedisJobQueue(LocalRedis(), visibility_timeout=0.2, max_attempts=2, retry_delay=0)
+    queue.enqueue("email_1", path="/inputs/email_1.eml")
+    # A worker that dies right after RPOPLPUSH, before writing its lease
+    queue.client.rpoplpush(queue._key("ready"), queue._key("processing"))
+
+    assert queue.lease("w1") is None  # the orphan gets a lease; a live worker may still be about to write its own
+    time.sleep(0.25)
+    job = queue.lease("w2")
+    assert job["email_id"] == "email_1"
+    assert queue.ack(job) and queue.stats() == {"queued": 0, "leased": 0, "done": 1, "dead": 0}
+
+async def test_lease_is_renewed_while_handler_blocks_in_a_thread(queue):
+    queue.enqueue("email_1", path="/inputs/email_1.eml")
+    seen = []
+
+    async def handler(path, email_id):
+        seen.append(email_id)
+        await in_thread(time.sleep, 0.5)  # longer than the 0.2s visibility timeout
+        assert queue.lease("w2") is None  # still leased to w1
+        return {"email_id": email_id}
+
+    counters = await run_worker(queue, "w1", handler, poll_interval=0.01, exit_when_idle=True)
+    assert counters == {"done": 1, "failed": 0}
+    assert seen == ["email_1"]
@@ -0,0 +1,37 @@
+import sys
+import os
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from json_stream import IncrementalJSONParser
+
+document = {
+    "primary_request": {
+        "request_type": "Fee \"Payment\" é",
+        "priority": "High",
+        "confidence": 95,
+        "flags": [True, None, -1.5e2]
+    },
+    "secondary_requests": [{"request_type": "Drawdown"}]
+}
+
+def test_values_surface_as_they_complete():
+    text = json.dumps(document)
+    parser = IncrementalJSONParser()
+    events, first_seen = [], {}
+    for i in range(0, len(text), 3):
+        for path, value in parser.feed(text[i:i + 3]):
+            events.append((path, value))
+            first_seen.setdefault(path, i)
+
+    assert dict(events) == {
+        ("primary_request", "request_type"): "Fee \"Payment\" é",
+        ("primary_request", "priority"): "High",
+        ("primary_request", "confidence"): 95,
+        ("primary_request", "flags", 0): True,
+        ("primary_request", "flags", 1): None,
+        ("primary_request", "flags", 2): -150.0,
+        ("secondary_requests", 0, "request_type"): "Drawdown",
+    }
+    # Routing fields are available well before the document is complete
+    assert first_seen[("primary_request", "priority")] < len(text) // 2
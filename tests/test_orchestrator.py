@@ -0,0 +1,175 @@
+import sys
+import os
+import gc
+import json
+import pytest
+from types import SimpleNamespace
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import deduplicator
+import orchestrator
+import llm_classifier
+from records import Classification, ExtractedFields
+
+# An un-awaited stage coroutine (e.g. a task cancelled before it started) fails the test
+pytestmark = [
+    pytest.mark.filterwarnings("error::RuntimeWarning"),
+    pytest.mark.filterwarnings("error::pytest.PytestUnraisableExceptionWarning"),
+]
+
+BODY = (
+    "Please be advised that the agency fee of USD 15,000.00 for the ASTRA facility "
+    "was paid on 15-Apr-2025."
+)
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """process_email against a temp output dir and dedup store, with the LLM and spaCy stages faked"""
+    monkeypatch.setattr(orchestrator, "OUTPUT_DIR", str(tmp_path / "outputs"))
+    monkeypatch.setattr(deduplicator, "DEDUP_DB", str(tmp_path / "outputs" / "dedup.db"))
+    calls = {"classify": 0, "extract": 0, "fail": False}
+
+    async def fake_classify(subject, body, attachments=None, on_primary=None, rules=None):
+        calls["classify"] += 1
+        if calls["fail"]:
+            raise RuntimeError("LLM unavailable")
+        on_primary({"request_type": "Fee Notification", "priority": "Low"})
+        return Classification(primary_request={
+            "request_type": "Fee Notification", "sub_request_type": "Agency Fee", "priority": "Low",
+            "primary_intent": "Agency fee paid", "confidence": 95, "reasoning": "-"
+        })
+
+    async def fake_extract(segments, rules=None):
+        calls["extract"] += 1
+        return ExtractedFields(amounts=[{"amount": 15000.0, "currency": "USD", "position": 48}])
+
+    monkeypatch.setattr(orchestrator, "classify_email", fake_classify)
+    monkeypatch.setattr(orchestrator, "extract_all_fields", fake_extract)
+    calls["dir"] = tmp_path
+    yield calls
+    gc.collect()  # surface never-awaited coroutines while this test's warning filters apply
+    deduplicator.close_connections()
+
+def write_eml(directory, name, subject, body=BODY, to="ops@client.com"):
+    path = directory / name
+    path.write_text(
+        f"Subject: {subject}\nFrom: agent@bank.com\nTo: {to}\n"
+        f"Date: Wed, 16 Apr 2025 09:00:00 +0000\n\n{body}\n"
+    )
+    return str(path)
+
+async def test_unique_email_is_classified_extracted_and_stored(pipeline):
+    path = write_eml(pipeline["dir"], "a.eml", "Fee paid")
+    output = await orchestrator.process_email(path, "email_a")
+
+    assert "error" not in output
+    assert output["duplication"]["is_duplicate"] is False
+    assert output["routing"]["request_type"] == "Fee Notification"
+    assert output["routing"]["provisional"]["changed"] is False
+    assert output["extracted_fields"]["amounts"][0]["amount"] == 15000.0
+    assert pipeline["classify"] == pipeline["extract"] == 1
+    assert os.path.exists(os.path.join(orchestrator.OUTPUT_DIR, "email_a_output.json"))
+    assert await deduplicator.load_result("email_a") == output
+
+async def test_duplicate_body_reuses_stored_output(pipeline):
+    original = await orchestrator.process_email(write_eml(pipeline["dir"], "a.eml", "Fee paid"), "email_a")
+    # A different file (forwarded with a signature) whose cleaned body is the same
+    path = write_eml(pipeline["dir"], "b.eml", "FW: Fee paid", BODY + "\n\nBest regards,\nJane Doe")
+    output = await orchestrator.process_email(path, "email_b")
+
+    assert output["duplication"]["is_duplicate"] is True
+    assert output["duplication"]["matched_with"] == "email_a"
+    assert output["subject"] == "FW: Fee paid"
+    assert output["classification"] == original["classification"]
+    assert pipeline["classify"] == pipeline["extract"] == 1
+
+async def test_duplicate_without_stored_output_is_recomputed(pipeline):
+    await orchestrator.process_email(write_eml(pipeline["dir"], "a.eml", "Fee paid"), "email_a")
+    conn = deduplicator.connect()
+    conn.execute("UPDATE dedup SET output = NULL")
+    conn.commit()
+    conn.close()
+
+    path = write_eml(pipeline["dir"], "b.eml", "FW: Fee paid", BODY + "\n\nBest regards,\nJane Doe")
+    output = await orchestrator.process_email(path, "email_b")
+
+    assert output["duplication"]["is_duplicate"] is True
+    assert output["duplication"]["matched_with"] == "email_a"
+    assert output["routing"]["request_type"] == "Fee Notification"
+    assert pipeline["classify"] == pipeline["extract"] == 2
+
+async def test_classification_failure_returns_error_without_output(pipeline):
+    pipeline["fail"] = True
+    output = await orchestrator.process_email(write_eml(pipeline["dir"], "a.eml", "Fee paid"), "email_a")
+
+    assert output == {"email_id": "email_a", "error": "LLM unavailable"}
+    assert not os.path.exists(os.path.join(orchestrator.OUTPUT_DIR, "email_a_output.json"))
+    assert await deduplicator.load_result("email_a") is None
+
+async def test_copy_under_different_headers_skips_parse_and_classify(pipeline, monkeypatch):
+    await orchestrator.process_email(write_eml(pipeline["dir"], "a.eml", "Fee paid"), "email_a")
+    parsed = []
+    monkeypatch.setattr(orchestrator, "parse_email_file", lambda path: parsed.append(path))
+
+    path = write_eml(pipeline["dir"], "b.eml", "[lenders-list] Fee paid", to="lenders@client.com")
+    output = await orchestrator.process_email(path, "email_b")
+
+    assert output["duplication"]["duplicate_type"] == "exact"
+    assert output["duplication"]["matched_with"] == "email_a"
+    assert output["subject"] == "[lenders-list] Fee paid" and output["to"] == "lenders@client.com"
+    assert parsed == [] and pipeline["classify"] == pipeline["extract"] == 1
+
+async def test_stored_output_from_other_rules_version_is_recomputed(pipeline):
+    original = await orchestrator.process_email(write_eml(pipeline["dir"], "a.eml", "Fee paid"), "email_a")
+    await deduplicator.store_result("email_a", {**original, "rules_version": "old"})
+
+    path = write_eml(pipeline["dir"], "b.eml", "[lenders-list] Fee paid", to="lenders@client.com")
+    output = await orchestrator.process_email(path, "email_b")
+
+    assert output["rules_version"] == original["rules_version"]
+    assert pipeline["classify"] == 2
+    # The original's stored result is refreshed so later copies can reuse it
+    assert (await deduplicator.load_result("email_a"))["rules_version"] == original["rules_version"]
+
+async def test_rerun_of_the_same_email_is_recomputed(pipeline):
+    path = write_eml(pipeline["dir"], "a.eml", "Fee paid")
+    await orchestrator.process_email(path, "email_a")
+    # A retried or redelivered job must not match its own stored output
+    output = await orchestrator.process_email(path, "email_a")
+
+    assert output["duplication"]["is_duplicate"] is False
+    assert pipeline["classify"] == 2
+
+class FakeCompletions:
+    """chat.completions returning one fixed classification, whole or in small streamed chunks"""
+    CONTENT = json.dumps({"primary_request": {
+        "request_type": "Fee Notification", "sub_request_type": "Agency Fee", "priority": "Low",
+        "primary_intent": "Agency fee paid", "confidence": 95, "reasoning": "-"
+    }})
+
+    async def create(self, stream=False, **request):
+        if not stream:
+            message = SimpleNamespace(content=self.CONTENT)
+            usage = SimpleNamespace(prompt_tokens=100, completion_tokens=50)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+        return self._chunks()
+
+    async def _chunks(self):
+        for i in range(0, len(self.CONTENT), 8):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=self.CONTENT[i:i + 8]))])
+
+@pytest.mark.parametrize("streaming", [False, True])
+async def test_provisional_route_only_recorded_when_streamed(pipeline, monkeypatch, streaming):
+    monkeypatch.setattr(orchestrator, "classify_email", llm_classifier.classify_email)
+    monkeypatch.setattr(llm_classifier, "client", SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions())))
+    monkeypatch.setattr(llm_classifier, "ENABLE_STREAMING_CLASSIFICATION", streaming)
+    monkeypatch.setattr(llm_classifier, "OPENAI_FAST_MODEL", "")
+
+    output = await orchestrator.process_email(write_eml(pipeline["dir"], "a.eml", "Fee paid"), "email_a")
+
+    assert output["routing"]["request_type"] == "Fee Notification"
+    if streaming:
+        assert output["routing"]["provisional"]["request_type"] == "Fee Notification"
+        assert output["routing"]["provisional"]["changed"] is False
+    else:
+        assert "provisional" not in output["routing"]
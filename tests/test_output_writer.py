@@ -0,0 +1,41 @@
+import sys
+import os
+import json
+import asyncio
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import output_writer
+from output_writer import dumps, write_atomic, write_output
+
+def test_dumps_is_compact_utf8_json():
+    data = dumps({"subject": "Facility Upsize – ASTRA", "amounts": [1.5, 2]})
+    assert isinstance(data, bytes)
+    assert b"\n" not in data and b": " not in data
+    assert json.loads(data) == {"subject": "Facility Upsize – ASTRA", "amounts": [1.5, 2]}
+    assert b"\n  " in dumps({"a": 1}, indent=2)
+
+def test_indent_other_than_two_is_honoured():
+    record = {"subject": "Facility Upsize – ASTRA", "amounts": [1.5, 2]}
+    assert dumps(record, indent=4) == json.dumps(record, indent=4, ensure_ascii=False).encode("utf-8")
+
+def test_write_output_replaces_file(tmp_path):
+    path = asyncio.run(write_output(str(tmp_path), "email_1", dumps({"version": 1})))
+    asyncio.run(write_output(str(tmp_path), "email_1", dumps({"version": 2})))
+    with open(path) as f:
+        assert json.load(f) == {"version": 2}
+    assert os.listdir(tmp_path) == ["email_1_output.json"]
+
+def test_failed_write_keeps_previous_output(tmp_path, monkeypatch):
+    path = str(tmp_path / "email_1_output.json")
+    write_atomic(path, b'{"version": 1}')
+
+    def crash(fd):
+        raise OSError("disk full")
+    monkeypatch.setattr(output_writer.os, "fsync", crash)
+
+    with pytest.raises(OSError):
+        write_atomic(path, b'{"version": 2, "trunc', fsync=True)
+    with open(path) as f:
+        assert json.load(f) == {"version": 1}
+    assert os.listdir(tmp_path) == ["email_1_output.json"]
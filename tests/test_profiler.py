@@ -0,0 +1,72 @@
+import sys
+import os
+import json
+import time
+import asyncio
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from profiler import ProfileSession, stage, timed, in_thread, note_attachment
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+async def process(path, email_id):
+    with stage("parse"):
+        busy(0.2 if email_id == "slow" else 0.01)
+    await timed("classify", asyncio.sleep(0.01))
+    return {"email_id": email_id}
+
+async def test_session_reports_stages_stacks_and_slow_emails(tmp_path):
+    paths = {}
+    for email_id in ("fast", "slow"):
+        paths[email_id] = tmp_path / f"{email_id}.eml"
+        paths[email_id].write_bytes(f"Subject: {email_id}\n\nBody\n".encode())
+
+    session = ProfileSession(profile_dir=str(tmp_path / "profiles"), slow_seconds=0.15, interval=0.001)
+    session.start()
+    for email_id, path in paths.items():
+        await session.run(process, str(path), email_id)
+    batch_dir = session.stop()
+
+    with open(os.path.join(batch_dir, "emails.jsonl")) as f:
+        records = {r["email_id"]: r for r in map(json.loads, f)}
+    assert set(records["fast"]["stages"]) == {"parse", "classify"}
+    assert records["slow"]["stages"]["parse"] >= 0.2 > records["fast"]["seconds"]
+
+    with open(os.path.join(batch_dir, "slow_emails.json")) as f:
+        report = json.load(f)
+    [slow] = report["emails"]
+    assert slow["email_id"] == "slow" and slow["path"] == str(paths["slow"])
+    with open(os.path.join(batch_dir, slow["input"]), "rb") as f:
+        assert f.read() == paths["slow"].read_bytes()
+    with open(os.path.join(batch_dir, slow["stacks"])) as f:
+        stacks = f.read()
+    # Samples are rooted at the email whose coroutine was running
+    assert stacks.startswith("email:slow;process (") and ";busy (" in stacks
+
+async def test_stage_without_session_is_a_no_op():
+    with stage("parse"):
+        pass
+    assert await timed("classify", asyncio.sleep(0, result=1)) == 1
+
+async def test_in_thread_keeps_stage_attachments_and_stack_root(tmp_path):
+    def parse(path):
+        busy(0.1)
+        note_attachment("schedule.pdf", "pdf", 0.1, 2048)
+
+    async def process(path, email_id):
+        await timed("parse", in_thread(parse, path))
+
+    session = ProfileSession(profile_dir=str(tmp_path / "profiles"), slow_seconds=0.05, interval=0.001)
+    session.start()
+    await session.run(process, str(tmp_path / "missing.eml"), "threaded")
+    batch_dir = session.stop()
+
+    with open(os.path.join(batch_dir, "emails.jsonl")) as f:
+        [record] = map(json.loads, f)
+    assert record["stages"]["parse"] >= 0.1
+    assert [a["filename"] for a in record["attachments"]] == ["schedule.pdf"]
+    with open(os.path.join(batch_dir, "stacks.folded")) as f:
+        assert any(line.startswith("email:threaded;_rooted (") and ";busy (" in line for line in f)
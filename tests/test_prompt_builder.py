@@ -0,0 +1,47 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from prompt_builder import build_email_context, split_newest_message
+from cleaner import estimate_tokens, clean_text
+from records import Attachment
+
+reply_email = """Please process the principal repayment of USD 5,000,000.00 effective 2024-03-01.
+
+On Fri, 1 Mar 2024 at 10:00, Agent Bank <agent@bank.com> wrote:
+> Old thread about an unrelated fee schedule.
+> This message is confidential.
+"""
+
+def test_quoted_history_is_stripped():
+    newest, history = split_newest_message(reply_email)
+    assert "principal repayment" in newest
+    assert "unrelated fee" not in newest
+    assert history.startswith("On Fri")
+
+def test_context_respects_budget_and_keeps_relevant_sentences():
+    filler = " ".join(f"Sentence {i} has nothing useful in it." for i in range(400))
+    body = filler + " The drawdown amount is USD 1,000,000.00 due 2024-05-01."
+    attachments = [Attachment("notice.pdf", filler + " Repayment USD 2,000.00.")]
+
+    context, stats = build_email_context(body, attachments, budget=200, snippet_tokens=60)
+    assert estimate_tokens(context) <= 200
+    assert "drawdown amount" in context
+    assert "[Attachment: notice.pdf]" in context
+    assert stats["tokens_saved"] == stats["original_tokens"] - stats["context_tokens"]
+    assert stats["compacted"] is True
+
+def test_cleaned_body_keeps_message_before_trailing_disclaimer():
+    raw = (
+        "Dear Agent,\n\nPlease process the principal repayment of USD 2,000,000.00 on 2025-03-27.\n\n"
+        "This notice is confidential and intended solely for the addressee. If you have received "
+        "this in error, please delete it.\n"
+    )
+    context, stats = build_email_context(clean_text(raw), [])
+    assert "principal repayment" in context
+    assert "confidential" not in context
+    assert stats["context_tokens"] > 0
+
+    # A single line mentioning confidentiality is the message itself
+    body = "Please treat the confidential fee letter as signed and pay USD 15,000.00."
+    assert build_email_context(clean_text(body), [])[0] == clean_text(body)
@@ -0,0 +1,33 @@
+import sys
+import os
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from router import build_router, canonicalize, token_key
+
+@pytest.mark.parametrize("label, team", [
+    ("Loan Repayment", "Disbursement Team"),
+    ("Loan repayment", "Disbursement Team"),
+    ("Repayment - Principal", "Disbursement Team"),
+    ("Fee Payment", "Loan Servicing Team"),
+    ("commitment-change", "Loan Servicing Team"),
+    ("Draw down", "Allocations Team"),
+    ("Money Movement (Inbound)", "Cash Ops Team"),
+    ("Something unrelated", "General Servicing Team"),
+    ("", "General Servicing Team"),
+])
+def test_route_label_variants(label, team):
+    assert build_router().route(label)["assigned_team"] == team
+
+def test_canonical_forms():
+    assert canonicalize("Money-Movement (Outbound)") == "money movement outbound"
+    assert token_key("Repayment - Principal") == token_key("principal repayment")
+
+def test_route_batch_memoizes():
+    router = build_router()
+    classifications = [{"primary_request": {"request_type": "Loan repayment"}}] * 50 + ["Fee Payment"]
+    decisions = router.route_batch(classifications)
+    assert len(decisions) == 51
+    assert decisions[0]["request_type"] == "Money Movement - Outbound"
+    assert decisions[-1]["request_type"] == "Fee Notification"
+    assert router.cache_info().misses == 2
@@ -0,0 +1,72 @@
+import sys
+import os
+import json
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from rules_registry import CompiledRules, RulesRegistry, default_rules
+from config import SUBJECT_RULES
+
+def legacy_match(text):
+    """The rule loop CompiledRules.match_subject_rule replaces"""
+    for name, rule in SUBJECT_RULES.items():
+        if any(kw.lower() in text for kw in rule.get("keywords", [])):
+            return name
+    return None
+
+def write_rules(path, rules):
+    path.write_text(json.dumps(rules))
+    # Make the change visible even within the file system's timestamp granularity
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10**9,) * 2)
+
+def test_keyword_matcher_agrees_with_rule_order():
+    rules = CompiledRules({})
+    texts = [
+        "principal payment due on friday",
+        "facility upsize confirmation",
+        "urgent drawdown request",
+        "repayment of fee",
+        "feedback on our meeting",
+        "nothing relevant here"
+    ]
+    for text in texts:
+        matched = rules.match_subject_rule(text)
+        assert (matched[0] if matched else None) == legacy_match(text), text
+
+def test_version_tracks_content():
+    assert CompiledRules({}).version == CompiledRules(default_rules()).version
+    changed = CompiledRules({"team_map": {**default_rules()["team_map"], "Drawdown": "Cash Ops Team"}})
+    assert changed.version != CompiledRules({}).version
+
+def test_reload_swaps_snapshot_on_change(tmp_path):
+    path = tmp_path / "rules.json"
+    registry = RulesRegistry(str(path), check_interval=0)
+    before = registry.current()
+    assert before.router.route("Drawdown")["assigned_team"] == "Allocations Team"
+
+    write_rules(path, {"team_map": {**default_rules()["team_map"], "Drawdown": "Cash Ops Team"}})
+    after = registry.current()
+
+    assert after.version != before.version
+    assert after.router.route("Drawdown")["assigned_team"] == "Cash Ops Team"
+    # Emails already holding the old snapshot are unaffected
+    assert before.router.route("Drawdown")["assigned_team"] == "Allocations Team"
+
+def test_invalid_file_keeps_previous_snapshot(tmp_path):
+    path = tmp_path / "rules.json"
+    write_rules(path, {"field_patterns": {"deal_cusip": r"Deal CUSIP\s*[:=]\s*([\w\d]+)"}})
+    registry = RulesRegistry(str(path), check_interval=0)
+    good = registry.current()
+
+    write_rules(path, {"field_patterns": {"deal_cusip": r"Deal CUSIP ([unclosed"}})
+    assert registry.current() is good
+
+    write_rules(path, {"unknown_key": {}})
+    assert registry.current() is good
+
+def test_yaml_rules_file(tmp_path):
+    yaml = pytest.importorskip("yaml")
+    path = tmp_path / "rules.yaml"
+    path.write_text(yaml.safe_dump({"request_type_mappings": {"Wire Out": "Money Movement - Outbound"}}))
+    rules = RulesRegistry(str(path), check_interval=None).current()
+    assert rules.router.route("Wire Out")["assigned_team"] == "Disbursement Team"
@@ -4,13 +4,19 @@ import requests
 from config import WEBHOOK_URL
 from Logger import logger
 
-def send_to_webhook(payload: dict, email_id: str):
+def send_to_webhook(payload, email_id: str):
+    """POST an output; payload is a dict or the output already serialized to JSON bytes"""
     if not WEBHOOK_URL:
         logger.warning("No WEBHOOK_URL defined. Skipping webhook call.")
         return
 
     try:
-        response = requests.post(WEBHOOK_URL, json=payload, timeout=10)
+        if isinstance(payload, bytes):
+            response = requests.post(
+                WEBHOOK_URL, data=payload, headers={"Content-Type": "application/json"}, timeout=10
+            )
+        else:
+            response = requests.post(WEBHOOK_URL, json=payload, timeout=10)
         if response.status_code in [200, 201, 202]:
             logger.info(f"Webhook POST successful for {email_id} (status {response.status_code})")
         else:
@@ -0,0 +1,124 @@
+# worker.py
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from job_queue import open_queue
+from config import JOB_QUEUE_URL, DEDUP_INDEX_DIR
+from Logger import logger
+
+async def _default_handler(file_path, email_id):
+    # Imported lazily so coordinators don't load spaCy and the OpenAI client
+    from orchestrator import process_email
+    return await process_email(file_path, email_id)
+
+async def _run_job(job, handler):
+    """Run the handler on a job's file, materializing inline blobs to a temp file"""
+    if job["blob"] is None:
+        return await handler(job["path"], job["email_id"])
+
+    suffix = os.path.splitext(job["filename"] or "")[1] or ".eml"
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(job["blob"])
+    try:
+        return await handler(tmp.name, job["email_id"])
+    finally:
+        os.remove(tmp.name)
+
+async def _keep_leased(queue, job, interval):
+    while True:
+        await asyncio.sleep(interval)
+        if not queue.extend(job):
+            logger.warning(f"Lost lease on job {job['job_id']} ({job['email_id']})")
+            return
+
+async def _slot(queue, worker_id, handler, poll_interval, exit_when_idle, counters):
+    while True:
+        job = queue.lease(worker_id)
+        if job is None:
+            stats = queue.stats()
+            if exit_when_idle and stats["queued"] == 0 and stats["leased"] == 0:
+                return
+            await asyncio.sleep(poll_interval)
+            continue
+
+        heartbeat = asyncio.create_task(_keep_leased(queue, job, queue.visibility_timeout / 3))
+        try:
+            result = await _run_job(job, handler)
+            error = result.get("error") if isinstance(result, dict) else None
+        except Exception as e:
+            error = str(e)
+        finally:
+            heartbeat.cancel()
+
+        if error:
+            logger.error(f"[{worker_id}] Job {job['email_id']} failed (attempt {job['attempts']}): {error}")
+            queue.nack(job, error)
+            counters["failed"] += 1
+        else:
+            queue.ack(job)
+            counters["done"] += 1
+
+async def run_worker(queue, worker_id, handler=None, concurrency=1, poll_interval=1.0, exit_when_idle=False):
+    """
+    Lease jobs and run process_email on them until stopped (or, with
+    exit_when_idle, until the queue is drained). `concurrency` jobs run at
+    once on this event loop, which overlaps their LLM calls.
+    """
+    handler = handler or _default_handler
+    counters = {"done": 0, "failed": 0}
+    await asyncio.gather(*[
+        _slot(queue, worker_id, handler, poll_interval, exit_when_idle, counters)
+        for _ in range(concurrency)
+    ])
+    return counters
+
+def _worker_process(queue_url, worker_id, handler, concurrency, poll_interval, exit_when_idle):
+    if handler is None:
+        # Fail at startup, not per job, if another process holds the dedup hash index
+        from deduplicator import get_hash_index
+        get_hash_index()
+    queue = open_queue(queue_url)
+    try:
+        counters = asyncio.run(run_worker(
+            queue, worker_id, handler, concurrency, poll_interval, exit_when_idle
+        ))
+        logger.info(f"[{worker_id}] finished: {counters}")
+    finally:
+        queue.close()
+
+def run_worker_processes(queue_url, processes, handler=None, concurrency=1,
+                         poll_interval=1.0, exit_when_idle=False):
+    """Start `processes` worker processes on this node and wait for them"""
+    if DEDUP_INDEX_DIR and processes > 1 and handler is None:
+        raise ValueError(
+            "DEDUP_INDEX_DIR is a single-process index; unset it to run more than one worker process"
+        )
+    prefix = f"{os.uname().nodename}-{os.getpid()}"
+    workers = [
+        multiprocessing.Process(
+            target=_worker_process,
+            args=(queue_url, f"{prefix}-{i}", handler, concurrency, poll_interval, exit_when_idle)
+        )
+        for i in range(processes)
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process queued email jobs")
+    parser.add_argument("--queue", default=JOB_QUEUE_URL, help="sqlite:///path or redis://host:port/db")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent jobs per process")
+    parser.add_argument("--exit-when-idle", action="store_true")
+    args = parser.parse_args()
+
+    start = time.time()
+    run_worker_processes(args.queue, args.processes, concurrency=args.concurrency,
+                         exit_when_idle=args.exit_when_idle)
+    logger.info(f"Workers stopped after {time.time() - start:.1f}s")